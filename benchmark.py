@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+
+"""
+file: benchmark.py
+
+Benchmark suite for the Python stages of the pipeline, run over every raw chordsheet in the input directory and (where
+the stage depends on the key) every target key. Each stage reports its throughput and peak memory. Results can be saved
+as a JSON baseline, and later runs compared against it, failing if any stage has regressed beyond a threshold.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+DEFAULT_CORPUS_DIRECTORY = "chordsheets_raw"
+DEFAULT_REPEAT = 20
+DEFAULT_RASTERIZE_REPEAT = 3  # rasterizing a slide deck takes seconds, so it is timed fewer times
+DEFAULT_BASELINE_FILE = "benchmark_baseline.json"
+DEFAULT_THRESHOLD = 0.25  # fraction by which a stage may be slower (or use more memory) than its baseline
+STAGES = ["parse", "transpose", "lyric", "slides"]
+STARTUP_MODULE = "generate_music"
+DEFAULT_STARTUP_BUDGET_MS = 100.0  # cumulative import time allowed for STARTUP_MODULE
+LAZY_MODULES = ["requests", "urllib3", "getpass", "gnupg", "multiprocessing", "cProfile"]  # must not load at startup
+
+
+def get_corpus(directory: str=DEFAULT_CORPUS_DIRECTORY) -> List[str]:
+    """
+    :param directory: str representing path to directory of raw chordsheets
+    :return: List[str] representing sorted paths to every raw chordsheet in directory
+    """
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory) if f.endswith(".txt"))
+
+
+def load_songs(files: List[str]) -> list:
+    """
+    :param files: List[str] representing paths to raw chordsheets
+    :return: List[Song] representing parsed songs
+    """
+    from chordsheet_parser import parse
+    return [parse(f)[1] for f in files]
+
+
+def get_lines(song) -> list:
+    """
+    :param song: Song representing parsed song
+    :return: List[Line] representing every line of every section of song
+    """
+    return [line for section in song.get_sections().values() for line in section.lines]
+
+
+def get_chords(song) -> list:
+    """
+    :param song: Song representing parsed song
+    :return: List[Chord] representing every chord of every line of song, in order
+    """
+    from classes import Lyric, MusicLine
+    chords = []
+    for line in get_lines(song):
+        if isinstance(line, Lyric):
+            chords.extend(line.chords)
+        elif isinstance(line, MusicLine):
+            for measure in line.measures:
+                chords.extend(measure)
+    return chords
+
+
+def time_best(function: Callable[[], None], repeat: int=DEFAULT_REPEAT) -> float:
+    """
+    Time a function several times, keeping the fastest run to reduce noise.
+    :param function: function taking no arguments to time
+    :param repeat: int representing number of runs
+    :return: float representing fastest run time in seconds
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(function: Callable[[], None]) -> int:
+    """
+    Run a function once while tracing memory allocations. Tracing slows the function down, so this is done separately
+    from timing.
+    :param function: function taking no arguments to measure
+    :return: int representing peak memory allocated while the function ran, in bytes
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def get_stages(files: List[str], keys: List[str]) -> Dict[str, Tuple[Callable[[], None], int, int]]:
+    """
+    Build the function run by each stage of the suite. Stages which depend on the key run once per target key, and
+    start with an empty transposition cache, so that every run does the same work.
+    :param files: List[str] representing paths to raw chordsheets
+    :param keys: List[str] representing target keys
+    :return: dict mapping stage names to (function running stage over the corpus once, number of songs processed,
+    number of lines processed)
+    """
+    from classes import Lyric, Notes
+    from chordsheet_parser import parse
+
+    songs = load_songs(files)
+    lines = [get_lines(song) for song in songs]
+    lyrics = [[line for line in song_lines if isinstance(line, Lyric)] for song_lines in lines]
+    chords = [get_chords(song) for song in songs]
+    raw_lines = 0
+    for f in files:
+        with open(f, "r") as raw:
+            raw_lines += sum(1 for _ in raw)
+
+    def run_parse():
+        for f in files:
+            parse(f)
+
+    def run_transpose():
+        Notes.transpose_chord.cache_clear()
+        for song, song_chords in zip(songs, chords):
+            for key in keys:
+                notes = Notes(song.get_key(), key)
+                for chord in song_chords:
+                    notes.transpose(chord)
+
+    def run_lyric():
+        Notes.transpose_chord.cache_clear()
+        for song, song_lyrics in zip(songs, lyrics):
+            for key in keys:
+                notes = Notes(song.get_key(), key)
+                for line in song_lyrics:
+                    line.generate_chordsheet(notes)
+
+    def run_slides():
+        for song in songs:
+            song.generate_slides()
+
+    return {
+        "parse": (run_parse, len(files), raw_lines),
+        "transpose": (run_transpose, len(songs) * len(keys),
+                      sum(len(song_lines) for song_lines in lines) * len(keys)),
+        "lyric": (run_lyric, len(songs) * len(keys), sum(len(song_lyrics) for song_lyrics in lyrics) * len(keys)),
+        "slides": (run_slides, len(songs), sum(len(song_lyrics) for song_lyrics in lyrics)),
+    }
+
+
+def run_suite(files: List[str], keys: List[str], repeat: int=DEFAULT_REPEAT,
+              stages: List[str]=STAGES) -> Dict[str, dict]:
+    """
+    :param files: List[str] representing paths to raw chordsheets
+    :param keys: List[str] representing target keys
+    :param repeat: int representing number of timed runs per stage
+    :param stages: List[str] representing names of stages to run
+    :return: dict mapping stage names to results of the form {"seconds": float, "songs_per_second": float,
+    "lines_per_second": float, "peak_memory_kib": float}
+    """
+    results = {}
+    for stage, (function, songs, lines) in get_stages(files, keys).items():
+        if stage not in stages:
+            continue
+        seconds = time_best(function, repeat)
+        results[stage] = {
+            "seconds": seconds,
+            "songs_per_second": songs / seconds,
+            "lines_per_second": lines / seconds,
+            "peak_memory_kib": peak_memory(function) / 1024,
+        }
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float=DEFAULT_THRESHOLD) -> List[str]:
+    """
+    :param results: dict representing results of current run, as returned by run_suite
+    :param baseline: dict representing results of baseline run
+    :param threshold: float representing fraction by which a stage may be slower, or use more memory, than its
+    baseline
+    :return: List[str] representing description of each regression found
+    """
+    regressions = []
+    for stage, result in results.items():
+        if stage not in baseline:
+            continue
+        for measure, unit in [("seconds", "s"), ("peak_memory_kib", "KiB")]:
+            if result[measure] > baseline[stage][measure] * (1 + threshold):
+                regressions.append("{}: {} {:.4g} {} vs baseline {:.4g} {} (+{:.0%})".format(
+                    stage, measure, result[measure], unit, baseline[stage][measure], unit,
+                    result[measure] / baseline[stage][measure] - 1))
+    return regressions
+
+
+def measure_startup(module: str=STARTUP_MODULE) -> Tuple[float, Dict[str, float]]:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+    :param module: str representing name of module to import
+    :return: Tuple[float, dict] representing cumulative time in milliseconds to import module, and a mapping of every
+    module imported along the way to its cumulative import time in milliseconds
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import " + module],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    modules = {}
+    for line in result.stderr.splitlines():
+        # lines are of the form "import time: <self us> | <cumulative us> | <indented module name>"
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit():
+            modules[fields[2].strip()] = int(fields[1]) / 1000
+    return modules[module], modules
+
+
+def check_startup(budget_ms: float=DEFAULT_STARTUP_BUDGET_MS, module: str=STARTUP_MODULE) -> List[str]:
+    """
+    :param budget_ms: float representing cumulative import time allowed for module, in milliseconds
+    :param module: str representing name of module to import
+    :return: List[str] representing description of each way in which startup exceeds its budget: taking too long, or
+    importing a module which should only be imported when used
+    """
+    total, modules = measure_startup(module)
+    problems = ["{} imports {} at startup ({:.1f} ms)".format(module, lazy, modules[lazy])
+                for lazy in LAZY_MODULES if lazy in modules]
+    if total > budget_ms:
+        problems.append("importing {} takes {:.1f} ms (budget {:.0f} ms)".format(module, total, budget_ms))
+    return problems
+
+
+def get_saved_pages(directory: str) -> List[str]:
+    """
+    :param directory: str representing path to directory of saved CCLI SongSelect pages
+    :return: List[str] representing contents of every saved page (.html) in directory, in order of filename
+    """
+    pages = []
+    for f in sorted(os.listdir(directory)):
+        if f.endswith(".html"):
+            with open(os.path.join(directory, f), "r", newline="") as page:  # pages use \r\n line endings
+                pages.append(page.read())
+    return pages
+
+
+def benchmark_ccli_extraction(pages: List[str], repeat: int=DEFAULT_REPEAT) -> float:
+    """
+    :param pages: List[str] representing html of saved CCLI SongSelect pages
+    :param repeat: int representing number of runs
+    :return: float representing fastest time in seconds to extract composer, year and publisher from every page once
+    """
+    from ccli import parse_song_page
+
+    def run():
+        for page in pages:
+            parse_song_page(page)
+
+    return time_best(run, repeat)
+
+
+def benchmark_rasterize(pdf: str, repeat: int=DEFAULT_RASTERIZE_REPEAT, workers: int=None) -> Dict[str, float]:
+    """
+    Time rasterizing a slides PDF with each renderer installed: convert (the old path), and pdftoppm in a single
+    process and across several processes.
+    :param pdf: str representing path to slides PDF
+    :param repeat: int representing number of runs per renderer
+    :param workers: int representing number of pdftoppm processes (defaults to the number of CPUs)
+    :return: dict mapping description of each path to its fastest time in seconds
+    """
+    import shutil
+    import tempfile
+    from rasterize import rasterize
+
+    workers = workers or os.cpu_count() or 1
+    paths = {}
+    if shutil.which("convert"):
+        paths["convert"] = ("convert", 1)
+    if shutil.which("pdftoppm") and shutil.which("pdfinfo"):
+        paths["pdftoppm x1"] = ("pdftoppm", 1)
+        if workers > 1:
+            paths["pdftoppm x{}".format(workers)] = ("pdftoppm", workers)
+
+    results = {}
+    for description, (renderer, renderer_workers) in paths.items():
+        def run():
+            with tempfile.TemporaryDirectory() as directory:
+                rasterize(pdf, os.path.join(directory, "slide.png"), workers=renderer_workers, renderer=renderer)
+
+        results[description] = time_best(run, repeat)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", dest="corpus", default=DEFAULT_CORPUS_DIRECTORY,
+                        help="directory of raw chordsheets to benchmark on")
+    parser.add_argument("--repeat", dest="repeat", type=int, default=DEFAULT_REPEAT, help="number of runs per stage")
+    parser.add_argument("--keys", dest="keys", default="all",
+                        help="comma-separated list of target keys, or 'all' for every key (default)")
+    parser.add_argument("--stage", dest="stages", action="append", choices=STAGES, default=None,
+                        help="stage to run (may be repeated; defaults to every stage)")
+    parser.add_argument("--baseline", dest="baseline", default=None,
+                        help="JSON file of baseline results to compare against; exits with status 1 on a regression")
+    parser.add_argument("--save-baseline", dest="save_baseline", nargs="?", const=DEFAULT_BASELINE_FILE, default=None,
+                        help="save results as a JSON baseline (to {} by default)".format(DEFAULT_BASELINE_FILE))
+    parser.add_argument("--threshold", dest="threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="fraction by which a stage may regress before failing (default {:g})".format(
+                            DEFAULT_THRESHOLD))
+    parser.add_argument("--json", dest="json", action="store_true", help="print results as JSON")
+    parser.add_argument("--ccli-pages", dest="ccli_pages", default=None,
+                        help="directory of saved CCLI SongSelect pages (.html) to benchmark extraction on")
+    parser.add_argument("--slides", dest="slides", default=None,
+                        help="slides PDF to benchmark rasterization on, with each renderer installed")
+    parser.add_argument("--startup-budget", dest="startup_budget", type=float, nargs="?",
+                        const=DEFAULT_STARTUP_BUDGET_MS, default=None,
+                        help="only check that importing {} takes at most this many milliseconds (default {:g}) and "
+                             "does not import {}; exits with status 1 otherwise".format(
+                            STARTUP_MODULE, DEFAULT_STARTUP_BUDGET_MS, ", ".join(LAZY_MODULES)))
+    args = parser.parse_args()
+
+    if args.startup_budget is not None:
+        startup_ms, _ = measure_startup()
+        print("startup: importing {} takes {:.1f} ms".format(STARTUP_MODULE, startup_ms))
+        startup_problems = check_startup(args.startup_budget)
+        for problem in startup_problems:
+            print("[REGRESSION]", problem, file=sys.stderr)
+        sys.exit(1 if len(startup_problems) > 0 else 0)
+
+    from generate_music import parse_keys
+
+    corpus = get_corpus(args.corpus)
+    target_keys = parse_keys(args.keys)
+    suite_results = run_suite(corpus, target_keys, args.repeat, args.stages or STAGES)
+
+    if args.json:
+        print(json.dumps(suite_results, indent=2, sort_keys=True))
+    else:
+        print("{} songs, {} keys".format(len(corpus), len(target_keys)))
+        for name, stage_result in suite_results.items():
+            print("{:<10} {:9.2f} ms {:10.0f} songs/s {:12.0f} lines/s {:10.0f} KiB peak".format(
+                name + ":", stage_result["seconds"] * 1000, stage_result["songs_per_second"],
+                stage_result["lines_per_second"], stage_result["peak_memory_kib"]))
+
+    if args.ccli_pages is not None:
+        pages = get_saved_pages(args.ccli_pages)
+        elapsed = benchmark_ccli_extraction(pages, args.repeat)
+        print("ccli extraction: {} pages ({:.0f} KiB) in {:.2f} ms ({:.1f} MiB/s)".format(
+            len(pages), sum(len(p) for p in pages) / 1024, elapsed * 1000,
+            sum(len(p) for p in pages) / (1024 * 1024) / elapsed))
+
+    if args.slides is not None:
+        rasterize_results = benchmark_rasterize(args.slides, min(args.repeat, DEFAULT_RASTERIZE_REPEAT))
+        if len(rasterize_results) == 0:
+            print("rasterize: neither convert nor pdftoppm found", file=sys.stderr)
+        for description, elapsed in rasterize_results.items():
+            print("rasterize ({}): {:.2f} s".format(description, elapsed))
+
+    if args.save_baseline is not None:
+        with open(args.save_baseline, "w") as f:
+            json.dump(suite_results, f, indent=2, sort_keys=True)
+        print("Saved baseline to " + args.save_baseline)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as f:
+            found = compare(suite_results, json.load(f), args.threshold)
+        for regression in found:
+            print("[REGRESSION]", regression, file=sys.stderr)
+        if len(found) > 0:
+            sys.exit(1)
+        print("No regressions beyond {:.0%} of baseline.".format(args.threshold))
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+"""
+file: build.py
+
+Incremental build support. Each stage of the pipeline (raw chordsheet -> LaTeX -> PDF -> slide PNGs) is identified by
+a name and records a fingerprint of its inputs, along with the outputs it produced. A stage whose fingerprint is
+unchanged and whose outputs still exist does not need to be run again.
+"""
+
+import os
+import json
+import filecmp
+import hashlib
+from typing import Dict, Iterable, List, Tuple, Union
+
+BUILD_STATE_FILE = ".build_state.json"
+TEMPLATE_DIRECTORY = "latex_templates"
+WRITE_BUFFER_SIZE = 64 * 1024
+
+# digests of files, keyed by path and invalidated by modification time and size
+_file_digests = {}  # type: Dict[str, Tuple[Tuple[int, int], str]]
+
+
+def file_digest(path: str) -> str:
+    """
+    Compute the digest of a file's contents. Digests are memoized per process until the file's modification time or
+    size changes.
+    :param path: str representing path to file
+    :return: str representing hex digest of file, or an empty string if the file does not exist
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return ""
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _file_digests.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    _file_digests[path] = (signature, digest)
+    return digest
+
+
+def template_files(directory: str=TEMPLATE_DIRECTORY) -> List[str]:
+    """
+    :param directory: str representing path to directory of LaTeX templates
+    :return: List[str] representing sorted paths to all templates, which every LaTeX document depends on
+    """
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.join(directory, f) for f in os.listdir(directory))
+
+
+def fingerprint(values: List[str]=(), files: List[str]=()) -> str:
+    """
+    Combine values and file contents into a single fingerprint.
+    :param values: List[str] representing values the stage depends on (e.g. the target key)
+    :param files: List[str] representing paths to files the stage depends on
+    :return: str representing hex digest of all inputs
+    """
+    h = hashlib.sha256()
+    for value in values:
+        h.update(b"v" + str(value).encode("utf-8") + b"\0")
+    for path in files:
+        h.update(b"f" + path.encode("utf-8") + b"\0" + file_digest(path).encode("ascii") + b"\0")
+    return h.hexdigest()
+
+
+def write_if_changed(destination: str, content: Union[str, Iterable[str]]) -> bool:
+    """
+    Write content to a file, unless the file already has exactly that content (so its modification time and any
+    dependent stages are left untouched). Content given as chunks is streamed to a temporary file next to the
+    destination, which then replaces the destination only if the two differ.
+    :param destination: str representing path to output file
+    :param content: str representing content of file, or Iterable[str] representing chunks of content
+    :return: True if the file was written, or False if it was already up to date
+    """
+    if isinstance(content, str):
+        content = (content,)
+    temporary = destination + ".tmp"
+    try:
+        with open(temporary, "w", buffering=WRITE_BUFFER_SIZE) as f:
+            for chunk in content:
+                f.write(chunk)
+        if os.path.exists(destination) and filecmp.cmp(temporary, destination, shallow=False):
+            os.remove(temporary)
+            return False
+        os.replace(temporary, destination)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+    return True
+
+
+class BuildState:
+    """
+    Class representing the recorded fingerprints and outputs of previously run build stages. Records changed during a
+    build are tracked separately so that builds in worker processes can report them back to be merged.
+    """
+    def __init__(self, records: Dict[str, dict]=None, force: bool=False):
+        """
+        :param records: dict mapping stage names to records of the form {"fingerprint": str, "outputs": List[str]}
+        :param force: bool representing whether every stage should be treated as out of date (records are still kept)
+        """
+        self.records = dict(records) if records is not None else {}
+        self.updates = {}
+        self.force = force
+
+    @staticmethod
+    def load(filename: str=BUILD_STATE_FILE, force: bool=False) -> "BuildState":
+        """
+        :param filename: str representing path to build state file
+        :param force: bool representing whether every stage should be treated as out of date
+        :return: BuildState loaded from file, or an empty BuildState if the file does not exist or cannot be read
+        """
+        try:
+            with open(filename, "r") as f:
+                return BuildState(json.load(f), force=force)
+        except (FileNotFoundError, ValueError):
+            return BuildState(force=force)
+
+    def save(self, filename: str=BUILD_STATE_FILE):
+        """
+        :param filename: str representing path to build state file
+        """
+        with open(filename, "w") as f:
+            json.dump(self.records, f, indent=2, sort_keys=True)
+
+    def is_up_to_date(self, stage: str, stage_fingerprint: str) -> bool:
+        """
+        :param stage: str representing name of stage
+        :param stage_fingerprint: str representing fingerprint of current inputs of stage
+        :return: True if the stage last ran with the same inputs and all of its outputs still exist, or False otherwise
+        """
+        record = self.records.get(stage)
+        return (not self.force and record is not None and record["fingerprint"] == stage_fingerprint and
+                all(os.path.exists(output) for output in record["outputs"]))
+
+    def get_outputs(self, stage: str) -> List[str]:
+        """
+        :param stage: str representing name of stage
+        :return: List[str] representing outputs recorded for the stage
+        """
+        return list(self.records[stage]["outputs"])
+
+    def update(self, stage: str, stage_fingerprint: str, outputs: List[str]):
+        """
+        Record that a stage completed successfully.
+        :param stage: str representing name of stage
+        :param stage_fingerprint: str representing fingerprint of inputs of stage
+        :param outputs: List[str] representing paths to outputs produced by stage
+        """
+        record = {"fingerprint": stage_fingerprint, "outputs": list(outputs)}
+        self.records[stage] = record
+        self.updates[stage] = record
+
+    def invalidate(self, stage: str):
+        """
+        Forget a stage, so that it is run on the next build.
+        :param stage: str representing name of stage
+        """
+        self.records.pop(stage, None)
+        self.updates[stage] = None
+
+    def merge(self, updates: Dict[str, dict]):
+        """
+        Apply updates recorded by another BuildState (e.g. from a worker process).
+        :param updates: dict mapping stage names to records, or None for invalidated stages
+        """
+        for stage, record in updates.items():
+            if record is None:
+                self.invalidate(stage)
+            else:
+                self.update(stage, record["fingerprint"], record["outputs"])
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+"""
+file: ccli.py
+
+Support for looking up song metadata (composer, year, publisher) on CCLI SongSelect. Results are cached on disk per CCLI
+number, so a song is only looked up again once its entry has expired. Many songs can be prefetched at once with a
+single login, fetching their pages concurrently over one pooled session.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
+from urllib.parse import urlsplit
+from typing import Dict, Iterable
+
+CCLI_LOGIN_URL = "https://profile.ccli.com/account/signin?appContext=SongSelect&returnUrl=https%3a%2f%2fsongselect.ccli.com%2f"
+SONGSELECT_SONG_URL = "https://songselect.ccli.com/songs/{}"
+SONGSELECT_REQUEST_HEADERS = {'Accept-Encoding': 'identity'}
+CCLI_CACHE_DIRECTORY = ".ccli_cache"
+DEFAULT_TTL = 30 * 24 * 60 * 60  # seconds an entry with metadata is kept
+DEFAULT_NEGATIVE_TTL = 24 * 60 * 60  # seconds an entry for a song without copyright data is kept
+CCLI_METADATA_FIELDS = ["composer", "year", "publisher"]
+
+# prefetch settings
+DEFAULT_PREFETCH_WORKERS = 4  # concurrent requests
+DEFAULT_REQUESTS_PER_SECOND = 4.0
+DEFAULT_RETRIES = 3  # attempts after the first for each page
+DEFAULT_BACKOFF = 1.0  # seconds to wait before the first retry; doubled for each further retry
+DEFAULT_PREFETCH_TIMEOUT = 120.0  # seconds for the whole prefetch
+REQUEST_TIMEOUT = 30.0  # seconds for a single request
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Regex strings
+SONG_PAGE_BLOCK_REGEX = r"<ul class=\"(?P<block>authors|song-meta-list)\">"
+COPYRIGHTS_HEADING_REGEX = r"\r\n[ ]*<li>Copyrights<\/li>\r\n"
+GET_ARTISTS_REGEX = r"<a href=[a-zA-Z0-9 '\/?=_\"-]+>([a-zA-Z '-]+)<\/a>\r\n[ ]*"
+GET_YEAR_REGEX = r"<li>([0-9]+) [a-zA-Z0-9 ]+<\/li>"
+GET_PUBLISHERS_REGEX = r"<li>[0-9 ]*([a-zA-Z0-9 !]+)<\/li>"
+
+SONG_PAGE_BLOCK_PATTERN = re.compile(SONG_PAGE_BLOCK_REGEX)
+COPYRIGHTS_HEADING_PATTERN = re.compile(COPYRIGHTS_HEADING_REGEX)
+ARTISTS_PATTERN = re.compile(GET_ARTISTS_REGEX)
+YEAR_PATTERN = re.compile(GET_YEAR_REGEX)
+PUBLISHERS_PATTERN = re.compile(GET_PUBLISHERS_REGEX)
+BLOCK_END = "</ul>"
+MAX_BLOCK_LENGTH = 16 * 1024  # maximum number of characters in a list of authors or copyrights
+
+
+def parse_song_page(html_text: str) -> dict:
+    """
+    Parse html response for artist names, publishing year, and publishers in a single pass. The page is scanned for
+    the list of authors and the list of copyrights only until both have been found; each value is then extracted from
+    within its list, which must end within MAX_BLOCK_LENGTH characters.
+    :param html_text: str representing html of CCLI page for song
+    :return: dict mapping "composer" to artist names delimited by commas, "year" to the year (int), and "publisher" to
+    names of publishers delimited by commas, each None if not found
+    """
+    fields = dict.fromkeys(CCLI_METADATA_FIELDS)
+    found_authors = False
+    found_copyrights = False
+    end = -1  # position of the first end of a list after the current list; reused so that no text is searched twice
+
+    for m in SONG_PAGE_BLOCK_PATTERN.finditer(html_text):
+        if end < m.end():
+            end = html_text.find(BLOCK_END, m.end())
+            if end < 0:  # no list is terminated after this point
+                break
+        if end - m.end() > MAX_BLOCK_LENGTH:  # unterminated list
+            continue
+
+        if m.group("block") == "authors" and not found_authors:
+            artists = ARTISTS_PATTERN.findall(html_text, m.end(), end)
+            if len(artists) > 0:
+                fields["composer"] = ", ".join(artists)
+            found_authors = True
+
+        elif m.group("block") == "song-meta-list" and not found_copyrights:
+            heading = COPYRIGHTS_HEADING_PATTERN.match(html_text, m.end(), end)
+            if heading is None:  # some other list of song metadata
+                continue
+            match_year = YEAR_PATTERN.search(html_text, heading.end(), end)
+            if match_year is not None:
+                fields["year"] = int(match_year.group(1))
+            publishers = PUBLISHERS_PATTERN.findall(html_text, heading.end(), end)
+            if len(publishers) > 0:
+                fields["publisher"] = ", ".join(publishers)
+            found_copyrights = True
+
+        if found_authors and found_copyrights:
+            break
+
+    return fields
+
+
+class CCLICache:
+    """
+    Class representing a directory of cached CCLI lookups, one JSON file per CCLI number. Each entry records when the
+    lookup was made and the value found for each field, or None if the page had no value for it; an entry in which no
+    field was found is a negative entry, and expires after its own (usually shorter) time to live. Entries are written
+    atomically, so several processes may share a cache.
+    """
+    def __init__(self, directory: str=CCLI_CACHE_DIRECTORY, ttl: float=DEFAULT_TTL,
+                 negative_ttl: float=DEFAULT_NEGATIVE_TTL):
+        """
+        :param directory: str representing path to cache directory (created on first write)
+        :param ttl: float representing number of seconds for which an entry with metadata is used
+        :param negative_ttl: float representing number of seconds for which a negative entry is used
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    def get(self, ccli: str) -> dict:
+        """
+        :param ccli: str representing CCLI number of song
+        :return: dict mapping each of CCLI_METADATA_FIELDS to the value found (or None), or None if there is no
+        unexpired entry for the song
+        """
+        try:
+            with open(self.__get_path(ccli), "r") as f:
+                entry = json.load(f)
+            fields = {field: entry["fields"].get(field) for field in CCLI_METADATA_FIELDS}
+            ttl = self.ttl if any(value is not None for value in fields.values()) else self.negative_ttl
+            if time.time() - entry["time"] > ttl:  # expired
+                return None
+        except (FileNotFoundError, ValueError, KeyError, TypeError, AttributeError):
+            return None
+        return fields
+
+    def put(self, ccli: str, fields: dict):
+        """
+        Record the result of a lookup.
+        :param ccli: str representing CCLI number of song
+        :param fields: dict mapping fields in CCLI_METADATA_FIELDS to the value found, or to None if not found
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        entry = {"time": time.time(), "fields": {field: fields.get(field) for field in CCLI_METADATA_FIELDS}}
+        path = self.__get_path(ccli)
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        with open(temporary, "w") as f:
+            json.dump(entry, f)
+        os.replace(temporary, path)
+
+    def __get_path(self, ccli: str) -> str:
+        """
+        :param ccli: str representing CCLI number of song
+        :return: str representing path to file of entry for song
+        """
+        return os.path.join(self.directory, re.sub("[^0-9A-Za-z]+", "-", ccli.strip()) + ".json")
+
+
+class LoginError(Exception):
+    """
+    Class representing a failed login to CCLI, e.g. because of wrong account info or a changed sign-in form.
+    """
+    pass
+
+
+def is_login_page(url: str, login_url: str=CCLI_LOGIN_URL) -> bool:
+    """
+    :param url: str representing URL a request ended up at, after redirects
+    :param login_url: str representing URL of the sign-in page
+    :return: True if url is the sign-in page (whatever its query), i.e. the request was not logged in
+    """
+    return urlsplit(url)[:3] == urlsplit(login_url)[:3]
+
+
+def login(session, account_info: dict, login_url: str=CCLI_LOGIN_URL,
+          timeout: float=REQUEST_TIMEOUT):
+    """
+    Log in to CCLI. Signing in redirects away from the sign-in page, while a failed sign-in shows it again, so a
+    response which ends up back at the sign-in page is a failure even if its status is OK.
+    :param session: requests.Session to log in
+    :param account_info: dict representing account info for CCLI, as for supplement_header
+    :param login_url: str representing URL to which account info is posted
+    :param timeout: float representing seconds after which the request is abandoned
+    :raises LoginError: if CCLI did not confirm the login
+    :raises requests.RequestException: if the request itself failed
+    """
+    r = session.post(login_url, account_info, timeout=timeout)
+    if not r.ok:
+        raise LoginError("CCLI login failed with status {}.".format(r.status_code))
+    if is_login_page(r.url, login_url):
+        raise LoginError("CCLI login was not accepted; check the email address and password.")
+
+
+class RateLimiter:
+    """
+    Class representing a limit on how often requests may start, shared by several threads.
+    """
+    def __init__(self, requests_per_second: float):
+        """
+        :param requests_per_second: float representing maximum number of requests started per second, or 0 for no limit
+        """
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self.__next = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def wait(self, deadline: float=None) -> bool:
+        """
+        Block until the next request may start.
+        :param deadline: float representing time (as returned by time.monotonic) after which not to wait, or None
+        :return: True if a request may start, or False if that would only be after the deadline
+        """
+        with self.__lock:
+            start = max(self.__next, time.monotonic())
+            if deadline is not None and start > deadline:
+                return False
+            self.__next = start + self.interval
+        time.sleep(max(0.0, start - time.monotonic()))
+        return True
+
+
+def prefetch(ccli_numbers: Iterable[str], account_info: dict, ccli_cache: CCLICache,
+             workers: int=DEFAULT_PREFETCH_WORKERS, requests_per_second: float=DEFAULT_REQUESTS_PER_SECOND,
+             retries: int=DEFAULT_RETRIES, backoff: float=DEFAULT_BACKOFF, timeout: float=DEFAULT_PREFETCH_TIMEOUT,
+             login_url: str=CCLI_LOGIN_URL, song_url: str=SONGSELECT_SONG_URL) -> Dict[str, dict]:
+    """
+    Look up every song not already in the cache, logging in once and then fetching song pages concurrently over a
+    single pooled session. Requests are rate limited, and failed requests (connection errors, or responses with a
+    status code in RETRY_STATUS_CODES) are retried with exponential backoff. Lookups still outstanding once the timeout
+    has passed are abandoned. Pages fetched successfully are parsed and stored in the cache; nothing is fetched (or
+    cached) unless the login is confirmed, and a page which redirects to the sign-in page is a failed lookup.
+    :param ccli_numbers: Iterable[str] representing CCLI numbers of songs to look up
+    :param account_info: dict representing account info for CCLI, as for supplement_header
+    :param ccli_cache: CCLICache to fill
+    :param workers: int representing maximum number of requests in flight at once
+    :param requests_per_second: float representing maximum number of requests started per second, or 0 for no limit
+    :param retries: int representing number of times a failed request is retried
+    :param backoff: float representing seconds to wait before the first retry, doubled for each further retry
+    :param timeout: float representing seconds after which the prefetch gives up on outstanding lookups
+    :param login_url: str representing URL to which account info is posted to log in
+    :param song_url: str representing URL of song pages, with {} in place of the CCLI number
+    :return: dict mapping each CCLI number looked up to the fields found (as for parse_song_page), or to None if the
+    lookup failed
+    :raises LoginError: if CCLI did not confirm the login
+    :raises requests.RequestException: if the login request failed
+    """
+    deadline = time.monotonic() + timeout
+    missing = sorted(set(ccli for ccli in ccli_numbers if ccli_cache.get(ccli) is None))
+    if len(missing) == 0:
+        return {}
+
+    # imported here, since requests is slow to import and most runs never look anything up
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    limiter = RateLimiter(requests_per_second)
+    cancelled = threading.Event()
+
+    def fetch(session: "requests.Session", ccli: str) -> dict:
+        """
+        :param session: requests.Session representing logged in session
+        :param ccli: str representing CCLI number of song
+        :return: dict representing fields found, or None if the lookup failed
+        """
+        for attempt in range(retries + 1):
+            if attempt > 0:  # back off before retrying
+                delay = backoff * 2 ** (attempt - 1)
+                if cancelled.wait(min(delay, max(0.0, deadline - time.monotonic()))) or \
+                        time.monotonic() >= deadline:
+                    return None
+            if cancelled.is_set() or not limiter.wait(deadline):
+                return None
+            try:
+                r = session.get(song_url.format(ccli), headers=SONGSELECT_REQUEST_HEADERS,
+                                timeout=max(0.1, min(REQUEST_TIMEOUT, deadline - time.monotonic())))
+            except requests.RequestException:
+                continue
+            if r.status_code in RETRY_STATUS_CODES:
+                continue
+            if r.status_code == 404:  # no such song; remember that, as for a page without copyright data
+                fields = dict.fromkeys(CCLI_METADATA_FIELDS)
+                ccli_cache.put(ccli, fields)
+                return fields
+            if not r.ok or is_login_page(r.url, login_url):  # not worth retrying; a lapsed login is no negative result
+                return None
+            fields = parse_song_page(r.text)
+            ccli_cache.put(ccli, fields)
+            return fields
+        return None
+
+    results = dict.fromkeys(missing)
+    with requests.Session() as session:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        login(session, account_info, login_url, timeout=max(0.1, min(REQUEST_TIMEOUT, deadline - time.monotonic())))
+
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = {executor.submit(fetch, session, ccli): ccli for ccli in missing}
+        try:
+            for future in as_completed(futures, timeout=max(0.0, deadline - time.monotonic())):
+                results[futures[future]] = future.result()
+        except TimeoutError:  # give up on outstanding lookups
+            pass
+        finally:
+            cancelled.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+    return results
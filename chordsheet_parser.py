@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+"""
+file: chordsheet_parser.py
+
+Parsing of raw chordsheets into header data and a Song. The parse results cached in the song cache are determined by
+this module and classes.py alone, so changes elsewhere in the pipeline keep cached parses valid.
+"""
+
+import re
+from classes import Line, ParseMode, Section, Song
+
+# Global constants
+DEFAULT_KEY = "C"
+
+DEFAULT_HEADER = {
+    "composer": "Unknown Artist",
+    "ccli": "N/A",
+    "bpm": "Unknown",
+    "signature": "Unknown signature",
+    "verse": "N/A",
+    "arranger": "Unknown Arranger",
+    "year": "",
+    "publisher": "Unknown Publisher"
+}
+
+# Regex strings
+# each tag regex captures its value in a group named after the tag, so that they can be combined into a single pattern
+SONG_TAG_REGEX = "^<song> (?P<song>[a-zA-Z0-9 :,'()/-]+)$"
+CCLI_TAG_REGEX = "^<ccli> (?P<ccli>[0-9/ ]+|N/A)$"
+COMPOSER_TAG_REGEX = "^<composer> (?P<composer>[a-zA-Z0-9 ,-.]+)$"
+KEY_TAG_REGEX = "(?i:^<key> (?P<key>[A-G][#b]? major|minor)$)"
+BPM_TAG_REGEX = "^<bpm> (?P<bpm>(?:[0-9]+)|\\?)$"
+SIGNATURE_TAG_REGEX = "^<signature> (?P<signature>(?:[0-9]+/[0-9]+)|\\?)"
+VERSE_TAG_REGEX = "^<verse> (?P<verse>[a-zA-Z0-9 :,-]+|N/A)$"
+ARRANGER_TAG_REGEX = "^<arranger> (?P<arranger>[a-zA-Z0-9 -]+)$"
+PUBLISHER_TAG_REGEX = "^<publisher> (?P<publisher>[a-zA-Z0-9 ,.!'/-]+|N/A)$"
+YEAR_TAG_REGEX = "^<year> (?P<year>[0-9]+|N/A)$"
+ORDER_TAG_REGEX = "^(?P<order><order>)"
+SECTION_TAG_REGEX = "^<(?P<section>[a-zA-Z0-9 ]+)>$"
+ORDER_ENTRY_REGEX = "^([a-zA-Z0-9 ]+?)( \\(x?(\\d)+x?\\))?$"
+
+# single pattern classifying a line in NORMAL parse mode; alternatives are tried in order, so the first tag to match
+# wins, and the name of the group matched (match.lastgroup) identifies the tag
+NORMAL_MODE_PATTERN = re.compile("|".join("(?:{})".format(regex) for regex in [
+    SONG_TAG_REGEX, CCLI_TAG_REGEX, COMPOSER_TAG_REGEX, KEY_TAG_REGEX, BPM_TAG_REGEX, SIGNATURE_TAG_REGEX,
+    VERSE_TAG_REGEX, ARRANGER_TAG_REGEX, PUBLISHER_TAG_REGEX, YEAR_TAG_REGEX, ORDER_TAG_REGEX, SECTION_TAG_REGEX]))
+ORDER_ENTRY_PATTERN = re.compile(ORDER_ENTRY_REGEX)
+CCLI_TAG_PATTERN = re.compile(CCLI_TAG_REGEX)
+
+# conversions applied to header tag values before they are stored (tags not listed are stored as strings)
+HEADER_TAG_CONVERTERS = {"bpm": int}
+
+
+def parse(filename: str):
+    """
+    Main function for parsing a raw chordsheet, including parsing the header information, the section order, and the
+    chords and lyrics themselves.
+    :param filename: str representing name of raw chordsheet file
+    :return: list representing [header data (dict), instance of a Song (Song)]
+    """
+    def verify_data(header_data: dict):
+        """
+        Checks for minimal data found in header. If no song title or key is found, an error will be thrown.
+        :param header_data: dict representing the header data, with tags stored as keys
+        :return: True if successful
+        """
+        if "song" not in header_data:
+            raise ValueError("File must include a song title, but no <song> tag was found.")
+        if "major_minor" not in header_data:
+            raise ValueError("File must include a key, but no <key> tag was found.")
+        return True
+
+    # initialize variables
+    header_data = dict(DEFAULT_HEADER)
+    sections = {}
+    lines = []
+    order = []
+    old_key = DEFAULT_KEY
+    section_name = None
+
+    # read file
+    with open(filename, "r") as f:
+        mode = ParseMode.NORMAL  # initialize mode
+        content = f.readlines()
+
+        # iterate through lines
+        for l in content:
+            # NORMAL mode
+            if mode == ParseMode.NORMAL:
+                match = NORMAL_MODE_PATTERN.match(l)
+                if match is None:  # not a recognized tag; ignore line
+                    continue
+                tag = match.lastgroup
+
+                # <key> (of raw chordsheet)
+                if tag == "key":
+                    key_info = match.group(tag)
+                    old_key = key_info.split(" ")[0]
+                    header_data["major_minor"] = key_info.split(" ")[1]
+                    if header_data["major_minor"].lower() == "major":
+                        header_data["major_minor"] = "Major"
+
+                # switch to ORDER mode
+                elif tag == "order":
+                    mode = ParseMode.ORDER
+
+                # switch to SECTION mode
+                elif tag == "section":
+                    mode = ParseMode.SECTION
+                    lines = []
+                    section_name = match.group(tag)
+
+                # other header tags
+                else:
+                    value = match.group(tag)
+                    header_data[tag] = HEADER_TAG_CONVERTERS[tag](value) if tag in HEADER_TAG_CONVERTERS else value
+
+            # ORDER mode
+            elif mode == ParseMode.ORDER:
+                if l == "\n":  # terminal character
+                    mode = ParseMode.NORMAL
+                else:  # parse ordering of sections
+                    match = ORDER_ENTRY_PATTERN.match(l)
+                    name = match.group(1)
+                    frequency = int(match.group(3)) if match.group(3) is not None else 1
+                    order.append((name, frequency))
+
+            # SECTION mode
+            elif mode == ParseMode.SECTION:
+                if l == "\n":  # terminal character
+                    mode = ParseMode.NORMAL
+                    sections[section_name] = (Section(section_name, lines))
+                    section_name = None
+                else:  # collect lines to be parsed by Section constructor later
+                    lines.append(Line.parse(l))
+
+        if mode == ParseMode.SECTION:  # section ended without sole newline
+            sections[section_name] = (Section(section_name, lines))
+
+    verify_data(header_data)  # verify that the header data has the minimal amount needed to generate the song
+
+    return header_data, Song(sections, order, old_key)
+
+
+def read_ccli_number(filename: str) -> str:
+    """
+    Read the CCLI number from the header of a raw chordsheet, without parsing the rest of the file.
+    :param filename: str representing name of raw chordsheet file
+    :return: str representing CCLI number of song, or None if the file has none
+    """
+    with open(filename, "r") as f:
+        for l in f:
+            match = CCLI_TAG_PATTERN.match(l)
+            if match is not None:
+                return match.group("ccli") if match.group("ccli") != "N/A" else None
+    return None
@@ -9,7 +9,9 @@ Contains all abstract class definitions.
 from enum import Enum
 from abc import ABC, abstractmethod
 import re
-from typing import Dict, List, Tuple, Union
+from array import array
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple, Union
 
 
 class ParseMode(Enum):
@@ -23,6 +25,8 @@ class Song:
     Class representing a single song, which consists of a current key, sections, and an ordering of sections with
     frequency. A Song instance represents both an instance of a song and a generator for chordsheets or slides.
     """
+    __slots__ = ("__sections", "__order", "__key")
+
     def __init__(self, sections: Dict[str, "Section"], order: list, old_key: str):
         """
         :param sections: dictionary mapping section names (str) as keys to Section objects (Section)
@@ -33,24 +37,84 @@ class Song:
         self.__order = list(order)
         self.__key = old_key
 
+    def get_key(self) -> str:
+        """
+        :return: str representing current key of sections
+        """
+        return self.__key
+
+    def get_sections(self) -> Dict[str, "Section"]:
+        """
+        :return: dict mapping section names (str) to Section objects (Section)
+        """
+        return dict(self.__sections)
+
+    def get_order(self) -> List[Tuple[str, int]]:
+        """
+        :return: list(str, int) representing order of sections in song and frequency of each section
+        """
+        return list(self.__order)
+
     def generate_chordsheet(self, new_key: str) -> str:
         """
         Create LaTeX chordsheet output of song in new key.
         :param new_key: str representing new key to output song in
         :return: str representing LaTeX chordsheet representation of song (without header info)
         """
+        return "".join(self.emit_chordsheet(new_key))
+
+    def emit_chordsheet(self, new_key: str) -> Iterator[str]:
+        """
+        Create LaTeX chordsheet output of song in new key, one chunk at a time, so that it can be written out without
+        building the whole document in memory.
+        :param new_key: str representing new key to output song in
+        :return: Iterator[str] representing chunks of LaTeX chordsheet representation of song (without header info)
+        """
         notes = Notes(self.__key, new_key)
 
         generated_sections = set()
 
         # generate output
-        output = "\\bsong\n\n"
+        yield "\\bsong\n\n"
         for section_name, frequency in self.__order:  # generate section code per section
-            output += self.__sections[section_name].generate_chordsheet(
-                notes, frequency, repeated_section=section_name in generated_sections) + "\n\n"
+            yield from self.__sections[section_name].emit_chordsheet(
+                notes, frequency, repeated_section=section_name in generated_sections)
+            yield "\n\n"
+            generated_sections.add(section_name)
+        yield "\\esong\n\n"
+
+    def generate_chordsheets(self, new_keys: List[str]) -> Dict[str, str]:
+        """
+        Create LaTeX chordsheet output of song in several keys. Everything that does not depend on the key (section
+        wrappers, lyric text and chord positions) is computed once and shared between keys.
+        :param new_keys: List[str] representing keys to output song in
+        :return: dict mapping each new key to the LaTeX chordsheet representation of song in that key (without header
+        info)
+        """
+        return {new_key: self.generate_chordsheet(new_key) for new_key in new_keys}
+
+    def generate_text(self, new_key: str) -> str:
+        """
+        Create plain text output of song in new key, with chords above the lyrics they are played on.
+        :param new_key: str representing new key to output song in
+        :return: str representing plain text representation of song (without header info)
+        """
+        return "".join(self.emit_text(new_key))
+
+    def emit_text(self, new_key: str) -> Iterator[str]:
+        """
+        Create plain text output of song in new key, one chunk at a time.
+        :param new_key: str representing new key to output song in
+        :return: Iterator[str] representing chunks of plain text representation of song (without header info)
+        """
+        notes = Notes(self.__key, new_key)
+
+        generated_sections = set()
+        for section_name, frequency in self.__order:
+            yield from self.__sections[section_name].emit_text(
+                notes, frequency, repeated_section=section_name in generated_sections)
+            yield "\n"
             generated_sections.add(section_name)
-        output += "\\esong\n\n"
-        return output
 
     def generate_slides(self, repeat: bool=True) -> str:
         """
@@ -58,18 +122,25 @@ class Song:
         :param repeat: bool representing whether to display slides which have previously been generated
         :return: str representing LaTeX slides representation of song (without header info)
         """
+        return "".join(self.emit_slides(repeat))
+
+    def emit_slides(self, repeat: bool=True) -> Iterator[str]:
+        """
+        Create LaTeX slides output of song, one chunk at a time.
+        :param repeat: bool representing whether to display slides which have previously been generated
+        :return: Iterator[str] representing chunks of LaTeX slides representation of song (without header info)
+        """
         generated_sections = set()
         first_slide = True
 
         # generate output
-        output = ""
         for section_name, _ in self.__order:
             # generate slide code per section
             if (repeat or section_name not in generated_sections) and self.__sections[section_name].has_lyrics():
-                output += self.__sections[section_name].generate_slides(first_slide) + "\n\n"
+                yield from self.__sections[section_name].emit_slides(first_slide)
+                yield "\n\n"
                 first_slide = False
             generated_sections.add(section_name)
-        return output
 
     def __str__(self):
         """
@@ -88,6 +159,8 @@ class Section:
     Class representing a section of music (e.g. Verse, Chorus, etc.), consisting of a sequence of musical or lyrical
     lines.
     """
+    __slots__ = ("name", "lines", "__wrappers")
+
     def __init__(self, name: str, lines: List["Line"]):
         """
         :param name: str representing name of section, used to reference section in ordering
@@ -95,6 +168,7 @@ class Section:
         """
         self.name = name
         self.lines = list(lines)
+        self.__wrappers = {}
 
     def get_wrapper(self, repeat: bool=False) -> Union[Tuple[str], str]:
         """
@@ -105,6 +179,16 @@ class Section:
         tag is generated
         :return: Tuple[str] representing a tuple of
         """
+        # wrapper does not depend on the key, so it is only computed once per section
+        if repeat not in self.__wrappers:
+            self.__wrappers[repeat] = self.__get_wrapper(repeat)
+        return self.__wrappers[repeat]
+
+    def __get_wrapper(self, repeat: bool) -> Union[Tuple[str], str]:
+        """
+        :param repeat: bool representing whether this is a repeated section
+        :return: Tuple[str] or str representing wrapper of section, as described in get_wrapper
+        """
         # check Regex matches for section name
         if re.match("^Intro$", self.name):
             return ("\\bi", "\\ei") if not repeat else "\\ri"
@@ -153,6 +237,16 @@ class Section:
         :param repeated_section: bool - True if section has been played earlier in song, or False otherwise
         :return: str representing LaTeX chordsheet representation of section
         """
+        return "".join(self.emit_chordsheet(notes, frequency, repeated_section))
+
+    def emit_chordsheet(self, notes: "Notes", frequency:int=1, repeated_section:bool=False) -> Iterator[str]:
+        """
+        Create LaTeX chordsheet output of section, one chunk at a time.
+        :param notes: Notes instance representing transposition operator
+        :param frequency: int representing number of times the section should be played
+        :param repeated_section: bool - True if section has been played earlier in song, or False otherwise
+        :return: Iterator[str] representing chunks of LaTeX chordsheet representation of section
+        """
         # not a repeated section
         if not repeated_section:
             # build wrapper
@@ -160,15 +254,36 @@ class Section:
             if frequency > 1:  # section is to be played more than once
                 begin = "{}[{}]".format(begin, frequency, {})
             # build section representation
-            return begin + "\n" + "\n\n".join(
-                l.generate_chordsheet(notes) for l in self.lines) + "\n" + end
+            yield begin + "\n"
+            for i, l in enumerate(self.lines):
+                if i > 0:
+                    yield "\n\n"
+                yield l.generate_chordsheet(notes)
+            yield "\n" + end
         # repeated section
         else:
             macro = self.get_wrapper(repeat=repeated_section)
             if frequency > 1:  # section is to be played more than once
-                return "{0}[{2}]{{{1}}}".format(macro, self.get_index(), frequency, {})
+                yield "{0}[{2}]{{{1}}}".format(macro, self.get_index(), frequency, {})
             else:  # frequency == 1
-                return "{0}{{{1}}}".format(macro, self.get_index(), {})
+                yield "{0}{{{1}}}".format(macro, self.get_index(), {})
+
+    def emit_text(self, notes: "Notes", frequency: int=1, repeated_section: bool=False) -> Iterator[str]:
+        """
+        Create plain text output of section, one chunk at a time. A repeated section is only named.
+        :param notes: Notes instance representing transposition operator
+        :param frequency: int representing number of times the section should be played
+        :param repeated_section: bool - True if section has been played earlier in song, or False otherwise
+        :return: Iterator[str] representing chunks of plain text representation of section
+        """
+        title = self.name + (" (x{})".format(frequency) if frequency > 1 else "")
+        if repeated_section:
+            yield title + "\n"
+            return
+        yield title + ":\n"
+        for l in self.lines:
+            if not l.is_break():  # breaks only separate slides
+                yield l.generate_text(notes) + "\n"
 
     def generate_slides(self, is_first_slide: bool) -> str:
         """
@@ -176,23 +291,29 @@ class Section:
         :param is_first_slide: True if slide being generated is the first slide, or False otherwise
         :return: str representing LaTeX slide representation of section
         """
+        return "".join(self.emit_slides(is_first_slide))
+
+    def emit_slides(self, is_first_slide: bool) -> Iterator[str]:
+        """
+        Create LaTeX slides output of section, one chunk at a time.
+        :param is_first_slide: True if slide being generated is the first slide, or False otherwise
+        :return: Iterator[str] representing chunks of LaTeX slide representation of section
+        """
         def create_slide(lines):
-            output = ""
             if len(lines) > 0:
-                output += "\\begin{frame}\n"
-                output += "\\header\n"
-                output += "\\begin{center}\n"
-                output += "\n\n".join(line.get_lyrics() for line in lines)  # generate each line
-                output += "\n\\end{center}\n"
+                yield "\\begin{frame}\n\\header\n\\begin{center}\n"
+                for i, line in enumerate(lines):  # generate each line
+                    if i > 0:
+                        yield "\n\n"
+                    yield line.get_lyrics()
+                yield "\n\\end{center}\n"
                 if is_first_slide:  # if first slide, include citation
-                    output += "\\cite\n"
-                output += "\\end{frame}"
-            return output
+                    yield "\\cite\n"
+                yield "\\end{frame}"
 
         if not self.has_lyrics():
             raise RuntimeError("Error: cannot generate a slide for a section without lyrics.")
 
-        output = ""
         lines_per_slide = []
 
         # collect lines
@@ -200,11 +321,9 @@ class Section:
             if not line.is_break():
                 lines_per_slide.append(line)
             else:
-                output += create_slide(lines_per_slide)
+                yield from create_slide(lines_per_slide)
                 lines_per_slide = []
-        output += create_slide(lines_per_slide)
-
-        return output
+        yield from create_slide(lines_per_slide)
 
     def __str__(self):
         """
@@ -219,6 +338,8 @@ class Line(ABC):
     """
     Abstract class representing a line of music, either as an instrumental line of chords or a lyric line with chords.
     """
+    __slots__ = ()
+
     MAX_LENGTH = 52
 
     @staticmethod
@@ -244,6 +365,21 @@ class Line(ABC):
         """
         pass
 
+    @abstractmethod
+    def generate_text(self, notes: "Notes") -> str:
+        """
+        Create plain text output of line in new key.
+        :param notes: Notes object used to transpose line to proper chords
+        :return: str representing plain text representation of line (chords above lyrics, if both)
+        """
+        pass
+
+    def get_chords(self) -> List["Chord"]:
+        """
+        :return: List[Chord] representing chords of line, in the order they are played
+        """
+        return []
+
     @abstractmethod
     def has_lyrics(self) -> bool:
         """
@@ -280,9 +416,16 @@ class BreakLine(Line):
     ---
 
     """
+    __slots__ = ()
+
+    BREAK_LINE_REGEX = re.compile("(-)*$")
+
     def generate_chordsheet(self, notes: "Notes") -> str:
         return ""
 
+    def generate_text(self, notes: "Notes") -> str:
+        return ""
+
     @staticmethod
     def parse(line: str) -> Line:
         return BreakLine()
@@ -299,7 +442,7 @@ class BreakLine(Line):
         :param line: str representing a line in the raw chordsheet
         :return: True if the line is a break line
         """
-        return re.match("(-)*$", line) is not None
+        return BreakLine.BREAK_LINE_REGEX.match(line) is not None
 
     def is_break(self) -> bool:
         return True
@@ -315,6 +458,10 @@ class MusicLine(Line):
     | G    | Em    | C     | D     |
 
     """
+    __slots__ = ("measures",)
+
+    MUSIC_LINE_REGEX = re.compile("^\\|:?([A-Ga-z0-9#/ ]+:?\\|)+( \\(x(\\d)+\\))?$")  # match measures
+
     def __init__(self, measures: List[List["Chord"]]):
         """
         Create an instance of a music line with specified measures
@@ -326,13 +473,19 @@ class MusicLine(Line):
         return "| " + " | ".join(
             " ".join(Chord.convert(notes.transpose(chord)) for chord in m) for m in self.measures) + " |"
 
+    def generate_text(self, notes: "Notes") -> str:
+        return "| " + " | ".join(" ".join(notes.transpose(chord) for chord in m) for m in self.measures) + " |"
+
+    def get_chords(self) -> List["Chord"]:
+        return [chord for m in self.measures for chord in m]
+
     @staticmethod
     def is_music_line(line: str) -> bool:
         """
         :param line: str representing a line in the raw chordsheet
         :return: True if the line is a music-only line
         """
-        return re.match("^\|:?([A-Ga-z0-9#/ ]+:?\|)+( \(x(\d)+\))?$", line) is not None  # match measures
+        return MusicLine.MUSIC_LINE_REGEX.match(line) is not None
 
     @staticmethod
     def parse(line: str) -> Line:
@@ -342,9 +495,9 @@ class MusicLine(Line):
             if m == "\n":  # skip newline measure at end
                 pass
             elif "/" in m:  # '/' separates chords; split on spaces and apply chord to each
-                measures.append(list(map(Chord, m.split(" "))))
+                measures.append(list(map(Chord.intern, m.split(" "))))
             else:  # append single chord
-                measures.append([Chord(m.strip())])
+                measures.append([Chord.intern(m.strip())])
         return MusicLine(measures)
 
     def has_lyrics(self) -> bool:
@@ -362,70 +515,99 @@ class MusicLine(Line):
 
 class Lyric(Line):
     """
-    Class representing a single lyric line, possibly including chords.
+    Class representing a single lyric line, possibly including chords. The line is stored as its plain lyric text,
+    plus parallel arrays of the offsets into the text at which chords are played and the chords themselves.
+
+    A chord applies to the character at its offset, unless it is followed by another chord at the same offset or is at
+    the end of the line, in which case it applies to no character (but still takes up one character position).
     """
-    def __init__(self, characters: List["Character"]):
+    __slots__ = ("text", "offsets", "chords", "__layout")
+
+    CHORD_REGEX = re.compile(r"\[([^\]]*)\]")  # chord in brackets, e.g. [G]
+
+    def __init__(self, text: str, chords: List[Tuple[int, "Chord"]]=()):
         """
-        :param characters: List of Character instances
+        :param text: str representing lyrics without any chords
+        :param chords: List of tuples (offset into text, Chord), in order of offset
         """
-        self.characters = list(characters)
+        self.text = text
+        self.offsets = array("I", (offset for offset, _ in chords))
+        self.chords = tuple(chord for _, chord in chords)
+        self.__layout = None
 
     @staticmethod
     def parse(line: str) -> Line:
-        line_tokens = []
-        i = 0
         line = line.rstrip()
-        while i < len(line):  # iterate through characters of line
-            if line[i] == "[":  # parse chord
-                start_chord = i + 1
-                if i >= len(line):  # hit end of line
-                    raise ValueError("Error: found unparseable line; couldn't find end to chord.")
-
-                while line[i] != "]":  # look for end of chord
-                    i += 1
-                    if i >= len(line):
-                        raise ValueError("Error: found unparseable line; couldn't find end to chord.")
-                end_chord = i
-                i += 1
-
-                if i >= len(line) or line[i] == "[":  # hit end of line or found new chord
-                    line_tokens.append(Character("", Chord(line[start_chord:end_chord])))
-                else:  # apply chord to next character
-                    line_tokens.append(Character(line[i], Chord(line[start_chord:end_chord])))
-                    i += 1
-            else:  # non-chord character
-                line_tokens.append(Character(line[i]))
-                i += 1
-
-        return Lyric(line_tokens)
+        text = []
+        chords = []
+        length = 0
+        start = 0
+        for match in Lyric.CHORD_REGEX.finditer(line):  # iterate through chords of line
+            text.append(line[start:match.start()])
+            length += match.start() - start
+            chords.append((length, Chord.intern(match.group(1))))
+            start = match.end()
+        text.append(line[start:])
+
+        # any bracket left in the text was never closed
+        if any("[" in t for t in text):
+            raise ValueError("Error: found unparseable line; couldn't find end to chord.")
+
+        return Lyric("".join(text), chords)
 
     def has_lyrics(self) -> bool:
         return True
 
     def get_lyrics(self) -> str:
-        return "".join(c.get_char() for c in self.characters)
+        return self.text
+
+    def get_chords(self) -> List["Chord"]:
+        return list(self.chords)
+
+    def get_layout(self) -> List[Tuple["Chord", str, int]]:
+        """
+        Split text into runs, each starting at a chord (except possibly the first). The layout does not depend on the
+        key, so it is computed once and shared by every rendering of the line.
+        :return: List of tuples (chord or None, text of run, number of character positions in run), where a chord with
+        no character (at the end of the line or before another chord) still takes up one position
+        """
+        if self.__layout is None:
+            layout = []
+            if len(self.chords) == 0 or self.offsets[0] > 0:  # text before first chord
+                if len(self.text) > 0:
+                    end = self.offsets[0] if len(self.chords) > 0 else len(self.text)
+                    layout.append((None, self.text[:end], end))
+            for i, chord in enumerate(self.chords):
+                end = self.offsets[i + 1] if i + 1 < len(self.chords) else len(self.text)
+                run = self.text[self.offsets[i]:end]
+                layout.append((chord, run, max(1, len(run))))
+            self.__layout = layout
+        return self.__layout
 
     def generate_chordsheet(self, notes: "Notes") -> str:
         # initialization
-        output = ""
+        output = []
         characters_since_chord = 0
         len_last_chord = None
         total_len = 0
 
-        for c in self.characters:  # iterate through characters in line
-            if c.has_chord():  # character has chord
+        for chord, text, width in self.get_layout():  # iterate through runs of characters in line
+            if chord is not None:  # run starts with chord
+                transposed_chord = notes.transpose(chord)
+
                 # add whitespace between consecutive chords if necessary
                 if len_last_chord is not None and characters_since_chord <= len_last_chord:
-                    output += "\\spv{{{0}}}".format(len_last_chord - characters_since_chord + 1)
+                    output.append("\\spv{{{0}}}".format(len_last_chord - characters_since_chord + 1))
                     total_len += len_last_chord - characters_since_chord + 1
 
                 # reset
                 characters_since_chord = 0
-                len_last_chord = c.get_len_transposed_chord(notes)
+                len_last_chord = len(transposed_chord)
+                output.append("\\c{" + Chord.convert(transposed_chord) + "}")
 
-            characters_since_chord += 1
-            output += c.generate_chordsheet(notes)  # generate representation of character and chord
-            total_len += 1
+            characters_since_chord += width
+            output.append(text)
+            total_len += width
 
         # update total length
         if len_last_chord is not None:
@@ -433,67 +615,63 @@ class Lyric(Line):
 
         # fit line to LaTeX column width
         if total_len > Line.MAX_LENGTH:
-            return "\\fit{" + output + "}"
+            return "\\fit{" + "".join(output) + "}"
         else:
-            return output
+            return "".join(output)
+
+    def generate_text(self, notes: "Notes") -> str:
+        chord_line = ""
+        lyric_line = ""
+        for chord, text, width in self.get_layout():
+            if chord is not None:
+                # add whitespace to lyrics if the previous chord would otherwise run into this one
+                if len(chord_line) > 0 and len(chord_line) >= len(lyric_line):
+                    lyric_line += " " * (len(chord_line) + 1 - len(lyric_line))
+                chord_line = chord_line.ljust(len(lyric_line)) + notes.transpose(chord)
+            lyric_line += text.ljust(width)
+        lyric_line = lyric_line.rstrip()
+        return chord_line + "\n" + lyric_line if len(chord_line) > 0 else lyric_line
 
     def is_break(self) -> bool:
         return False
 
     def __str__(self):
-        return "".join(str(c) for c in self.characters)
+        output = []
+        start = 0
+        for offset, chord in zip(self.offsets, self.chords):
+            output.append(self.text[start:offset] + "[" + str(chord) + "]")
+            start = offset
+        output.append(self.text[start:])
+        return "".join(output)
 
 
-class Character:
-    """
-    Class representing a single character, possibly with a chord
-    """
-    def __init__(self, c: str, chord: "Chord"=None):
-        """
-        :param c: str representing a single character or empty string
-        :param chord: Chord representing a chord, to be played at that character
-        """
-        assert len(c) <= 1  # should be at most length 1, since it is a character
-        self.char = c
-        self.chord = chord
+class Chord:
+    __slots__ = ("chord",)
 
-    def get_char(self) -> str:
-        """
-        :return: str representing character represented by instance
-        """
-        return self.char
+    __interned = {}  # type: Dict[str, Chord]
 
-    def has_chord(self) -> bool:
-        """
-        :return: True if instance has chord, or False otherwise
-        """
-        return self.chord is not None
-
-    def generate_chordsheet(self, notes: "Notes") -> str:
+    def __init__(self, chord: str):
         """
-        Create LaTeX chordsheet output of character, with chord if existing.
-        :param notes: Notes object used to transpose chord
-        :return: str representing LaTeX chordsheet representation of character and chord
+        :param chord: str representing chord
         """
-        return self.char if not self.has_chord() else self.chord.generate_chordsheet(notes) + self.char
-
-    def get_len_transposed_chord(self, notes: "Notes") -> int:
-        if self.has_chord():
-            return len(notes.transpose(self.chord))
+        self.chord = chord
 
-    def __str__(self):
+    @staticmethod
+    def intern(chord: str) -> "Chord":
         """
-        :return: str representing character and chord in human-friendly form
+        Get the shared Chord instance for a chord, so that repeated chords across lines and songs are stored once.
+        :param chord: str representing chord
+        :return: Chord representing chord
         """
-        return self.char if not self.has_chord() else "[" + str(self.chord) + "]" + self.char
+        if chord not in Chord.__interned:
+            Chord.__interned[chord] = Chord(chord)
+        return Chord.__interned[chord]
 
-
-class Chord:
-    def __init__(self, chord: str):
+    def __reduce__(self):
         """
-        :param chord: str representing chord
+        :return: tuple telling pickle to restore the chord through intern, so unpickled songs share Chord instances
         """
-        self.chord = chord
+        return Chord.intern, (self.chord,)
 
     @staticmethod
     def convert(chord: str) -> str:
@@ -502,11 +680,7 @@ class Chord:
         :param chord: str representing chord in music text notation
         :return: chord in LaTeX notation.
         """
-        new_chord = ""
-        for i in range(len(chord)):
-            # convert sharp ("#") to "\s " or otherwise preserve character of chord
-            new_chord += chord[i] if chord[i] != "#" else "\\s "
-        return new_chord
+        return chord.replace("#", "\\s ")
 
     def generate_chordsheet(self, notes: "Notes") -> str:
         """
@@ -541,8 +715,12 @@ class Notes:
     Class representing a transposition class from one key to another. When Notes instance is defined, keys are
     configured with the object, and the old and new keys are used to transpose notes or chords appropriately.
 
-    Transposition occurs by maintaining internal representations of sharp and flat keys.
+    Transposition occurs by maintaining internal representations of sharp and flat keys. For every pair of input and
+    output spellings, a table mapping each note to its transposition by each number of semitones is precomputed, and
+    transposed chords are memoized, so transposing a chord is usually a single lookup.
     """
+    __slots__ = ("__input_spelling", "__output_spelling", "__semitones_up")
+
     notes_sharp = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
     notes_flat = ["C", "Db", "D", "Eb", "E", "F", "Gb", "G", "Ab", "A", "Bb", "Cb"]
 
@@ -550,6 +728,15 @@ class Notes:
 
     sharp_keys = {"C", "G", "D", "A", "E", "B", "F#", "C#", "G#", "D#", "A#"}
     flat_keys = {"F", "Bb", "Eb", "Ab", "Db", "Gb"}
+    all_keys = ["C", "Db", "D", "Eb", "E", "F", "F#", "G", "Ab", "A", "Bb", "B"]  # conventional spelling of each key
+
+    notes_by_spelling = {"sharp": notes_sharp, "flat": notes_flat}
+
+    # note_maps[(input spelling, output spelling)][semitones up] maps each input note to its transposed output note
+    note_maps = {}  # type: Dict[Tuple[str, str], List[Dict[str, str]]]
+
+    TRANSPOSE_CACHE_SIZE = 4096
+    NOTE_REGEX = re.compile("[A-G][#b]?")  # base note of chord, with proceeding sharp or flat if any
 
     def __init__(self, input_key: str, output_key: str):
         """
@@ -559,17 +746,17 @@ class Notes:
         """
         # store input key based on internal representation
         if Notes.is_sharp_key(input_key):
-            self.__input_notes = Notes.notes_sharp
+            self.__input_spelling = "sharp"
         elif Notes.is_flat_key(input_key):
-            self.__input_notes = Notes.notes_flat
+            self.__input_spelling = "flat"
         else:
             raise ValueError(str(input_key) + " not supported in Notes constructor input type.")
 
         # store output key based on internal representation
         if Notes.is_sharp_key(output_key):
-            self.__output_notes = Notes.notes_sharp
+            self.__output_spelling = "sharp"
         elif Notes.is_flat_key(output_key):
-            self.__output_notes = Notes.notes_flat
+            self.__output_spelling = "flat"
         else:
             raise ValueError(str(output_key) + " not supported in Notes constructor for output type.")
 
@@ -591,6 +778,29 @@ class Notes:
         """
         return key in Notes.flat_keys
 
+    @staticmethod
+    def build_note_maps() -> Dict[Tuple[str, str], List[Dict[str, str]]]:
+        """
+        Precompute transposition of every note, for every pair of input and output spellings and every number of
+        semitones up.
+        :return: dict mapping (input spelling, output spelling) to a list, indexed by semitones up, of dicts mapping
+        input notes to output notes
+        """
+        note_maps = {}
+        for input_spelling, input_notes in Notes.notes_by_spelling.items():
+            for output_spelling, output_notes in Notes.notes_by_spelling.items():
+                note_maps[(input_spelling, output_spelling)] = [
+                    {note: output_notes[(index + semitones_up) % len(output_notes)]
+                     for index, note in enumerate(input_notes)}
+                    for semitones_up in range(len(output_notes))]
+        return note_maps
+
+    def get_semitones_up(self) -> int:
+        """
+        :return: int representing number of semitones notes are translated up
+        """
+        return self.__semitones_up
+
     def __get_semitones_up(self, old_key: str, new_key: str) -> int:
         """
         Get number of semitones to move from old key to new key. Positive denotes that the new key is higher, and
@@ -599,35 +809,40 @@ class Notes:
         :param new_key: str representing output key, as a single letter and denotation of sharp (#) or flat (b).
         :return: int representing number of semitones to translate notes up
         """
-        return (self.__output_notes.index(new_key) - self.__input_notes.index(old_key)) % len(self.__output_notes)
+        input_notes = Notes.notes_by_spelling[self.__input_spelling]
+        output_notes = Notes.notes_by_spelling[self.__output_spelling]
+        return (output_notes.index(new_key) - input_notes.index(old_key)) % len(output_notes)
 
-    def __transpose(self, note: str) -> str:
-        """
-        Transpose a single note by the stored semitones up.
-        :param note: str representing a note to be transposed, where the note should be among the internal input notes
-        (sharp or flat based on the input key).
-        :return: str representing the note after it is transposed
+    @staticmethod
+    @lru_cache(maxsize=TRANSPOSE_CACHE_SIZE)
+    def transpose_chord(chord: str, input_spelling: str, semitones_up: int, output_spelling: str) -> str:
+        """
+        Transpose a chord by a number of semitones up. Results are memoized.
+        :param chord: str representing a chord to be transposed, whose notes should be among the notes of the input
+        spelling
+        :param input_spelling: str representing spelling of input notes ("sharp" or "flat")
+        :param semitones_up: int representing number of semitones to translate notes up
+        :param output_spelling: str representing spelling of output notes ("sharp" or "flat")
+        :return: str representing the chord after it is transposed
         """
-        index = self.__input_notes.index(note)  # index of old note
-        return self.__output_notes[(index + self.__semitones_up) % len(self.__output_notes)]
+        note_map = Notes.note_maps[(input_spelling, output_spelling)][semitones_up]
+
+        def transpose_note(match) -> str:
+            note = match.group(0)
+            if note not in note_map:
+                raise ValueError(note + " is not a valid note for a key with " + input_spelling + "s.")
+            return note_map[note]
+
+        # transfer characters other than base notes over without transposition (e.g. any of "maj7" in "Gmaj7")
+        return Notes.NOTE_REGEX.sub(transpose_note, chord)
 
     def transpose(self, chord: Chord) -> str:
         """
         Transpose a chord by the stored semitones up.
-        :param chord: str representing a chord to be transposed
+        :param chord: Chord or str representing a chord to be transposed
         :return: str representing the chord after it is transposed
         """
-        new_chord = ""
-        i = 0
-        while i < len(chord):  # iterate through chord
-            if chord[i] in "ABCDEFG":  # base note of chord
-                if i + 1 < len(chord) and chord[i + 1] in {"#", "b"}:  # transpose note with proceeding sharp or flat
-                    new_chord += self.__transpose(chord[i:i + 2])
-                    i += 2
-                else:  # transpose note on its own
-                    new_chord += self.__transpose(chord[i])
-                    i += 1
-            else:  # transfer character over to new chord without transposition (e.g. any of "maj7" in "Gmaj7")
-                new_chord += chord[i]
-                i += 1
-        return new_chord
+        return Notes.transpose_chord(str(chord), self.__input_spelling, self.__semitones_up, self.__output_spelling)
+
+
+Notes.note_maps = Notes.build_note_maps()
@@ -6,7 +6,6 @@ file: create_key.py
 Used to generate GPG public/private key pair.
 """
 
-import gnupg
 from utils.encrypt import GNUPG_HOME, KEY_FILE, KEY_PASSPHRASE
 import argparse
 
@@ -15,6 +14,8 @@ if __name__ == '__main__':
     parser.add_argument("--user", dest="gpg_user", help="gnupg user used to create key", default=None)
     args = parser.parse_args()
 
+    import gnupg
+
     # generate key
     gpg = gnupg.GPG(gnupghome=GNUPG_HOME)
     input_data = gpg.gen_key_input(name_email=args.gpg_user, passphrase=KEY_PASSPHRASE, key_type="RSA", key_length=2048)
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+"""
+file: dedup.py
+
+Detection of near-duplicate songs in a library of raw chordsheets, such as the same song saved under two names, or a
+rearranged copy with small lyric edits. Each song is reduced to a set of shingles: runs of LYRIC_SHINGLE_LENGTH
+consecutive words of lyrics, and runs of CHORD_SHINGLE_LENGTH consecutive chords named by scale degree (so that copies
+in different keys match), each within a section. The Jaccard similarity of the shingle sets of two songs is estimated
+from a MinHash signature of each set. Signatures are computed by one permutation hashing: each shingle is hashed once,
+into one of SIGNATURE_LENGTH bins which each keep their minimum, and each empty bin is filled from the first bin which
+is not in a fixed pseudorandom order of bins for that bin. Signatures are then split into bands of r values, and songs
+which agree on a whole band fall into the same bucket, so candidate pairs are found without comparing every pair of
+songs: with b bands, a pair with similarity s is a candidate with probability 1 - (1 - s^r)^b. Pairs are reported by
+their overlap: the fraction of the shingles of the smaller song which the other shares, which is never less than their
+similarity, but stays high when one song is sung within a longer medley. The widest bands which still find most pairs
+with the threshold overlap (and sizes up to CANDIDATE_SIZE_RATIO apart) are used, as wider bands let fewer dissimilar
+pairs through. Candidates are then scored exactly and compared section by section.
+"""
+
+import random
+import difflib
+import hashlib
+from collections import defaultdict
+from classes import Notes, Section, Song
+from search_index import get_section_degrees, get_semitone, tokenize
+from song_cache import SongCache
+from typing import List, Set, Tuple
+
+LYRIC_SHINGLE_LENGTH = 3  # words
+CHORD_SHINGLE_LENGTH = 4  # chords
+LYRIC_SHINGLE_PREFIX = "lyrics:"
+CHORD_SHINGLE_PREFIX = "chords:"
+SIGNATURE_LENGTH = 128
+BAND_ROWS = [8, 4, 2, 1]  # values per band to choose from, each dividing SIGNATURE_LENGTH
+CANDIDATE_PROBABILITY = 0.8  # minimum probability that a pair at the threshold is a candidate
+CANDIDATE_SIZE_RATIO = 1.5  # maximum ratio of shingles of the larger to the smaller song for which that holds
+EMPTY_BIN = 1 << 64  # greater than any value a shingle hashes to
+BORROW_SEED = 0
+DEFAULT_THRESHOLD = 0.35  # overlap; e.g. a song repeated within a medley with a chorus of its own
+ESTIMATE_MARGIN = 0.15  # over three standard deviations of the estimate; candidates estimated lower are not scored
+SECTION_MATCH_RATIO = 0.5  # similarity above which differently named sections are compared
+DIFF_KEY = "C"  # key in which sections are compared, so copies in different keys only differ in their lyrics
+
+
+def get_borrow_orders() -> List[List[int]]:
+    """
+    :return: List[List[int]] representing, for each bin of a signature, the order in which the other bins are tried to
+    fill it if it is empty; the same for every song, so that two songs agree on a filled bin exactly when they agree on
+    the bin it was filled from
+    """
+    generator = random.Random(BORROW_SEED)
+    orders = []
+    for b in range(SIGNATURE_LENGTH):
+        order = [other for other in range(SIGNATURE_LENGTH) if other != b]
+        generator.shuffle(order)
+        orders.append(order)
+    return orders
+
+
+BORROW_ORDERS = get_borrow_orders()
+
+
+def get_shingles(song: Song) -> Set[str]:
+    """
+    :param song: Song to reduce to shingles
+    :return: Set[str] representing lyric shingles (starting with LYRIC_SHINGLE_PREFIX) and chord shingles (starting
+    with CHORD_SHINGLE_PREFIX) of song; a section shorter than a shingle is a single shingle
+    """
+    shingles = set()
+    key_semitone = get_semitone(song.get_key())
+    for section in song.get_sections().values():
+        words = [word for line in section.lines for word in tokenize(line.get_lyrics())]
+        degrees = get_section_degrees(section, key_semitone) if key_semitone is not None else []
+        for prefix, sequence, length in [(LYRIC_SHINGLE_PREFIX, words, LYRIC_SHINGLE_LENGTH),
+                                         (CHORD_SHINGLE_PREFIX, degrees, CHORD_SHINGLE_LENGTH)]:
+            for i in range(max(len(sequence) - length + 1, 1) if len(sequence) > 0 else 0):
+                shingles.add(prefix + " ".join(sequence[i:i + length]))
+    return shingles
+
+
+def get_signature(shingles: Set[str]) -> List[int]:
+    """
+    :param shingles: Set[str] representing shingles of song
+    :return: List[int] representing MinHash signature of shingles, of length SIGNATURE_LENGTH, or None if there are no
+    shingles
+    """
+    if len(shingles) == 0:
+        return None
+    signature = [EMPTY_BIN] * SIGNATURE_LENGTH
+    for shingle in shingles:
+        h = int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+        b, value = h % SIGNATURE_LENGTH, h // SIGNATURE_LENGTH
+        if value < signature[b]:
+            signature[b] = value
+
+    # borrowing from a pseudorandom bin rather than a neighbour keeps the bins of a small set independent, so that a
+    # single shared shingle does not fill a whole band
+    minimums = list(signature)
+    for b in range(SIGNATURE_LENGTH):
+        if minimums[b] == EMPTY_BIN:
+            signature[b] = next(minimums[other] for other in BORROW_ORDERS[b] if minimums[other] != EMPTY_BIN)
+    return signature
+
+
+def estimate_similarity(first: List[int], second: List[int]) -> float:
+    """
+    :param first: List[int] representing MinHash signature of a set
+    :param second: List[int] representing MinHash signature of another set
+    :return: float representing estimated Jaccard similarity of the two sets
+    """
+    return sum(1 for a, b in zip(first, second) if a == b) / SIGNATURE_LENGTH
+
+
+def get_similarity(first: Set[str], second: Set[str]) -> float:
+    """
+    :param first: Set[str] representing shingles of a song
+    :param second: Set[str] representing shingles of another song
+    :return: float representing Jaccard similarity of the two sets, or 0.0 if both are empty
+    """
+    union = len(first | second)
+    return len(first & second) / union if union > 0 else 0.0
+
+
+def get_similarity_bound(overlap: float, smaller: int, larger: int) -> float:
+    """
+    :param overlap: float representing overlap of a pair of songs
+    :param smaller: int representing number of shingles of the smaller song
+    :param larger: int representing number of shingles of the larger song
+    :return: float representing similarity of the pair if its overlap is overlap; it is at least overlap exactly when
+    its similarity is at least the returned value
+    """
+    shared = overlap * smaller
+    return shared / (smaller + larger - shared)
+
+
+def get_band_rows(threshold: float) -> int:
+    """
+    :param threshold: float representing minimum similarity of pairs to find (e.g. as returned by
+    get_similarity_bound)
+    :return: int representing number of values per band of a signature, the largest of BAND_ROWS for which a pair
+    with similarity threshold is a candidate with probability at least CANDIDATE_PROBABILITY
+    """
+    for rows in BAND_ROWS:
+        if 1 - (1 - threshold ** rows) ** (SIGNATURE_LENGTH // rows) >= CANDIDATE_PROBABILITY:
+            return rows
+    return BAND_ROWS[-1]
+
+
+def find_candidates(signatures: List[List[int]], rows: int) -> Set[Tuple[int, int]]:
+    """
+    :param signatures: List[List[int]] representing MinHash signature of each song, or None for a song without one
+    :param rows: int representing number of values per band
+    :return: Set[Tuple[int, int]] representing indices (in increasing order) of every pair of songs whose signatures
+    agree on a whole band
+    """
+    buckets = defaultdict(list)
+    for i, signature in enumerate(signatures):
+        if signature is None:
+            continue
+        for band in range(0, SIGNATURE_LENGTH, rows):
+            buckets[(band, tuple(signature[band:band + rows]))].append(i)
+    candidates = set()
+    for songs in buckets.values():
+        for j in range(1, len(songs)):
+            for i in range(j):
+                candidates.add((songs[i], songs[j]))
+    return candidates
+
+
+def get_section_lines(section: Section, notes: Notes) -> List[str]:
+    """
+    :param section: Section to render
+    :param notes: Notes transposing from the key of the song into DIFF_KEY
+    :return: List[str] representing lines of plain text of section, with chords above lyrics, as compared
+    """
+    lines = []
+    for line in section.lines:
+        if line.is_break():
+            continue
+        try:
+            text = line.generate_text(notes)
+        except ValueError:  # chord spelled outside the key; compare the lyrics only
+            text = line.get_lyrics()
+        lines.extend(l.rstrip() for l in text.split("\n"))
+    return lines
+
+
+def compare_sections(first: Song, second: Song) -> List[Tuple[str, str, str, List[str]]]:
+    """
+    Compare the sections of two songs, in DIFF_KEY. Sections are matched by content, most similar first (and sections
+    with the same name first among equally similar ones), as names such as "Verse 1" say little about what is sung.
+    :param first: Song
+    :param second: Song to compare first to
+    :return: List of tuples (status, name in first song or None, name in second song or None, lines of diff) in order
+    of the sections of the first song, then of the sections only in the second song. Status is "=" for sections which
+    are the same, "~" for sections which differ, "-" for sections only in the first song and "+" for sections only in
+    the second song.
+    """
+    texts = []
+    for song in [first, second]:
+        notes = Notes(song.get_key(), DIFF_KEY)
+        texts.append({name: get_section_lines(section, notes) for name, section in song.get_sections().items()})
+    first_texts, second_texts = texts
+
+    matches = {}
+    ratios = sorted(((difflib.SequenceMatcher(None, "\n".join(first_lines), "\n".join(second_lines)).ratio(), a == b,
+                      a, b) for a, first_lines in first_texts.items() for b, second_lines in second_texts.items()),
+                    reverse=True)
+    matched = set()
+    for ratio, _, a, b in ratios:
+        if ratio < SECTION_MATCH_RATIO:
+            break
+        if a not in matches and b not in matched:
+            matches[a] = b
+            matched.add(b)
+
+    comparison = []
+    for a, lines in first_texts.items():
+        if a not in matches:
+            comparison.append(("-", a, None, []))
+            continue
+        b = matches[a]
+        if lines == second_texts[b]:
+            comparison.append(("=", a, b, []))
+        else:
+            diff = [line for line in difflib.unified_diff(lines, second_texts[b], lineterm="", n=0)
+                    if not line.startswith("@@")][2:]  # without file names and line numbers
+            comparison.append(("~", a, b, diff))
+    comparison.extend(("+", None, b, []) for b in second_texts if b not in matched)
+    return comparison
+
+
+def find_duplicates(files: List[str], threshold: float=DEFAULT_THRESHOLD, song_cache: SongCache=None) -> \
+        Tuple[List[dict], int]:
+    """
+    :param files: List[str] representing paths to every raw chordsheet in the library
+    :param threshold: float representing minimum overlap of a pair of songs to report
+    :param song_cache: SongCache used to reuse earlier parses, or None to always parse
+    :return: Tuple representing, for each pair of songs whose overlap is at least threshold (highest overlap first), a
+    dict with the path and title of both songs, their similarity, the similarity of their lyrics and of their chords
+    alone, their overlap: the fraction of the shingles of the smaller song which the other shares (e.g. 1.0 if one song
+    is sung whole within a medley which is the other), and their comparison by section, as returned by
+    compare_sections; and the number of candidate pairs compared
+    """
+    from generate_music import p_warning, parse_cached
+
+    paths = []
+    signatures = []
+    sizes = []
+    for path in files:
+        try:
+            _, song = parse_cached(path, song_cache)
+        except Exception as e:
+            p_warning("Cannot read {}: {}: {}".format(path, type(e).__name__, e))
+            continue
+        shingles = get_shingles(song)
+        paths.append(path)
+        signatures.append(get_signature(shingles))
+        sizes.append(len(shingles))
+    candidates = find_candidates(signatures, get_band_rows(get_similarity_bound(threshold, 1, CANDIDATE_SIZE_RATIO)))
+
+    songs = {}  # shingles are not kept for every song; only candidates are parsed again, to be scored exactly
+    duplicates = []
+    for i, j in sorted(candidates):
+        bound = get_similarity_bound(threshold, min(sizes[i], sizes[j]), max(sizes[i], sizes[j]))
+        if estimate_similarity(signatures[i], signatures[j]) < bound - ESTIMATE_MARGIN:
+            continue
+        for k in [i, j]:
+            if k not in songs:
+                header, song = parse_cached(paths[k], song_cache)
+                songs[k] = (header, song, get_shingles(song))
+        (first_header, first, first_shingles), (second_header, second, second_shingles) = songs[i], songs[j]
+        overlap = len(first_shingles & second_shingles) / min(len(first_shingles), len(second_shingles))
+        if overlap < threshold:
+            continue
+        similarities = {}
+        for kind, prefix in [("lyrics", LYRIC_SHINGLE_PREFIX), ("chords", CHORD_SHINGLE_PREFIX)]:
+            similarities[kind] = get_similarity({s for s in first_shingles if s.startswith(prefix)},
+                                                {s for s in second_shingles if s.startswith(prefix)})
+        duplicates.append({"first": paths[i], "first_title": first_header.get("song", ""),
+                           "second": paths[j], "second_title": second_header.get("song", ""),
+                           "similarity": get_similarity(first_shingles, second_shingles),
+                           "lyrics": similarities["lyrics"], "chords": similarities["chords"], "overlap": overlap,
+                           "sections": compare_sections(first, second)})
+    duplicates.sort(key=lambda duplicate: (-duplicate["overlap"], -duplicate["similarity"], duplicate["first"],
+                                           duplicate["second"]))
+    return duplicates, len(candidates)
@@ -6,8 +6,6 @@ file: encrypt.py
 Utility to encrypt your password using gnupg.
 """
 
-import gnupg
-from getpass import getpass
 import os
 import json
 import argparse
@@ -38,6 +36,10 @@ KEY_PASSPHRASE = "passphrase"  # gg
 
 
 if __name__ == '__main__':
+    # only needed when run as a script, not by modules importing the constants above
+    import gnupg
+    from getpass import getpass
+
     # if user wants, can enter in a different username as used to generate the key rather than the email address
     # used for the ccli password
     parser = argparse.ArgumentParser()
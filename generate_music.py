@@ -8,52 +8,47 @@ instructions.
 """
 
 import os
+import re
 import sys
+import glob
+import time
+import argparse
+import traceback
 from string import Template
-from subprocess import run
-import requests
-from pprint import pprint
 import shutil
-from headers import CHORDSHEET_HEADER, SLIDES_HEADER
-from classes import *
+from headers import CHORDSHEET_HEADER, CHORDSHEET_PREAMBLE, SLIDES_HEADER, SLIDES_PREAMBLE, SONGBOOK_HEADER, \
+    SONGBOOK_SONG_HEADER
+from build import BuildState, BUILD_STATE_FILE, TEMPLATE_DIRECTORY, file_digest, fingerprint, template_files, \
+    write_if_changed
+from latex_format import END_OF_PREAMBLE, build_format
+from rasterize import get_renderer
+from slide_cache import SLIDE_CACHE_DIRECTORY
+from scheduler import Job, JobScheduler
+from song_cache import MemorySongCache, SongCache, SONG_CACHE_DIRECTORY
+from timing import PROFILE_FILE, TRACER, span, write_profile
+from watcher import DEFAULT_DEBOUNCE, DEFAULT_POLL_INTERVAL, open_watcher
+from ccli import CCLICache, CCLI_CACHE_DIRECTORY, CCLI_LOGIN_URL, CCLI_METADATA_FIELDS, DEFAULT_NEGATIVE_TTL, DEFAULT_TTL, \
+    SONGSELECT_REQUEST_HEADERS, SONGSELECT_SONG_URL, LoginError, is_login_page, login, parse_song_page, prefetch
+from chordsheet_parser import DEFAULT_HEADER, DEFAULT_KEY, parse, read_ccli_number
+from classes import Notes, Song
 import json
-from getpass import getpass
+from typing import Callable, Dict, Iterable, Iterator, List, TextIO, Tuple, Union
+
+# requests, getpass, pprint, cProfile, tempfile and the process pool are imported where they are used, so that runs
+# which do not need them (e.g. a transposition with no CCLI lookup) start faster
 
 # Global constants
 MAX_COMPOSER_FIELD_LENGTH = 40
-DEFAULT_KEY = "C"
+JOB_LOG_TAIL_LINES = 20  # lines of output shown for failed jobs
+SECONDS_PER_DAY = 24 * 60 * 60
+ALL_KEYS_ARGUMENT = "all"  # key argument requesting a chordsheet in every key
 CONFIG_FILENAMES = ["configuration.json", "CONFIGURATION"]
-CCLI_LOGIN_URL = "https://profile.ccli.com/account/signin?appContext=SongSelect&returnUrl=https%3a%2f%2fsongselect.ccli.com%2f"
-
-DEFAULT_HEADER = {
-    "composer": "Unknown Artist",
-    "ccli": "N/A",
-    "bpm": "Unknown",
-    "signature": "Unknown signature",
-    "verse": "N/A",
-    "arranger": "Unknown Arranger",
-    "year": "",
-    "publisher": "Unknown Publisher"
-}
-
-# Regex strings
-SONG_TAG_REGEX = "^<song> ([a-zA-Z0-9 :,'()/-]+)$"
-CCLI_TAG_REGEX = "^<ccli> ([0-9/ ]+|N/A)$"
-COMPOSER_TAG_REGEX = "^<composer> ([a-zA-Z0-9 ,-.]+)$"
-KEY_TAG_REGEX = "^<key> ([A-G][#b]? major|minor)$"
-BPM_TAG_REGEX = "^<bpm> ((?:[0-9]+)|\?)$"
-SIGNATURE_TAG_REGEX = "^<signature> ((?:[0-9]+/[0-9]+)|\?)"
-VERSE_TAG_REGEX = "^<verse> ([a-zA-Z0-9 :,-]+|N/A)$"
-ARRANGER_TAG_REGEX = "^<arranger> ([a-zA-Z0-9 -]+)$"
-PUBLISHER_TAG_REGEX = "^<publisher> ([a-zA-Z0-9 ,.!'/-]+|N/A)$"
-YEAR_TAG_REGEX = "^<year> ([0-9]+|N/A)$"
-ARTIST_CCLI_REGEX = r"<ul class=\"authors\">[a-zA-Z0-9 '\/\n\r?=_\"<>-]+<\/ul>"
-GET_ARTISTS_REGEX = r"<a href=[a-zA-Z0-9 '\/?=_\"-]+>([a-zA-Z '-]+)<\/a>\r\n[ ]*"
-YEAR_CCLI_REGEX = r"<ul class=\"song-meta-list\">\r\n[ ]*<li>Copyrights<\/li>\r\n[ ]*[a-zA-Z0-9 !'\/\n\r?=_\"<>-]+<\/ul>"
-GET_YEAR_REGEX = r"<li>([0-9]+) [a-zA-Z0-9 ]+<\/li>"
-PUBLISHER_CCLI_REGEX = r"<ul class=\"song-meta-list\">\r\n[ ]*<li>Copyrights<\/li>\r\n[ ]*[a-zA-Z0-9 !'\/\n\r?=_\"<>-]+<\/ul>"
-GET_PUBLISHERS_REGEX = r"<li>[0-9 ]*([a-zA-Z0-9 !]+)<\/li>"
-
+GENERATOR_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), f)
+                   for f in ["classes.py", "headers.py", "latex_format.py"]]  # source files which determine LaTeX
+PARSER_VERSION = 1  # bump when the parse result changes in a way not visible in the parser source files
+PARSER_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), f)
+                for f in ["chordsheet_parser.py", "classes.py"]]  # source files which determine parse results
+RASTERIZE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rasterize.py")
 
 def p_warning(*args):
     """
@@ -135,116 +130,56 @@ def get_variables(filename: str):
     return directories, account_info
 
 
-def parse(filename: str):
+def get_parser_version() -> str:
     """
-    Main function for parsing a raw chordsheet, including parsing the header information, the section order, and the
-    chords and lyrics themselves.
+    :return: str representing version of the parser, which changes whenever PARSER_VERSION or the parser source does
+    """
+    return fingerprint(values=[PARSER_VERSION], files=PARSER_FILES)
+
+
+def parse_cached(filename: str, song_cache: SongCache=None):
+    """
+    Parse a raw chordsheet, reusing the result of an earlier parse of the same content if one is cached.
     :param filename: str representing name of raw chordsheet file
-    :return: list representing [header data (dict), instance of a Song (Song)]
+    :param song_cache: SongCache in which parse results are looked up and stored, or None to always parse
+    :return: list representing [header data (dict), instance of a Song (Song)], as returned by parse
     """
-    def verify_data(header_data: dict):
-        """
-        Checks for minimal data found in header. If no song title or key is found, an error will be thrown.
-        :param header_data: dict representing the header data, with tags stored as keys
-        :return: True if successful
-        """
-        if "song" not in header_data:
-            raise ValueError("File must include a song title, but no <song> tag was found.")
-        if "major_minor" not in header_data:
-            raise ValueError("File must include a key, but no <key> tag was found.")
-        return True
-
-    # initialize variables
-    header_data = dict(DEFAULT_HEADER)
-    sections = {}
-    lines = []
-    order = []
-    old_key = DEFAULT_KEY
-    section_name = None
-
-    # read file
-    with open(filename, "r") as f:
-        mode = ParseMode.NORMAL  # initialize mode
-        content = f.readlines()
-
-        # iterate through lines
-        for l in content:
-            # NORMAL mode
-            if mode == ParseMode.NORMAL:
-                # check header
-                # <song>
-                if re.match(SONG_TAG_REGEX, l):
-                    header_data["song"] = re.match(SONG_TAG_REGEX, l).group(1)
-                # <ccli>
-                elif re.match(CCLI_TAG_REGEX, l):
-                    header_data["ccli"] = re.match(CCLI_TAG_REGEX, l).group(1)
-                # <composer> (i.e. artist)
-                elif re.match(COMPOSER_TAG_REGEX, l):
-                    header_data["composer"] = re.match(COMPOSER_TAG_REGEX, l).group(1)
-                # <key> (of raw chordsheet)
-                elif re.match(KEY_TAG_REGEX, l, re.IGNORECASE):
-                    key_info = re.match(KEY_TAG_REGEX, l, re.IGNORECASE).group(1)
-                    old_key = key_info.split(" ")[0]
-                    header_data["major_minor"] = key_info.split(" ")[1]
-                    if header_data["major_minor"].lower() == "major":
-                        header_data["major_minor"] = "Major"
-                # <bpm>
-                elif re.match(BPM_TAG_REGEX, l):
-                    header_data["bpm"] = int(re.match(BPM_TAG_REGEX, l).group(1))
-                # <signature> (e.g. 4/4, 6/8)
-                elif re.match(SIGNATURE_TAG_REGEX, l):
-                    header_data["signature"] = re.match(SIGNATURE_TAG_REGEX, l).group(1)
-                # <verse>
-                elif re.match(VERSE_TAG_REGEX, l):
-                    header_data["verse"] = re.match(VERSE_TAG_REGEX, l).group(1)
-                # <arranger>
-                elif re.match(ARRANGER_TAG_REGEX, l):
-                    header_data["arranger"] = re.match(ARRANGER_TAG_REGEX, l).group(1)
-                # <publisher>
-                elif re.match(PUBLISHER_TAG_REGEX, l):
-                    header_data["publisher"] = re.match(PUBLISHER_TAG_REGEX, l).group(1)
-                # <year>
-                elif re.match(YEAR_TAG_REGEX, l):
-                    header_data["year"] = re.match(YEAR_TAG_REGEX, l).group(1)
-
-                # switch to ORDER mode
-                elif re.match("^<order>", l):
-                    mode = ParseMode.ORDER
-
-                # switch to SECTION mode
-                elif re.match("^<([a-zA-Z0-9 ]+)>$", l):
-                    mode = ParseMode.SECTION
-                    lines = []
-                    section_name = re.match("^<([a-zA-Z0-9 ]+)>", l).group(1)
-
-            # ORDER mode
-            elif mode == ParseMode.ORDER:
-                if l == "\n":  # terminal character
-                    mode = ParseMode.NORMAL
-                else:  # parse ordering of sections
-                    match = re.match("^([a-zA-Z0-9 ]+?)( \(x?(\\d)+x?\))?$", l)
-                    name = match.group(1)
-                    frequency = int(match.group(3)) if match.group(3) is not None else 1
-                    order.append((name, frequency))
-
-            # SECTION mode
-            elif mode == ParseMode.SECTION:
-                if l == "\n":  # terminal character
-                    mode = ParseMode.NORMAL
-                    sections[section_name] = (Section(section_name, lines))
-                    section_name = None
-                else:  # collect lines to be parsed by Section constructor later
-                    lines.append(Line.parse(l))
-
-        if mode == ParseMode.SECTION:  # section ended without sole newline
-            sections[section_name] = (Section(section_name, lines))
-
-    verify_data(header_data)  # verify that the header data has the minimal amount needed to generate the song
-
-    return header_data, Song(sections, order, old_key)
-
-
-def supplement_header(header: dict, account_info: dict):
+    if song_cache is None:
+        return parse(filename)
+    with open(filename, "rb") as f:
+        content = f.read()
+    result = song_cache.get(content)
+    if result is None:
+        result = parse(filename)
+        song_cache.put(content, result)
+    return result
+
+
+def open_song_cache() -> SongCache:
+    """
+    :return: SongCache in the working directory for the current parser version
+    """
+    return SongCache(SONG_CACHE_DIRECTORY, version=get_parser_version())
+
+
+def open_ccli_cache(ttl: float=DEFAULT_TTL) -> CCLICache:
+    """
+    :param ttl: float representing number of seconds for which CCLI lookups are reused
+    :return: CCLICache in the working directory
+    """
+    return CCLICache(CCLI_CACHE_DIRECTORY, ttl=ttl, negative_ttl=min(ttl, DEFAULT_NEGATIVE_TTL))
+
+
+def is_missing_metadata(header: dict) -> bool:
+    """
+    :param header: dict representing header info, with tags as keys
+    :return: True if any of composer, year, and publisher is not set, so would be looked up on CCLI
+    """
+    return any(header[field] == DEFAULT_HEADER[field] for field in CCLI_METADATA_FIELDS)
+
+
+def supplement_header(header: dict, account_info: dict, interactive: bool=True, ccli_cache: CCLICache=None,
+                      login_url: str=CCLI_LOGIN_URL, song_url: str=SONGSELECT_SONG_URL):
     """
     If information is missing from the header, make a GET request to CCLI to complete the missing information.
     :param header: dict representing header info, with tags as keys. header must contain a CCLI number in order to make
@@ -254,74 +189,50 @@ def supplement_header(header: dict, account_info: dict):
         {"EmailAddress": <email_address>, "Password": <password>}
 
     If the dictionary does not have one of these, the script will prompt the user for entry during execution.
+    :param interactive: bool representing whether the user may be prompted for missing account info; if False, the
+    lookup is skipped instead
+    :param ccli_cache: CCLICache holding earlier lookups; a song found in it is not looked up again (so no login is
+    needed), and new lookups are stored in it. If None, every call looks the song up. Only lookups made after a
+    confirmed login are stored, so a failed login never hides a song's metadata; a song whose page has no metadata is
+    stored as a negative entry, as by ccli.prefetch.
+    :param login_url: str representing URL to which account info is posted to log in
+    :param song_url: str representing URL of song pages, with {} in place of the CCLI number
     :return: dict representing new header
     """
 
-    def parse_artist(html_text: str) -> str:
-        """
-        Parse html response for artist names.
-        :param html_text: str representing html of CCLI page for song.
-        :return: str representing artist names, delimited by commas
-        """
-        # parse HTML for artists
-        m = re.search(ARTIST_CCLI_REGEX, html_text, re.M)
-        if m is not None:
-            artists = re.findall(GET_ARTISTS_REGEX, m.group(0), re.M)
-            if len(artists) > 0:  # artists found
-                return ", ".join(artists)
-            else:  # general tags found, but no artists parsed
-                p_warning("author tags found, but composer not extracted in GET request.")
-                return DEFAULT_HEADER["composer"]
-        p_warning("composer not found in GET request.")
-        return DEFAULT_HEADER["composer"]
-
-    def parse_year(html_text: str) -> int:
-        """
-        Parse html response for publishing year.
-        :param html_text: str representing html of CCLI page for song.
-        :return: int representing year
+    def fill_missing(fields: dict):
         """
-        # parse HTML for year
-        m = re.search(YEAR_CCLI_REGEX, html_text, re.M)
-        if m is not None:
-            match_year = re.search(GET_YEAR_REGEX, m.group(0), re.M)
-            if match_year is not None:  # year found
-                return int(match_year.group(1))
-            else:  # general tags found, but no copyright year parsed
-                p_warning("copyright found, but no year listed in GET request.")
-                return int(DEFAULT_HEADER["year"])
-        p_warning("no copyright tag found in GET request.")
-        return int(DEFAULT_HEADER["year"])
-
-    def parse_publisher(html_text: str) -> str:
+        Fill in fields missing from the new header.
+        :param fields: dict mapping fields in CCLI_METADATA_FIELDS to the value found, or to None if not found
         """
-        Parse html response for publishers.
-        :param html_text: str representing html of CCLI page for song.
-        :return: str representing names of publishers
-        """
-        # parse HTML for publisher
-        m = re.search(PUBLISHER_CCLI_REGEX, html_text, re.M)
-        if m is not None:
-            publishers = re.findall(GET_PUBLISHERS_REGEX, m.group(0), re.M)
-            if len(publishers) > 0:  # publisher found
-                return ", ".join(publishers[1:])
-            else:  # general tag found, but no publishers parsed
-                p_warning("copyright found, but publishers not extracted in GET Request")
-                return DEFAULT_HEADER["publisher"]
-        p_warning("no copyright tag found in GET request.")
-        return DEFAULT_HEADER["publisher"]
+        for field in CCLI_METADATA_FIELDS:
+            if new_header[field] == DEFAULT_HEADER[field]:
+                if fields[field] is not None:
+                    new_header[field] = fields[field]
+                else:
+                    p_warning(field + " not found for CCLI " + header["ccli"] + ".")
 
     new_header = dict(header)
 
     # check if a request should be initiated to the CCLI website
-    if (new_header["composer"] != "Unknown Artist" and
-            new_header["year"] != "" and
-            new_header["publisher"] != "Unknown Publisher"):  # composer, year, and publisher already set
+    if not is_missing_metadata(new_header):  # composer, year, and publisher already set
         return new_header
     elif "ccli" not in header or header["ccli"] == "N/A":  # no CCLI number
         p_warning("no CCLI provided, so skipping lookup...")
         return new_header
 
+    cached_fields = ccli_cache.get(header["ccli"]) if ccli_cache is not None else None
+    if cached_fields is not None:  # looked up recently, so no need to log in
+        fill_missing(cached_fields)
+        return new_header
+
+    elif not interactive and ("EmailAddress" not in account_info or "Password" not in account_info):
+        p_warning("no CCLI account info provided, so skipping lookup...")
+        return new_header
+
+    import requests
+    from getpass import getpass
+
     # Initiate request
     with requests.Session() as s:
         print("Initiating GET request...")
@@ -337,26 +248,30 @@ def supplement_header(header: dict, account_info: dict):
             if len(account_info["Password"]) == 0:
                 return new_header
 
-        s.post(CCLI_LOGIN_URL, account_info)  # login
-
-        # make request to CCLI page for song
-        url = "https://songselect.ccli.com/songs/{}".format(header["ccli"])
-        headers = {'Accept-Encoding': 'identity'}
-        r = s.get(url, headers=headers)
-
-        # debugging
-        # with open("post_response.txt", "w") as f:
-        #     f.write(repr(r.text))
-
-        # parse HTML response for fields missing information
-        if new_header["composer"] == "Unknown Artist":
-            new_header["composer"] = parse_artist(r.text)
-
-        if new_header["year"] == "":
-            new_header["year"] = parse_year(r.text)
-
-        if new_header["publisher"] == "Unknown Publisher":
-            new_header["publisher"] = parse_publisher(r.text)
+        try:
+            login(s, account_info, login_url)
+
+            # make request to CCLI page for song
+            url = song_url.format(header["ccli"])
+            r = s.get(url, headers=SONGSELECT_REQUEST_HEADERS)
+        except (LoginError, requests.RequestException) as e:
+            p_warning("CCLI lookup failed for " + header["ccli"] + ":", e)
+            return new_header
+        if r.status_code == 404:  # no such song; remember that, as for a page without copyright data
+            fields = dict.fromkeys(CCLI_METADATA_FIELDS)
+        elif not r.ok or is_login_page(r.url, login_url):  # a lapsed login is no negative result
+            p_warning("CCLI lookup failed for " + header["ccli"] + " with status {}.".format(r.status_code))
+            return new_header
+        else:
+            # debugging
+            # with open("post_response.txt", "w") as f:
+            #     f.write(repr(r.text))
+
+            # parse HTML response for all fields, so that the lookup can be cached
+            fields = parse_song_page(r.text)
+        if ccli_cache is not None:  # a negative entry (no field found) expires after the cache's negative_ttl
+            ccli_cache.put(header["ccli"], fields)
+        fill_missing(fields)
 
     return new_header
 
@@ -375,13 +290,39 @@ def generate_chordsheet_header(header) -> str:
       "arranger" - name(s) of arranger(s)
     :return: string representing header with substituted values
     """
+    abbreviate_composer(header)
+
+    # generate template and substitute; only the song-specific part follows the precompiled preamble
+    header_template = Template(CHORDSHEET_HEADER)
+    return CHORDSHEET_PREAMBLE + END_OF_PREAMBLE + header_template.substitute(header)
+
+
+def abbreviate_composer(header: dict):
+    """
+    Shorten the composer of a header in place to the first composer, if it is too long for a chordsheet.
+    :param header: dict representing header info, containing "composer"
+    """
     if len(header["composer"]) > MAX_COMPOSER_FIELD_LENGTH:  # abbreviate composer
         composers = header["composer"].split(",")
         header["composer"] = composers[0].strip() + " et. al."
         assert len(header["composer"]) <= MAX_COMPOSER_FIELD_LENGTH
 
-    # generate template and substitute
-    header_template = Template(CHORDSHEET_HEADER)
+
+def generate_songbook_header() -> str:
+    """
+    :return: str representing header of a LaTeX songbook, which defines the song-specific commands set by each song
+    """
+    return CHORDSHEET_PREAMBLE + END_OF_PREAMBLE + SONGBOOK_HEADER
+
+
+def generate_songbook_song_header(header) -> str:
+    """
+    Returns header of a single song in a songbook with substituted values given by header.
+    :param header: a dictionary of tags to values, with the fields expected by generate_chordsheet_header
+    :return: string representing header with substituted values
+    """
+    abbreviate_composer(header)
+    header_template = Template(SONGBOOK_SONG_HEADER)
     return header_template.substitute(header)
 
 
@@ -399,9 +340,9 @@ def generate_slides_header(header) -> str:
     # check that all fields are present
     assert "song" in header and "ccli" in header and "composer" in header and "year" in header and "publisher" in header
 
-    # generate template and substitute
+    # generate template and substitute; only the song-specific part follows the precompiled preamble
     header_template = Template(SLIDES_HEADER)
-    return header_template.substitute(header)
+    return SLIDES_PREAMBLE + END_OF_PREAMBLE + header_template.substitute(header)
 
 
 def generate_chordsheet(song: Song, new_key: str=DEFAULT_KEY) -> str:
@@ -414,6 +355,39 @@ def generate_chordsheet(song: Song, new_key: str=DEFAULT_KEY) -> str:
     return song.generate_chordsheet(new_key)
 
 
+def generate_chordsheets(song: Song, new_keys: List[str]) -> Dict[str, str]:
+    """
+    Returns string representations of generated LaTeX chordsheets in several keys, parsing and laying out the song
+    only once.
+    :param song: Song object representing song for which to generate chordsheets
+    :param new_keys: List[str] representing keys in which to output chordsheets
+    :return: dict mapping each new key to the non-header content of chordsheet output in LaTeX
+    """
+    return song.generate_chordsheets(new_keys)
+
+
+def emit_chordsheet(song: Song, new_key: str=DEFAULT_KEY) -> Iterator[str]:
+    """
+    Returns generated LaTeX chordsheet in new key as a stream of chunks, so it can be written without building the
+    whole document in memory.
+    :param song: Song object representing song for which to generate chordsheet
+    :param new_key: str representing new key in which to output chordsheet
+    :return: Iterator[str] representing chunks of non-header content of chordsheet output in LaTeX
+    """
+    return song.emit_chordsheet(new_key)
+
+
+def parse_keys(keys: str) -> List[str]:
+    """
+    Parse a key argument from the command line.
+    :param keys: str representing a single key, a comma-separated list of keys, or "all" for every key
+    :return: List[str] representing keys
+    """
+    if keys.lower() == ALL_KEYS_ARGUMENT:
+        return list(Notes.all_keys)
+    return [key.strip() for key in keys.split(",") if len(key.strip()) > 0]
+
+
 def generate_slides(song: Song) -> str:
     """
     Returns string representation of generated LaTeX slides.
@@ -423,6 +397,15 @@ def generate_slides(song: Song) -> str:
     return song.generate_slides()
 
 
+def emit_slides(song: Song) -> Iterator[str]:
+    """
+    Returns generated LaTeX slides as a stream of chunks.
+    :param song: Song object representing song for which to generate slides.
+    :return: Iterator[str] representing chunks of non-header content of slide output in LaTeX
+    """
+    return song.emit_slides()
+
+
 def get_chordsheet_destination(path: str, root_filename: str, new_key: str) -> str:
     """
     Generate path at which to save chordsheet.
@@ -444,153 +427,1157 @@ def get_slides_destination(path: str, root_filename: str) -> str:
     return os.path.join(path, root_filename + " - slides.tex")
 
 
-def write_chordsheet(destination: str, header: str, chordsheet: str):
+def emit_document(header: str, body: Union[str, Iterable[str]]) -> Iterator[str]:
+    """
+    Wrap the chunks of a LaTeX body in a complete document.
+    :param header: str representing header info for LaTeX document
+    :param body: str or Iterable[str] representing (chunks of) non-header body of LaTeX document
+    :return: Iterator[str] representing chunks of LaTeX document
+    """
+    yield header
+    yield "\n\\begin{document}\n"
+    if isinstance(body, str):
+        yield body
+    else:
+        yield from body
+    yield "\\end{document}\n"
+
+
+def write_document(stream: TextIO, header: str, body: Union[str, Iterable[str]]):
+    """
+    Write a LaTeX document to any writable text stream, one chunk at a time.
+    :param stream: writable text stream (e.g. an open file or sys.stdout)
+    :param header: str representing header info for LaTeX document
+    :param body: str or Iterable[str] representing (chunks of) non-header body of LaTeX document
     """
-    Write LaTeX chordsheet to file.
+    for chunk in emit_document(header, body):
+        stream.write(chunk)
+
+
+def write_chordsheet(destination: str, header: str, chordsheet: Union[str, Iterable[str]]):
+    """
+    Write LaTeX chordsheet to file, unless the file already has the same content.
     :param destination: str representing path to output LaTeX file
     :param header: str representing header info for LaTeX chordsheet
-    :param chordsheet: str representing non-header body of LaTeX chordsheet
-    :return: True if successful
+    :param chordsheet: str or Iterable[str] representing (chunks of) non-header body of LaTeX chordsheet
+    :return: True if the file was written, or False if it was already up to date
     """
-    with open(destination, "w") as f:
-        f.write(header + "\n")
-        f.write("\\begin{document}\n")
-        f.write(chordsheet)
-        f.write("\\end{document}\n")
-    return True
+    return write_if_changed(destination, emit_document(header, chordsheet))
 
 
-def write_slides(destination, header: str, chordsheet: str):
+def write_slides(destination, header: str, chordsheet: Union[str, Iterable[str]]):
     """
-    Write LaTeX slides to file.
+    Write LaTeX slides to file, unless the file already has the same content.
     :param destination: str representing path to output LaTeX file
     :param header: str representing header info for LaTeX slides
-    :param chordsheet: str representing non-header body of LaTeX slides
-    :return: True if successful
+    :param chordsheet: str or Iterable[str] representing (chunks of) non-header body of LaTeX slides
+    :return: True if the file was written, or False if it was already up to date
+    """
+    return write_if_changed(destination, emit_document(header, chordsheet))
+
+
+def get_pdf_destination(tex_file: str) -> str:
+    """
+    :param tex_file: str representing path to LaTeX file in an output directory
+    :return: str representing path at which the compiled PDF is stored once moved next to the LaTeX file
+    """
+    return tex_file.rpartition(".")[0] + ".pdf"
+
+
+def prepare_formats(build_state: BuildState=None, names: List[str]=("chordsheet", "slides")) -> Dict[str, str]:
+    """
+    Build the precompiled formats of the chordsheet and slides preambles, unless they are up to date.
+    :param build_state: BuildState used to skip building up-to-date formats, or None to always build them
+    :param names: List[str] representing which formats to build, of "chordsheet" and "slides"
+    :return: dict mapping each name to the path of its format, or to None if it could not be built (in which case
+    documents are compiled without it)
     """
-    with open(destination, "w") as f:
-        f.write(header + "\n")
-        f.write("\\begin{document}\n")
-        f.write(chordsheet)
-        f.write("\\end{document}\n")
-    return True
+    preambles = {"chordsheet": CHORDSHEET_PREAMBLE, "slides": SLIDES_PREAMBLE}
+    formats = {}
+    for name in names:
+        with span("format", output=name):
+            formats[name] = build_format(name, preambles[name], build_state=build_state)
+        if formats[name] is None and shutil.which("pdflatex"):
+            p_warning("Could not build LaTeX format for {}; compiling without it.".format(name))
+    return formats
 
 
-def compile(root_filename: str, chordsheet_file: str, slides_file: str):
+def record_job(build_state: BuildState, stage: str, stage_fingerprint, outputs: List[str]):
+    """
+    :param build_state: BuildState in which to record the outcome of a job, or None to only record its timing
+    :param stage: str representing name of stage run by the job
+    :param stage_fingerprint: str representing fingerprint of inputs of stage, or a function returning it, if it can
+    only be computed once the job has finished
+    :param outputs: List[str] representing paths to outputs produced by the job
+    :return: function to pass as on_complete of the job, recording its outcome in the build state and its timing
+    """
+    def on_complete(job: Job):
+        if job.duration is not None:
+            TRACER.add(job.name.partition(" ")[0], job.started, job.duration, kind="subprocess", job=job.name,
+                       returncode=job.returncode)
+        if build_state is not None:
+            if job.succeeded():
+                build_state.update(stage, stage_fingerprint() if callable(stage_fingerprint) else stage_fingerprint,
+                                   outputs)
+            else:
+                build_state.invalidate(stage)
+    return on_complete
+
+
+def compile(root_filename: str, chordsheet_file: Union[str, List[str]], slides_file: str,
+            build_state: BuildState=None, scheduler: JobScheduler=None, formats: Dict[str, str]=None) -> List[Job]:
     """
     Run command-line tools to generate PDFs and PNGs of chordsheet and slides. Runs
 
-    pdflatex --interaction=nonstopmode <chordsheet_file>.tex
-    pdflatex --interaction=nonstopmode <slides_file>.tex
-    convert -verbose -density 300 -geometry 1920x1080 <slides_file>.pdf -quality 100 -sharpen 0x1.0 <slides_file>.png
+    pdflatex --interaction=nonstopmode [-fmt=<chordsheet format>] <chordsheet_file>.tex
+    pdflatex --interaction=nonstopmode [-fmt=<slides format>] <slides_file>.tex
+    python3 rasterize.py <slides_file>.pdf <slides_file>.png
+
+    where rasterize.py renders the slides with pdftoppm, across several processes (all CPUs for a scheduler of its own,
+    or an equal share of them per job of a shared scheduler), or with convert if pdftoppm is not installed, taking
+    frames which are unchanged from the slide cache. The commands are submitted as jobs to a scheduler, so that the
+    pdflatex runs happen concurrently, and rasterization starts as soon as the slides PDF is ready. If a build state is
+    given, each step is skipped when its inputs (the LaTeX file and templates, or the slides PDF) are unchanged since it
+    last succeeded and its outputs still exist.
 
     :param root_filename: str representing root filename
-    :param chordsheet_file: str representing the path to the LaTeX chordsheet file, to be compiled into a PDF
+    :param chordsheet_file: str representing the path to the LaTeX chordsheet file, to be compiled into a PDF, or
+    List[str] representing paths to several chordsheet files (e.g. in different keys)
     :param slides_file: str representing the path to the LaTeX slides file, to be compiled into a PDF and PNGs
+    :param build_state: BuildState used to skip up-to-date steps, or None to always run every step
+    :param scheduler: JobScheduler to submit jobs to, or None to run them on a new scheduler and wait for them here
+    :param formats: dict mapping "chordsheet" and "slides" to the path of their precompiled format (as returned by
+    prepare_formats), or None to compile without formats
+    :return: List[Job] representing the jobs submitted, which have finished if no scheduler was given
     """
+    own_scheduler = scheduler is None
+    if own_scheduler:
+        scheduler = JobScheduler()
+
+    jobs = []
+    templates = template_files()
+
     # generate chordsheet and slide files
-    run(["pdflatex", "--interaction=nonstopmode", chordsheet_file])
-    run(["pdflatex", "--interaction=nonstopmode", slides_file])
+    slides_pdf_job = None
+    chordsheet_files = [chordsheet_file] if isinstance(chordsheet_file, str) else list(chordsheet_file)
+    for tex_file in chordsheet_files + [slides_file]:
+        stage = "pdf:" + tex_file
+        stage_fingerprint = fingerprint(files=[tex_file] + templates)
+        if build_state is not None and build_state.is_up_to_date(stage, stage_fingerprint):
+            print(f"{get_pdf_destination(tex_file)} is up to date.")
+            continue
+        tex_format = (formats or {}).get("slides" if tex_file == slides_file else "chordsheet")
+        job = scheduler.submit(f"pdflatex {os.path.basename(tex_file)}",
+                               ["pdflatex", "--interaction=nonstopmode"] +
+                               ([f"-fmt={tex_format}"] if tex_format is not None else []) + [tex_file],
+                               on_complete=record_job(build_state, stage, stage_fingerprint,
+                                                      [get_pdf_destination(tex_file)]))
+        jobs.append(job)
+        if tex_file == slides_file:
+            slides_pdf_job = job
 
     # generate slide pngs
-    if shutil.which("convert"):  # convert command exists
+    renderer = get_renderer()
+    if renderer is not None:
         slides_basename = os.path.basename(slides_file).rpartition(".")[0]
         output_directory = os.path.join(os.path.dirname(slides_file), root_filename)
-
-        if os.path.isdir(output_directory):
-            shutil.rmtree(output_directory)  # remove individual slide output
-        os.makedirs(output_directory)  # create directory
-
         output_png = os.path.join(output_directory, f"{root_filename}.png")
-
-        # execute convert command
-        run(["convert",
-             "-verbose",
-             "-density", "300",
-             "-geometry", "1920x1080",
-             f"{slides_basename}.pdf",
-             "-quality", "100",
-             "-sharpen", "0x1.0",
-             f"{output_png}"])
+        stage = "png:" + slides_file
+
+        # slides PDF is in the working directory if it was just compiled, or otherwise already moved to its destination
+        slides_pdf = f"{slides_basename}.pdf" if slides_pdf_job is not None else get_pdf_destination(slides_file)
+
+        def stage_fingerprint():
+            return fingerprint(values=[file_digest(slides_pdf), renderer])
+
+        def setup() -> bool:
+            # runs once the slides PDF is available
+            if build_state is not None and build_state.is_up_to_date(stage, stage_fingerprint()):
+                print(f"{output_directory} is up to date.")
+                return False
+            os.makedirs(output_directory, exist_ok=True)  # slides which are unchanged are kept
+            return True
+
+        # rasterize slides whose frame has changed, across several renderer processes if pdftoppm is installed. A
+        # shared scheduler may be rasterizing as many songs at once as it has workers, so each gets its share of the
+        # CPUs rather than all of them (which would start up to max_workers squared renderer processes)
+        cpus = os.cpu_count() or 1
+        renderer_workers = cpus if own_scheduler else max(1, cpus // scheduler.max_workers)
+        jobs.append(scheduler.submit(f"{renderer} {os.path.basename(slides_pdf)}",
+                                     [sys.executable, RASTERIZE_SCRIPT, slides_pdf, output_png,
+                                      "--workers", str(renderer_workers), "--renderer", renderer,
+                                      "--tex", slides_file, "--cache", SLIDE_CACHE_DIRECTORY],
+                                     after=[slides_pdf_job], setup=setup,
+                                     on_complete=record_job(build_state, stage, stage_fingerprint,
+                                                            [output_directory])))
     else:
         print("-------")
-        p_warning("Convert function not found. No individual slides were generated.")
+        p_warning("Neither pdftoppm nor convert found. No individual slides were generated.")
+
+    if own_scheduler:
+        scheduler.shutdown()
+        report_jobs(jobs)
+    return jobs
+
+
+def report_jobs(jobs: List[Job]):
+    """
+    Print outcome of finished jobs, including the end of the output of any job that failed.
+    :param jobs: List[Job] representing finished jobs
+    """
+    for job in jobs:
+        if job.succeeded():
+            print("[OK]    ", job)
+        else:
+            print("[FAILED]", job)
+            print("\n".join(job.log.splitlines()[-JOB_LOG_TAIL_LINES:]))
 
 
-def clean(directory: str, chordsheet_filename: str, slides_filename: str, destination_directories: dict):
+def clean(directory: str, chordsheet_filename: Union[str, List[str]], slides_filename: str,
+          destination_directories: dict):
     """
     Remove unnecessary files and move files as needed.
     :param directory: str representing path to directory containing all intermediately generated files
-    :param chordsheet_filename: str representing path to chordsheet file
+    :param chordsheet_filename: str representing path to chordsheet file, or List[str] representing paths to several
+    chordsheet files
     :param slides_filename: str representing path to slides file
     :param destination_directories: dict representing desired directories in which to store chordsheets and slides
     """
+    chordsheet_filenames = [chordsheet_filename] if isinstance(chordsheet_filename, str) else chordsheet_filename
+
     # get base filename
-    chordsheet_filename_without_ext = str(os.path.basename(chordsheet_filename).rpartition(".")[0])
+    chordsheet_filenames_without_ext = [str(os.path.basename(f).rpartition(".")[0]) for f in chordsheet_filenames]
     slides_filename_without_ext = str(os.path.basename(slides_filename).rpartition(".")[0])
 
-    # move PDFs to destination directories
-    os.rename(chordsheet_filename_without_ext + ".pdf",
-              os.path.join(destination_directories["output"]["chordsheets"], chordsheet_filename_without_ext + ".pdf"))
-    os.rename(slides_filename_without_ext + ".pdf",
-              os.path.join(destination_directories["output"]["slides"], slides_filename_without_ext + ".pdf"))
+    # move PDFs to destination directories (PDFs which were up to date were not regenerated)
+    for chordsheet_filename_without_ext in chordsheet_filenames_without_ext:
+        if os.path.exists(chordsheet_filename_without_ext + ".pdf"):
+            os.rename(chordsheet_filename_without_ext + ".pdf",
+                      os.path.join(destination_directories["output"]["chordsheets"],
+                                   chordsheet_filename_without_ext + ".pdf"))
+    if os.path.exists(slides_filename_without_ext + ".pdf"):
+        os.rename(slides_filename_without_ext + ".pdf",
+                  os.path.join(destination_directories["output"]["slides"], slides_filename_without_ext + ".pdf"))
 
     # remove auxiliary files
-    pattern = re.compile("^(" + chordsheet_filename_without_ext + "|" + slides_filename_without_ext + ")\.[^.]+$")
+    pattern = re.compile("^(" + "|".join(chordsheet_filenames_without_ext + [slides_filename_without_ext]) +
+                         ")\\.[^.]+$")
     for f in os.listdir(directory):
         if pattern.match(f):
             os.remove(os.path.join(directory, f))
 
 
-if __name__ == '__main__':
-    # parse command line
-    if len(sys.argv) < 3:
-        print("Usage:"
-              "\n  python3 generate_music.py <path_to_chordsheet> <new_key>"
-              "\n  python3 generate_music.py <path_to_chordsheet> <old_key> <new_key>", file=sys.stderr)
-        sys.exit(1)
+def load_configuration():
+    """
+    Find and parse the first configuration file available in the working directory.
+    :return: List of dict representing directory output and dict representing account info
+    """
+    for config_filename in CONFIG_FILENAMES:
+        if os.path.exists(config_filename):
+            return get_variables(config_filename)
+    raise FileNotFoundError("No configuration file found; expected one of " + ", ".join(CONFIG_FILENAMES) + ".")
+
 
-    path_to_chordsheet = sys.argv[1]
-    if len(sys.argv) >= 4:
-        old_key = sys.argv[2]
-        new_key = sys.argv[3]
+def generate_tex(path_to_chordsheet: str, new_key: str, directories: dict, account_info: dict,
+                 interactive: bool=True, build_state: BuildState=None, song_cache: SongCache=None,
+                 ccli_cache: CCLICache=None) -> Tuple[List[str], List[str], str]:
+    """
+    Run the Python stages of the pipeline for a single raw chordsheet: parse, supplement header, and generate and
+    write LaTeX chordsheets and slides. The song is parsed once, however many keys are requested.
+    :param path_to_chordsheet: str representing path to raw chordsheet, relative to the input directory
+    :param new_key: str representing new key in which to output chordsheet (or several keys, as accepted by
+    parse_keys), or None to keep the key of the raw file
+    :param directories: dict representing input and output directories, as returned by get_variables
+    :param account_info: dict representing account info for CCLI
+    :param interactive: bool representing whether the user may be prompted (for account info and confirmation)
+    :param build_state: BuildState used to skip stages whose inputs are unchanged, or None to run every stage
+    :param song_cache: SongCache used to reuse earlier parses of the raw chordsheet, or None to always parse
+    :param ccli_cache: CCLICache used to reuse earlier CCLI lookups, or None to always look songs up
+    :return: Tuple[List[str], List[str], str] representing keys in which chordsheets were generated, paths to the
+    LaTeX chordsheet files (one per key), and path to the LaTeX slides file
+    """
+    root_filename = os.path.basename(path_to_chordsheet).rpartition(".")[0]
+    raw_file = os.path.join(directories["input"], path_to_chordsheet)
+
+    # LaTeX stage depends on the raw chordsheet, the requested keys, the code generating LaTeX, and the cached CCLI
+    # lookup for the song (which changes the header without the raw chordsheet changing); reading the cache is cheap,
+    # so an up-to-date song is neither parsed nor looked up
+    ccli = read_ccli_number(raw_file) if ccli_cache is not None else None
+    stage = "tex:{}:{}".format(raw_file, new_key or "")
+
+    def get_stage_fingerprint() -> str:
+        ccli_fields = ccli_cache.get(ccli) if ccli is not None else None
+        return fingerprint(values=[new_key or "", directories["output"]["chordsheets"],
+                                   directories["output"]["slides"], json.dumps(ccli_fields, sort_keys=True)],
+                           files=[raw_file] + GENERATOR_FILES)
+
+    stage_fingerprint = get_stage_fingerprint()
+
+    if build_state is not None and build_state.is_up_to_date(stage, stage_fingerprint):
+        outputs = build_state.get_outputs(stage)
+        chordsheet_files, slides_file = outputs[:-1], outputs[-1]
+        print("{} and {} are up to date.".format(", ".join(chordsheet_files), slides_file))
+        new_keys = [f.rpartition(" - ")[2].rpartition(".")[0] for f in chordsheet_files]
     else:
-        old_key = DEFAULT_KEY
-        new_key = sys.argv[2]
+        # parse chordsheet
+        with span("parse", file=raw_file):
+            header_info, song = parse_cached(raw_file, song_cache)
+        new_keys = parse_keys(new_key) if new_key is not None else [song.get_key()]  # default to key of raw file
+        header_info["key"] = new_keys[0] + " " + header_info["major_minor"]  # change to new key
+        with span("ccli", file=raw_file):
+            header_info = supplement_header(header_info, account_info, interactive=interactive,
+                                            ccli_cache=ccli_cache)
+
+        # have user confirm that header info looks correct
+        if interactive:
+            from pprint import pprint
+            print("Header Info:")
+            pprint(header_info)
+            input("Hit enter to start.")
+
+        # generate chordsheets, one per key, streaming each to its file
+        chordsheet_files = []
+        for key in new_keys:
+            with span("template", file=raw_file, output="chordsheet", key=key):
+                header_info["key"] = key + " " + header_info["major_minor"]
+                chordsheet_header = generate_chordsheet_header(header_info)
+
+                # write to tex file (only if content changed, so later stages can be skipped)
+                chordsheet_file = get_chordsheet_destination(directories["output"]["chordsheets"], root_filename,
+                                                             key)
+                write_chordsheet(chordsheet_file, chordsheet_header, emit_chordsheet(song, key))
+                chordsheet_files.append(chordsheet_file)
+
+        # generate slides, which do not depend on the key
+        with span("template", file=raw_file, output="slides"):
+            slides_header = generate_slides_header(header_info)
+            slides_file = get_slides_destination(directories["output"]["slides"], root_filename)
+            write_slides(slides_file, slides_header, emit_slides(song))
+
+        if build_state is not None:  # the lookup may have just been cached, so fingerprint the entry now stored
+            build_state.update(stage, get_stage_fingerprint(), chordsheet_files + [slides_file])
+
+    return new_keys, chordsheet_files, slides_file
+
+
+def generate_song(path_to_chordsheet: str, new_key: str, directories: dict, account_info: dict,
+                  interactive: bool=True, build_state: BuildState=None, song_cache: SongCache=None,
+                  ccli_cache: CCLICache=None) -> List[str]:
+    """
+    Run the full pipeline for a single raw chordsheet: parse, supplement header, generate and write LaTeX chordsheets
+    and slides, compile, and clean.
+    :param path_to_chordsheet: str representing path to raw chordsheet, relative to the input directory
+    :param new_key: str representing new key in which to output chordsheet (or several keys, as accepted by
+    parse_keys), or None to keep the key of the raw file
+    :param directories: dict representing input and output directories, as returned by get_variables
+    :param account_info: dict representing account info for CCLI
+    :param interactive: bool representing whether the user may be prompted (for account info and confirmation)
+    :param build_state: BuildState used to skip stages whose inputs are unchanged, or None to run every stage
+    :param song_cache: SongCache used to reuse earlier parses of the raw chordsheet, or None to always parse
+    :param ccli_cache: CCLICache used to reuse earlier CCLI lookups, or None to always look songs up
+    :return: List[str] representing keys in which chordsheets were generated
+    """
+    root_filename = os.path.basename(path_to_chordsheet).rpartition(".")[0]
+    new_keys, chordsheet_files, slides_file = generate_tex(path_to_chordsheet, new_key, directories, account_info,
+                                                           interactive=interactive, build_state=build_state,
+                                                           song_cache=song_cache, ccli_cache=ccli_cache)
 
-    root_filename = path_to_chordsheet.rpartition(".")[0]
+    # produce output files
+    formats = prepare_formats(build_state)
+    with span("compile", file=path_to_chordsheet):
+        compile(root_filename, chordsheet_files, slides_file, build_state=build_state, formats=formats)
+    with span("clean", file=path_to_chordsheet):
+        clean(os.getcwd(), chordsheet_files, slides_file, directories)
 
-    # parse config file
-    for config_filename in CONFIG_FILENAMES:
-        if os.path.exists(config_filename):
-            directories, account_info = get_variables(config_filename)
-            break
+    return new_keys
+
+
+def get_batch_pattern(path: str, input_directory: str) -> str:
+    """
+    :param path: str representing a directory of raw chordsheets or a glob pattern; relative paths that do not exist
+    are resolved against the input directory
+    :param input_directory: str representing the configured input directory
+    :return: str representing glob pattern matching the raw chordsheets of the batch target
+    """
+    if not os.path.exists(path) and len(glob.glob(path)) == 0:
+        path = os.path.join(input_directory, path)
+    if os.path.isdir(path):
+        path = os.path.join(path, "*.txt")
+    return path
 
-    # generate chordsheet
-    header_info, song = parse(os.path.join(directories["input"], path_to_chordsheet))
-    header_info["key"] = new_key + " " + header_info["major_minor"]  # change to new key passed in command-line
-    header_info = supplement_header(header_info, account_info)
 
-    # have user confirm that header info looks correct
-    print("Header Info:")
-    pprint(header_info)
-    input("Hit enter to start.")
+def get_batch_files(path: str, input_directory: str) -> List[str]:
+    """
+    Expand a batch target into a list of raw chordsheets.
+    :param path: str representing a directory of raw chordsheets or a glob pattern, as for get_batch_pattern
+    :param input_directory: str representing the configured input directory
+    :return: List[str] representing sorted paths to raw chordsheets
+    """
+    return sorted(f for f in glob.glob(get_batch_pattern(path, input_directory)) if os.path.isfile(f))
 
-    # generate chordsheet
-    chordsheet_header = generate_chordsheet_header(header_info)
-    chordsheet = generate_chordsheet(song, new_key=new_key)
 
-    # generate slides
-    slides_header = generate_slides_header(header_info)
-    slides = generate_slides(song)
+def batch_worker(path_to_chordsheet: str, new_key: str, directories: dict, account_info: dict,
+                 build_state: BuildState=None, song_cache: SongCache=None, ccli_cache: CCLICache=None,
+                 profile_directory: str=None):
+    """
+    Generate the LaTeX files of a single song for a batch build. Never prompts; errors are reported back rather than
+    raised.
+    :param path_to_chordsheet: str representing path to raw chordsheet
+    :param new_key: str representing new key, or None to keep the key of the raw file
+    :param directories: dict representing input and output directories
+    :param account_info: dict representing account info for CCLI
+    :param build_state: BuildState used to skip stages whose inputs are unchanged, or None to run every stage
+    :param song_cache: SongCache used to reuse earlier parses of the raw chordsheet, or None to always parse
+    :param ccli_cache: CCLICache used to reuse earlier CCLI lookups, or None to always look songs up
+    :param profile_directory: str representing directory in which to save a profile of the worker, or None to not
+    profile it
+    :return: Tuple[bool, object, dict, List[dict]] representing success, either the (keys, chordsheet files, slides
+    file) generated or the error message, the build state updates of the stages that were run, and the timing spans
+    recorded
+    """
+    if profile_directory is not None:
+        import cProfile
+        import tempfile
+        profiler = cProfile.Profile()
+    else:
+        profiler = None
+    try:
+        if profiler is not None:
+            profiler.enable()
+        outputs = generate_tex(path_to_chordsheet, new_key, directories, account_info, interactive=False,
+                               build_state=build_state, song_cache=song_cache, ccli_cache=ccli_cache)
+        success = True
+    except Exception as e:
+        traceback.print_exc()
+        success, outputs = False, "{}: {}".format(type(e).__name__, e)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            fd, profile_file = tempfile.mkstemp(suffix=".prof", dir=profile_directory)
+            os.close(fd)
+            profiler.dump_stats(profile_file)
+
+    # a forked worker starts with a copy of the spans of its parent, which must not be reported twice
+    spans = [s for s in TRACER.take() if s["pid"] == os.getpid()]
+    return success, outputs, build_state.updates if build_state is not None else {}, spans
+
+
+def prefetch_ccli(files: List[str], account_info: dict, song_cache: SongCache=None,
+                  ccli_cache: CCLICache=None) -> Dict[str, dict]:
+    """
+    Look up CCLI metadata for every song in a batch that is missing some, logging in once and fetching concurrently, so
+    that supplement_header finds it in the cache. Does nothing without account info or a cache.
+    :param files: List[str] representing paths to raw chordsheets
+    :param account_info: dict representing account info for CCLI; if CCLI rejects the login, the password is removed,
+    so that songs are not looked up one by one with it
+    :param song_cache: SongCache used to reuse earlier parses of the raw chordsheets, or None to always parse
+    :param ccli_cache: CCLICache to fill
+    :return: dict mapping each CCLI number looked up to the fields found, or to None if the lookup failed
+    """
+    if ccli_cache is None or "EmailAddress" not in account_info or "Password" not in account_info:
+        return {}
+
+    ccli_numbers = set()
+    for f in files:
+        try:
+            header_info, _ = parse_cached(f, song_cache)
+        except Exception:  # reported when the song itself is built
+            continue
+        if is_missing_metadata(header_info) and header_info["ccli"] != "N/A":
+            ccli_numbers.add(header_info["ccli"])
+    if len(ccli_numbers) == 0:
+        return {}
+
+    import requests
+
+    print("Prefetching CCLI metadata for {} songs...".format(len(ccli_numbers)))
+    try:
+        results = prefetch(ccli_numbers, account_info, ccli_cache)
+    except LoginError as e:  # the same account info would fail for each song, so songs are not looked up one by one
+        p_warning("CCLI prefetch failed:", e)
+        account_info.pop("Password", None)
+        return {}
+    except requests.RequestException as e:  # e.g. CCLI unreachable; songs are looked up one by one instead
+        p_warning("CCLI prefetch failed:", e)
+        return {}
+    failed = sorted(ccli for ccli, fields in results.items() if fields is None)
+    if len(failed) > 0:
+        p_warning("CCLI lookup failed for " + ", ".join(failed) + ".")
+    return results
+
+
+def run_batch(files: List[str], keys: Dict[str, str], directories: dict, account_info: dict,
+              workers: int=None, build_state: BuildState=None,
+              song_cache: SongCache=None, ccli_cache: CCLICache=None,
+              profile_directory: str=None) -> Dict[str, Tuple[bool, str]]:
+    """
+    Generate chordsheets and slides for many songs, then print a summary. LaTeX files are generated across a pool of
+    worker processes; as each song's files are ready, its compile jobs are submitted to a shared scheduler, so that
+    pdflatex and rasterization runs for different songs overlap.
+    :param files: List[str] representing paths to raw chordsheets
+    :param keys: dict mapping song names (filename without extension) to target keys; songs not present fall back to
+    the "*" entry, or to the key of the raw file
+    :param directories: dict representing input and output directories
+    :param account_info: dict representing account info for CCLI
+    :param workers: int representing number of worker processes and concurrent compile jobs (defaults to the number
+    of CPUs)
+    :param build_state: BuildState used to skip stages whose inputs are unchanged, or None to run every stage; updates
+    from all workers are merged back into it
+    :param song_cache: SongCache shared by all workers to reuse earlier parses, or None to always parse
+    :param ccli_cache: CCLICache shared by all workers to reuse earlier CCLI lookups, or None to always look songs up
+    :param profile_directory: str representing directory in which each worker saves a profile of its songs, or None
+    to not profile workers
+    :return: dict mapping song names to (success, keys or error message)
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    # paths are passed as given, so the input directory must not be prepended again
+    batch_directories = dict(directories, input="")
+
+    # look up missing metadata for all songs at once, before any worker needs it
+    with span("prefetch"):
+        prefetch_ccli(files, account_info, song_cache=song_cache, ccli_cache=ccli_cache)
+
+    # build formats once, before any compile job needs them
+    formats = prepare_formats(build_state)
+
+    results = {}
+    compiled = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor, JobScheduler(max_workers=workers) as scheduler:
+        futures = {}
+        for f in files:
+            name = os.path.basename(f).rpartition(".")[0]
+            futures[executor.submit(batch_worker, f, keys.get(name, keys.get("*")), batch_directories,
+                                    dict(account_info), build_state, song_cache, ccli_cache,
+                                    profile_directory)] = name
+        for future in as_completed(futures):
+            name = futures[future]
+            success, outputs, updates, spans = future.result()
+            TRACER.extend(spans)
+            if build_state is not None:
+                build_state.merge(updates)
+            if success:
+                _, chordsheet_files, slides_file = outputs
+                compiled[name] = (outputs, compile(name, chordsheet_files, slides_file, build_state=build_state,
+                                                   scheduler=scheduler, formats=formats))
+            else:
+                results[name] = (False, outputs)
+
+    # clean up once all jobs have finished
+    results.update(clean_compiled(compiled, directories))
+
+    # summary
+    print("-------")
+    for name in sorted(results):
+        success, message = results[name]
+        print("[OK]    " if success else "[FAILED]", name, "-", message)
+        if not success and name in compiled:
+            report_jobs([job for job in compiled[name][1] if not job.succeeded()])
+    print("{} succeeded, {} failed".format(sum(1 for s, _ in results.values() if s),
+                                           sum(1 for s, _ in results.values() if not s)))
+    return results
+
+
+def clean_compiled(compiled: Dict[str, Tuple[Tuple[List[str], List[str], str], List[Job]]],
+                   directories: dict) -> Dict[str, Tuple[bool, str]]:
+    """
+    Clean up after songs whose compile jobs have all finished.
+    :param compiled: dict mapping song names to the (keys, chordsheet files, slides file) generated and the compile
+    jobs submitted
+    :param directories: dict representing input and output directories
+    :return: dict mapping song names to (success, keys or failed jobs)
+    """
+    results = {}
+    for name, ((new_keys, chordsheet_files, slides_file), jobs) in compiled.items():
+        with span("clean", file=name):
+            clean(os.getcwd(), chordsheet_files, slides_file, directories)
+        failed = [job for job in jobs if not job.succeeded()]
+        results[name] = (True, ", ".join(new_keys)) if len(failed) == 0 else \
+            (False, ", ".join(str(job) for job in failed))
+    return results
+
+
+def rebuild_songs(files: List[str], keys: Dict[str, str], directories: dict, account_info: dict,
+                  scheduler: JobScheduler, formats: Dict[str, str]=None, build_state: BuildState=None,
+                  song_cache: Union[SongCache, MemorySongCache]=None,
+                  ccli_cache: CCLICache=None) -> Dict[str, Tuple[bool, str]]:
+    """
+    Rebuild some songs in this process, on a scheduler which is kept running between rebuilds, then wait for them.
+    Unlike run_batch, no worker processes are started, so that a rebuild of a few songs starts at once.
+    :param files: List[str] representing paths to raw chordsheets
+    :param keys: dict mapping song names to target keys, as for run_batch
+    :param directories: dict representing input and output directories
+    :param account_info: dict representing account info for CCLI
+    :param scheduler: JobScheduler to submit compile jobs to
+    :param formats: dict mapping "chordsheet" and "slides" to their precompiled format, as returned by prepare_formats
+    :param build_state: BuildState used to skip stages whose inputs are unchanged, or None to run every stage
+    :param song_cache: SongCache or MemorySongCache used to reuse earlier parses, or None to always parse
+    :param ccli_cache: CCLICache used to reuse earlier CCLI lookups, or None to always look songs up
+    :return: dict mapping song names to (success, keys or error message)
+    """
+    batch_directories = dict(directories, input="")  # paths are passed as given
+    results = {}
+    compiled = {}
+    for f in files:
+        name = os.path.basename(f).rpartition(".")[0]
+        try:
+            outputs = generate_tex(f, keys.get(name, keys.get("*")), batch_directories, account_info,
+                                   interactive=False, build_state=build_state, song_cache=song_cache,
+                                   ccli_cache=ccli_cache)
+        except Exception as e:
+            traceback.print_exc()
+            results[name] = (False, "{}: {}".format(type(e).__name__, e))
+            continue
+        _, chordsheet_files, slides_file = outputs
+        compiled[name] = (outputs, compile(name, chordsheet_files, slides_file, build_state=build_state,
+                                           scheduler=scheduler, formats=formats))
+    scheduler.wait([job for _, jobs in compiled.values() for job in jobs])
+    results.update(clean_compiled(compiled, directories))
+    for name in sorted(results):
+        success, message = results[name]
+        print("[OK]    " if success else "[FAILED]", name, "-", message)
+        if not success and name in compiled:
+            report_jobs([job for job in compiled[name][1] if not job.succeeded()])
+    return results
+
+
+def watch_songs(path: str, keys: Dict[str, str], directories: dict, account_info: dict, workers: int=None,
+                debounce: float=DEFAULT_DEBOUNCE, polling: bool=False, interval: float=DEFAULT_POLL_INTERVAL,
+                build_state: BuildState=None, song_cache: SongCache=None, ccli_cache: CCLICache=None,
+                timings: bool=False):
+    """
+    Build every song in a directory, then rebuild songs as their raw chordsheets change, until interrupted. A change to
+    a LaTeX template rebuilds the formats and every song's PDFs (their LaTeX is unchanged, so is not regenerated).
+    Parse results, file digests, the build state, the formats and the scheduler's threads are all kept between
+    rebuilds, and the build state is saved after each one.
+    :param path: str representing directory of raw chordsheets; a relative path that does not exist is resolved
+    against the input directory
+    :param keys: dict mapping song names to target keys, as for run_batch
+    :param directories: dict representing input and output directories
+    :param account_info: dict representing account info for CCLI
+    :param workers: int representing number of concurrent compile jobs (defaults to the number of CPUs)
+    :param debounce: float representing number of seconds without further changes after which a rebuild starts
+    :param polling: bool representing whether to poll for changes even if inotify is available
+    :param interval: float representing number of seconds between scans when polling
+    :param build_state: BuildState used to skip stages whose inputs are unchanged, or None to run every stage
+    :param song_cache: SongCache used to reuse parses from earlier runs, or None; parse results are kept in memory
+    either way
+    :param ccli_cache: CCLICache used to reuse earlier CCLI lookups, or None to always look songs up
+    :param timings: bool representing whether to write the duration of each stage of each rebuild to stderr
+    """
+    if not os.path.isdir(path):
+        path = os.path.join(directories["input"], path)
+    if not os.path.isdir(path):
+        raise FileNotFoundError("No directory of raw chordsheets found at " + path + ".")
+    song_cache = MemorySongCache(song_cache)
+    watched = [path] + ([TEMPLATE_DIRECTORY] if os.path.isdir(TEMPLATE_DIRECTORY) else [])
+
+    # watch before the first build, so that no change made during it is missed
+    with open_watcher(watched, polling=polling, interval=interval) as watcher, \
+            JobScheduler(max_workers=workers) as scheduler:
+        formats = prepare_formats(build_state)
+        files = get_batch_files(path, directories["input"])
+        changed = None
+        while True:
+            start = time.perf_counter()
+            rebuild_all = changed is None or any(p in watcher.directories for p in changed)  # or events were lost
+            if not rebuild_all and any(os.path.dirname(p) == os.path.abspath(TEMPLATE_DIRECTORY) for p in changed):
+                formats = prepare_formats(build_state)
+                rebuild_all = True
+            files = get_batch_files(path, directories["input"])
+            targets = files if rebuild_all else [f for f in files if os.path.abspath(f) in changed]
+            if len(targets) > 0:
+                print("-------")
+                results = rebuild_songs(targets, keys, directories, account_info, scheduler, formats=formats,
+                                        build_state=build_state, song_cache=song_cache, ccli_cache=ccli_cache)
+                if build_state is not None:
+                    build_state.save(BUILD_STATE_FILE)
+                print("Rebuilt {} songs in {:.2f} s ({} failed)".format(
+                    len(results), time.perf_counter() - start, sum(1 for s, _ in results.values() if not s)))
+            if timings:
+                TRACER.write(sys.stderr)
+            TRACER.take()  # spans of each rebuild are reported at most once
+            print("Watching {} for changes (press Ctrl-C to stop)...".format(", ".join(watched)))
+            changed = watcher.wait(debounce)
+
+
+def parse_batch_keys(keys_file: str, default_key: str) -> Dict[str, str]:
+    """
+    Build mapping of song names to target keys for a batch build.
+    :param keys_file: str representing path to JSON file mapping song names to keys, or None
+    :param default_key: str representing key to use for songs not in the keys file, or None to keep original keys
+    :return: dict mapping song names to keys, with the default stored under "*"
+    """
+    keys = {}
+    if keys_file is not None:
+        with open(keys_file, "r") as f:
+            keys.update(json.load(f))
+    if default_key is not None:
+        keys["*"] = default_key
+    return keys
+
 
-    # write to tex file and compile
-    chordsheet_file = get_chordsheet_destination(directories["output"]["chordsheets"], root_filename, new_key)
-    write_chordsheet(chordsheet_file, chordsheet_header, chordsheet)
+def report_instrumentation(profiler: "cProfile.Profile"=None, profile_directory: str=None, timings: bool=False):
+    """
+    Report what was measured during a run: save and summarize the profile, and write the timing spans as JSON (one
+    object per line) to stderr.
+    :param profiler: cProfile.Profile representing profile of the run, or None if it was not profiled
+    :param profile_directory: str representing directory of profiles saved by worker processes, which is removed once
+    they have been merged, or None
+    :param timings: bool representing whether to write the timing spans
+    """
+    if profiler is not None:
+        profiler.disable()
+        worker_profiles = sorted(glob.glob(os.path.join(profile_directory, "*.prof"))) \
+            if profile_directory is not None else []
+        write_profile(profiler, PROFILE_FILE, worker_profiles)
+        if profile_directory is not None:
+            shutil.rmtree(profile_directory, ignore_errors=True)
+    if timings:
+        TRACER.write(sys.stderr)
+
+
+def main_batch(argv: List[str]):
+    """
+    Entry point for the batch subcommand.
+    :param argv: List[str] representing command-line arguments following "batch"
+    """
+    parser = argparse.ArgumentParser(prog="generate_music.py batch",
+                                     description="Generate chordsheets and slides for many raw chordsheets.")
+    parser.add_argument("path", help="directory of raw chordsheets or glob pattern")
+    parser.add_argument("--key", dest="key", default=None,
+                        help="target key for all songs, a comma-separated list of keys, or 'all' for every key "
+                             "(defaults to the key of each raw chordsheet)")
+    parser.add_argument("--keys", dest="keys_file", default=None,
+                        help="JSON file mapping song names (filename without extension) to target keys")
+    parser.add_argument("-j", "--workers", dest="workers", type=int, default=None,
+                        help="number of worker processes and concurrent compile jobs (defaults to number of CPUs)")
+    parser.add_argument("--force", dest="force", action="store_true",
+                        help="rebuild every stage, even if its inputs are unchanged")
+    parser.add_argument("--ccli-cache-ttl", dest="ccli_cache_ttl", type=float, default=DEFAULT_TTL / SECONDS_PER_DAY,
+                        help="number of days for which CCLI lookups are reused (defaults to {:g}; 0 to always look "
+                             "songs up again)".format(DEFAULT_TTL / SECONDS_PER_DAY))
+    parser.add_argument("--timings", dest="timings", action="store_true",
+                        help="write the duration of each stage to stderr as JSON, one object per line")
+    parser.add_argument("--profile", dest="profile", action="store_true",
+                        help="profile the Python stages (saved to {}) and report wall-clock times of pdflatex and "
+                             "rasterization".format(PROFILE_FILE))
+    args = parser.parse_args(argv)
+
+    profiler = None
+    profile_directory = None
+    if args.profile:
+        import cProfile
+        import tempfile
+        profiler = cProfile.Profile()
+        profile_directory = tempfile.mkdtemp(prefix="profile-")
+        profiler.enable()
+
+    with span("config"):
+        directories, account_info = load_configuration()
+    files = get_batch_files(args.path, directories["input"])
+    if len(files) == 0:
+        print("No raw chordsheets found for " + args.path, file=sys.stderr)
+        sys.exit(1)
 
-    slides_file = get_slides_destination(directories["output"]["slides"], root_filename)
-    write_slides(slides_file, slides_header, slides)
+    build_state = BuildState.load(BUILD_STATE_FILE, force=args.force)
+    try:
+        results = run_batch(files, parse_batch_keys(args.keys_file, args.key), directories, account_info,
+                            args.workers, build_state=build_state, song_cache=open_song_cache(),
+                            ccli_cache=open_ccli_cache(args.ccli_cache_ttl * SECONDS_PER_DAY),
+                            profile_directory=profile_directory)
+    finally:
+        build_state.save(BUILD_STATE_FILE)
+        report_instrumentation(profiler, profile_directory, args.timings)
+    if not all(success for success, _ in results.values()):
+        sys.exit(1)
 
-    # produce output files
-    compile(root_filename, chordsheet_file, slides_file)
-    clean(os.path.dirname(os.path.abspath(path_to_chordsheet)), chordsheet_file, slides_file, directories)
+
+def main_songbook(argv: List[str]):
+    """
+    Entry point for the songbook subcommand.
+    :param argv: List[str] representing command-line arguments following "songbook"
+    """
+    from songbook import build_songbook
+
+    parser = argparse.ArgumentParser(prog="generate_music.py songbook",
+                                     description="Generate the chordsheets of many raw chordsheets as one songbook, "
+                                                 "compiled with a single pdflatex run.")
+    parser.add_argument("path", help="directory of raw chordsheets or glob pattern")
+    parser.add_argument("--key", dest="key", default=None,
+                        help="target key for all songs, a comma-separated list of keys, or 'all' for every key "
+                             "(defaults to the key of each raw chordsheet)")
+    parser.add_argument("--keys", dest="keys_file", default=None,
+                        help="JSON file mapping song names (filename without extension) to target keys")
+    parser.add_argument("--name", dest="name", default="songbook",
+                        help="name of songbook files in the chordsheets output directory (defaults to songbook)")
+    parser.add_argument("--split", dest="split", action="store_true",
+                        help="also split the songbook into a PDF per chordsheet (requires qpdf or gs)")
+    parser.add_argument("-j", "--workers", dest="workers", type=int, default=None,
+                        help="number of PDFs split at once (defaults to number of CPUs)")
+    parser.add_argument("--force", dest="force", action="store_true",
+                        help="rebuild every stage, even if its inputs are unchanged")
+    parser.add_argument("--timings", dest="timings", action="store_true",
+                        help="write the duration of each stage to stderr as JSON, one object per line")
+    args = parser.parse_args(argv)
+
+    with span("config"):
+        directories, account_info = load_configuration()
+    files = get_batch_files(args.path, directories["input"])
+    if len(files) == 0:
+        print("No raw chordsheets found for " + args.path, file=sys.stderr)
+        sys.exit(1)
+
+    build_state = BuildState.load(BUILD_STATE_FILE, force=args.force)
+    try:
+        success = build_songbook(files, parse_batch_keys(args.keys_file, args.key), directories, account_info,
+                                 name=args.name, split=args.split, workers=args.workers, build_state=build_state,
+                                 song_cache=open_song_cache(), ccli_cache=open_ccli_cache())
+    finally:
+        build_state.save(BUILD_STATE_FILE)
+        report_instrumentation(timings=args.timings)
+    if not success:
+        sys.exit(1)
+
+
+def main_setlist(argv: List[str]):
+    """
+    Entry point for the setlist subcommand.
+    :param argv: List[str] representing command-line arguments following "setlist"
+    """
+    from songbook import build_setlist, load_setlist
+
+    parser = argparse.ArgumentParser(prog="generate_music.py setlist",
+                                     description="Assemble a setlist into one chordsheet PDF and one slides PDF, "
+                                                 "building only the songs which are not up to date.")
+    parser.add_argument("setlist", help="JSON setlist file listing songs (and optionally keys) in order")
+    parser.add_argument("-o", "--output", dest="output", default="setlists",
+                        help="directory in which to save the setlist (defaults to setlists)")
+    parser.add_argument("-j", "--workers", dest="workers", type=int, default=None,
+                        help="number of worker processes and concurrent compile jobs (defaults to number of CPUs)")
+    parser.add_argument("--force", dest="force", action="store_true",
+                        help="rebuild every stage, even if its inputs are unchanged")
+    parser.add_argument("--timings", dest="timings", action="store_true",
+                        help="write the duration of each stage to stderr as JSON, one object per line")
+    args = parser.parse_args(argv)
+
+    name, entries = load_setlist(args.setlist)
+    with span("config"):
+        directories, account_info = load_configuration()
+
+    build_state = BuildState.load(BUILD_STATE_FILE, force=args.force)
+    try:
+        success = build_setlist(name, entries, directories, account_info, args.output, workers=args.workers,
+                                build_state=build_state, song_cache=open_song_cache(), ccli_cache=open_ccli_cache())
+    finally:
+        build_state.save(BUILD_STATE_FILE)
+        report_instrumentation(timings=args.timings)
+    if not success:
+        sys.exit(1)
+
+
+def main_watch(argv: List[str]):
+    """
+    Entry point for the watch subcommand.
+    :param argv: List[str] representing command-line arguments following "watch"
+    """
+    parser = argparse.ArgumentParser(prog="generate_music.py watch",
+                                     description="Build chordsheets and slides, then rebuild them whenever raw "
+                                                 "chordsheets or LaTeX templates change.")
+    parser.add_argument("path", nargs="?", default=None,
+                        help="directory of raw chordsheets (defaults to the configured input directory)")
+    parser.add_argument("--key", dest="key", default=None,
+                        help="target key for all songs, a comma-separated list of keys, or 'all' for every key "
+                             "(defaults to the key of each raw chordsheet)")
+    parser.add_argument("--keys", dest="keys_file", default=None,
+                        help="JSON file mapping song names (filename without extension) to target keys")
+    parser.add_argument("-j", "--workers", dest="workers", type=int, default=None,
+                        help="number of concurrent compile jobs (defaults to number of CPUs)")
+    parser.add_argument("--debounce", dest="debounce", type=float, default=DEFAULT_DEBOUNCE,
+                        help="seconds to wait for further changes before rebuilding (defaults to {:g})".format(
+                            DEFAULT_DEBOUNCE))
+    parser.add_argument("--poll", dest="poll", action="store_true",
+                        help="poll for changes, even if inotify is available")
+    parser.add_argument("--interval", dest="interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="seconds between scans when polling (defaults to {:g})".format(DEFAULT_POLL_INTERVAL))
+    parser.add_argument("--force", dest="force", action="store_true",
+                        help="rebuild every stage of the first build, even if its inputs are unchanged")
+    parser.add_argument("--timings", dest="timings", action="store_true",
+                        help="write the duration of each stage of each rebuild to stderr as JSON, one object per line")
+    args = parser.parse_args(argv)
+
+    with span("config"):
+        directories, account_info = load_configuration()
+
+    build_state = BuildState.load(BUILD_STATE_FILE, force=args.force)
+    try:
+        watch_songs(args.path or directories["input"], parse_batch_keys(args.keys_file, args.key), directories,
+                    account_info, workers=args.workers, debounce=args.debounce, polling=args.poll,
+                    interval=args.interval, build_state=build_state, song_cache=open_song_cache(),
+                    ccli_cache=open_ccli_cache(), timings=args.timings)
+    except KeyboardInterrupt:
+        print()
+    finally:
+        build_state.save(BUILD_STATE_FILE)
+
+
+def main_serve(argv: List[str]):
+    """
+    Entry point for the serve subcommand.
+    :param argv: List[str] representing command-line arguments following "serve"
+    """
+    from preview_server import DEFAULT_HOST, DEFAULT_PORT, serve
+
+    parser = argparse.ArgumentParser(prog="generate_music.py serve",
+                                     description="Serve songs in any key over HTTP, as text, LaTeX or PDF.")
+    parser.add_argument("path", nargs="?", default=None,
+                        help="directory of raw chordsheets (defaults to the configured input directory)")
+    parser.add_argument("--host", dest="host", default=DEFAULT_HOST,
+                        help="address to listen on (defaults to {}; use 0.0.0.0 to serve other devices on the "
+                             "network)".format(DEFAULT_HOST))
+    parser.add_argument("--port", dest="port", type=int, default=DEFAULT_PORT,
+                        help="port to listen on (defaults to {})".format(DEFAULT_PORT))
+    args = parser.parse_args(argv)
+
+    with span("config"):
+        directories, _ = load_configuration()
+
+    # formats are only needed for PDFs, which are compiled on demand
+    build_state = BuildState.load(BUILD_STATE_FILE)
+    try:
+        formats = prepare_formats(build_state, names=["chordsheet"])
+    finally:
+        build_state.save(BUILD_STATE_FILE)
+    try:
+        serve(args.path or directories["input"], host=args.host, port=args.port, ccli_cache=open_ccli_cache(),
+              formats=formats)
+    except KeyboardInterrupt:
+        print()
+
+
+def add_search_index_arguments(parser: argparse.ArgumentParser):
+    """
+    :param parser: ArgumentParser of a subcommand searching the index, to which the arguments selecting and updating
+    the indexed songs are added
+    """
+    from search_index import DEFAULT_LIMIT
+
+    parser.add_argument("--path", dest="path", default=None,
+                        help="directory of raw chordsheets or glob pattern (defaults to the configured input "
+                             "directory)")
+    parser.add_argument("-n", "--limit", dest="limit", type=int, default=DEFAULT_LIMIT,
+                        help="maximum number of songs to list (defaults to {})".format(DEFAULT_LIMIT))
+    parser.add_argument("--no-update", dest="update", action="store_false",
+                        help="search the index as it is, without checking for changed files first")
+    parser.add_argument("--rebuild", dest="rebuild", action="store_true",
+                        help="index every song again, even if its file is unchanged")
+
+
+def update_search_index(index, args: argparse.Namespace, input_directory: str):
+    """
+    Bring the search index up to date with the raw chordsheets, as requested on the command line.
+    :param index: SearchIndex to update
+    :param args: Namespace representing arguments added by add_search_index_arguments
+    :param input_directory: str representing path to configured directory of raw chordsheets
+    """
+    # only songs the path covers are removed from the index, so a subset can be updated or rebuilt on its own
+    pattern = get_batch_pattern(args.path or input_directory, input_directory)
+    if args.rebuild:
+        index.clear(pattern if args.path else None)
+    if args.update or args.rebuild:
+        start = time.perf_counter()
+        indexed, removed = index.update(sorted(f for f in glob.glob(pattern) if os.path.isfile(f)),
+                                        song_cache=open_song_cache(), pattern=pattern)
+        if indexed > 0 or removed > 0:
+            print("Indexed {} songs and removed {} in {:.2f} s".format(indexed, removed, time.perf_counter() - start))
+
+
+def main_search(argv: List[str]):
+    """
+    Entry point for the search subcommand.
+    :param argv: List[str] representing command-line arguments following "search"
+    """
+    from search_index import SEARCH_INDEX_FILE, SearchIndex
+
+    parser = argparse.ArgumentParser(prog="generate_music.py search",
+                                     description="Search the lyrics, titles, section names and CCLI numbers of raw "
+                                                 "chordsheets.")
+    parser.add_argument("query", nargs="+",
+                        help="words, \"quoted phrases\" and prefixes ending in *, optionally restricted to a field "
+                             "(e.g. title:grace); songs must match all of them")
+    add_search_index_arguments(parser)
+    args = parser.parse_args(argv)
+
+    with span("config"):
+        directories, _ = load_configuration()
+
+    with SearchIndex(SEARCH_INDEX_FILE, version=get_parser_version()) as index:
+        update_search_index(index, args, directories["input"])
+        start = time.perf_counter()
+        try:
+            results = index.search(" ".join(args.query), limit=args.limit)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        elapsed = time.perf_counter() - start
+
+    for result in results:
+        print("{} ({}){}".format(result["title"], result["path"],
+                                 " - " + ", ".join(result["sections"]) if len(result["sections"]) > 0 else ""))
+    print("{} songs found in {:.1f} ms".format(len(results), elapsed * 1000))
+
+
+def main_progression(argv: List[str]):
+    """
+    Entry point for the progression subcommand.
+    :param argv: List[str] representing command-line arguments following "progression"
+    """
+    from search_index import SEARCH_INDEX_FILE, SearchIndex, parse_progression
+
+    parser = argparse.ArgumentParser(prog="generate_music.py progression",
+                                     description="Find songs playing a chord progression, in any key.")
+    parser.add_argument("progression", nargs="+",
+                        help="scale degrees as roman numerals (e.g. I V vi IV) or Nashville numbers (e.g. 1 5 6m 4), "
+                             "or chords if --key is given")
+    parser.add_argument("--key", dest="key", default=None,
+                        help="key in which the progression is given as chords (e.g. --key G for G D Em C)")
+    add_search_index_arguments(parser)
+    args = parser.parse_args(argv)
+
+    try:
+        degrees = parse_progression(" ".join(args.progression), key=args.key)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+
+    with span("config"):
+        directories, _ = load_configuration()
+
+    with SearchIndex(SEARCH_INDEX_FILE, version=get_parser_version()) as index:
+        update_search_index(index, args, directories["input"])
+        start = time.perf_counter()
+        results = index.search_progression(degrees, limit=args.limit)
+        elapsed = time.perf_counter() - start
+
+    for result in results:
+        print("{} ({}, in {}) - {}x in {}".format(result["title"], result["path"], result["key"], result["count"],
+                                                  ", ".join(result["sections"])))
+    print("{} songs found playing {} in {:.1f} ms".format(len(results), " ".join(degrees), elapsed * 1000))
+
+
+def main_dedup(argv: List[str]):
+    """
+    Entry point for the dedup subcommand.
+    :param argv: List[str] representing command-line arguments following "dedup"
+    """
+    from dedup import DEFAULT_THRESHOLD, find_duplicates
+
+    parser = argparse.ArgumentParser(prog="generate_music.py dedup",
+                                     description="Report songs which are near-duplicates of each other, by their "
+                                                 "lyrics and chord progressions.")
+    parser.add_argument("path", nargs="?", default=None,
+                        help="directory of raw chordsheets or glob pattern (defaults to the configured input "
+                             "directory)")
+    parser.add_argument("--threshold", dest="threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="minimum overlap (from 0 to 1) of songs to report (defaults to {})".format(
+                            DEFAULT_THRESHOLD))
+    parser.add_argument("--no-diff", dest="diff", action="store_false",
+                        help="only list the pairs of songs, without comparing their sections")
+    args = parser.parse_args(argv)
+
+    with span("config"):
+        directories, _ = load_configuration()
+
+    files = get_batch_files(args.path or directories["input"], directories["input"])
+    start = time.perf_counter()
+    duplicates, candidates = find_duplicates(files, threshold=args.threshold, song_cache=open_song_cache())
+    elapsed = time.perf_counter() - start
+
+    for duplicate in duplicates:
+        print("{:.2f}  {} ({})\n      {} ({})\n      similarity {:.2f}, lyrics {:.2f}, chords {:.2f}".format(
+            duplicate["overlap"], duplicate["first_title"], duplicate["first"], duplicate["second_title"],
+            duplicate["second"], duplicate["similarity"], duplicate["lyrics"], duplicate["chords"]))
+        if args.diff:
+            for status, first_name, second_name, diff in duplicate["sections"]:
+                if first_name is not None and second_name is not None and first_name != second_name:
+                    print("  {} {} / {}".format(status, first_name, second_name))
+                else:
+                    print("  {} {}".format(status, first_name or second_name))
+                for line in diff:
+                    print("      " + line)
+        print()
+    print("{} near-duplicate pairs among {} songs ({} candidate pairs) in {:.2f} s".format(
+        len(duplicates), len(files), candidates, elapsed))
+
+
+# entry point of each subcommand, given the command-line arguments following its name
+SUBCOMMANDS = {  # type: Dict[str, Callable[[List[str]], None]]
+    "batch": main_batch,
+    "songbook": main_songbook,
+    "setlist": main_setlist,
+    "watch": main_watch,
+    "serve": main_serve,
+    "search": main_search,
+    "progression": main_progression,
+    "dedup": main_dedup,
+}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 2 and sys.argv[1] in SUBCOMMANDS:
+        SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
+        sys.exit(0)
+
+    # parse command line
+    flags = {"--force", "--timings", "--profile"}
+    force = "--force" in sys.argv
+    timings = "--timings" in sys.argv
+    profile = "--profile" in sys.argv
+    argv = [arg for arg in sys.argv if arg not in flags]
+    if len(argv) < 3:
+        print("Usage:"
+              "\n  python3 generate_music.py <path_to_chordsheet> <new_key> [--force] [--timings] [--profile]"
+              "\n  python3 generate_music.py <path_to_chordsheet> <new_key>,<new_key>,... [--force]"
+              "\n  python3 generate_music.py <path_to_chordsheet> all [--force]"
+              "\n  python3 generate_music.py <path_to_chordsheet> <old_key> <new_key> [--force]"
+              "\n  python3 generate_music.py batch <directory_or_glob> [--key <new_key>] [--keys <keys.json>] "
+              "[--workers <n>] [--force] [--timings] [--profile]"
+              "\n  python3 generate_music.py songbook <directory_or_glob> [--key <new_key>] [--keys <keys.json>] "
+              "[--name <name>] [--split] [--force] [--timings]"
+              "\n  python3 generate_music.py setlist <setlist.json> [--output <directory>] [--workers <n>] [--force] "
+              "[--timings]"
+              "\n  python3 generate_music.py watch [<directory>] [--key <new_key>] [--keys <keys.json>] "
+              "[--debounce <seconds>] [--poll]"
+              "\n  python3 generate_music.py serve [<directory>] [--host <address>] [--port <port>]"
+              "\n  python3 generate_music.py search <query> [--path <directory_or_glob>] [--limit <n>] [--rebuild]"
+              "\n  python3 generate_music.py progression <degrees> [--key <key>] [--path <directory_or_glob>] "
+              "[--limit <n>] [--rebuild]"
+              "\n  python3 generate_music.py dedup [<directory_or_glob>] [--threshold <overlap>] [--no-diff]",
+              file=sys.stderr)
+        sys.exit(1)
+
+    path_to_chordsheet = argv[1]
+    if len(argv) >= 4:
+        old_key = argv[2]
+        new_key = argv[3]
+    else:
+        old_key = DEFAULT_KEY
+        new_key = argv[2]
+
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    # parse config file
+    with span("config"):
+        directories, account_info = load_configuration()
+
+    build_state = BuildState.load(BUILD_STATE_FILE, force=force)
+    try:
+        generate_song(path_to_chordsheet, new_key, directories, account_info, build_state=build_state,
+                      song_cache=open_song_cache(), ccli_cache=open_ccli_cache())
+    finally:
+        build_state.save(BUILD_STATE_FILE)
+        report_instrumentation(profiler, timings=timings)
@@ -3,15 +3,28 @@
 """
 file: headers.py
 
-Contains string versions of LaTeX file headers.
+Contains string versions of LaTeX file headers. Each header is split into a preamble, which is the same for every song
+and may be precompiled into a format, and the song-specific commands which follow it.
 """
 
-# header for LaTeX chordsheets
-CHORDSHEET_HEADER = \
+# preamble for LaTeX chordsheets
+CHORDSHEET_PREAMBLE = \
     """\\documentclass[9pt]{extarticle}
 
     \\input{latex_templates/chordsheet}
+    """
 
+# page header of LaTeX chordsheets, showing the song-specific commands
+CHORDSHEET_PAGE_HEADER = \
+    """
+    \\fancyhead[L]{ \\\\ \\bpm\\ bpm, \\timesignature \\\\ \\key}
+    \\fancyhead[C]{{\\Large \\bf{\\name}} \\\\ \\#\\ccli \\\\ \\bibleverse}
+    \\fancyhead[R]{ \\\\ \\composer \\\\ \\arranger}
+    """
+
+# header for LaTeX chordsheets, following the preamble
+CHORDSHEET_HEADER = \
+    """
     % SET THESE FOR THE SONG
     \\newcommand{\\name}{$song} % TITLE
     \\newcommand{\\ccli}{$ccli} % CCLI
@@ -21,17 +34,53 @@ CHORDSHEET_HEADER = \
     \\newcommand{\\key}{$key} % KEY OF SONG
     \\newcommand{\\bibleverse}{$verse} % BIBLE VERSE REFERENCE
     \\newcommand{\\arranger}{$arranger} % ARRANGER
+""" + CHORDSHEET_PAGE_HEADER
 
-    \\fancyhead[L]{ \\\\ \\bpm\\ bpm, \\timesignature \\\\ \\key}
-    \\fancyhead[C]{{\\Large \\bf{\\name}} \\\\ \\#\\ccli \\\\ \\bibleverse}
-    \\fancyhead[R]{ \\\\ \\composer \\\\ \\arranger}
+# header for LaTeX songbooks, following the chordsheet preamble: the song-specific commands are redefined by
+# SONGBOOK_SONG_HEADER at the start of each song, which also starts a new page and records the page in \jobname.pages
+SONGBOOK_HEADER = \
     """
+    \\newcommand{\\name}{} % TITLE
+    \\newcommand{\\ccli}{} % CCLI
+    \\newcommand{\\composer}{} % COMPOSER
+    \\newcommand{\\bpm}{} % BEATS PER MINUTE
+    \\newcommand{\\timesignature}{} % TIME SIGNATURE
+    \\newcommand{\\key}{} % KEY OF SONG
+    \\newcommand{\\bibleverse}{} % BIBLE VERSE REFERENCE
+    \\newcommand{\\arranger}{} % ARRANGER
 
-# header for LaTeX beamer slides
-SLIDES_HEADER = \
+    \\newwrite\\songbookpages
+    \\immediate\\openout\\songbookpages=\\jobname.pages
+    \\newcommand{\\songbookpage}{\\clearpage\\immediate\\write\\songbookpages{\\arabic{page}}}
+    \\newcommand{\\songbooksong}{\\songbookpage\\stepcounter{section}}
+    \\AtEndDocument{\\songbookpage\\immediate\\closeout\\songbookpages}
+""" + CHORDSHEET_PAGE_HEADER
+
+# header of each song in a LaTeX songbook
+SONGBOOK_SONG_HEADER = \
+    """
+    % $song
+    \\songbooksong
+    \\renewcommand{\\name}{$song}
+    \\renewcommand{\\ccli}{$ccli}
+    \\renewcommand{\\composer}{$composer}
+    \\renewcommand{\\bpm}{$bpm}
+    \\renewcommand{\\timesignature}{$signature}
+    \\renewcommand{\\key}{$key}
+    \\renewcommand{\\bibleverse}{$verse}
+    \\renewcommand{\\arranger}{$arranger}
+
+"""
+
+# preamble for LaTeX beamer slides
+SLIDES_PREAMBLE = \
     """\\documentclass[xcolor=svgnames,table,aspectratio=169,14pt]{beamer}
     \\input{latex_templates/musicslides}
+    """
 
+# header for LaTeX beamer slides, following the preamble
+SLIDES_HEADER = \
+    """
     \\newcommand{\\name}{$song}  % TITLE
     \\newcommand{\\composer}{$composer}  % COMPOSER
     \\renewcommand{\\year}{$year}  % YEAR OF PUBLISHING
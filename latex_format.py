@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+"""
+file: latex_format.py
+
+Precompiled LaTeX formats. Loading the document class and template of a chordsheet or slides (the whole beamer stack,
+for slides) takes most of the time pdflatex spends on a short document, yet that preamble is the same for every song.
+It is dumped once into a format file with mylatexformat, and documents are then compiled with -fmt, which skips their
+preamble up to the END_OF_PREAMBLE marker. The marker is a no-op without a format, so documents still compile alone.
+"""
+
+import os
+import shutil
+import subprocess
+from build import BuildState, fingerprint, template_files, write_if_changed
+
+FORMAT_DIRECTORY = ".latex_formats"
+FORMAT_BUILDER = "mylatexformat.ltx"
+END_OF_PREAMBLE = "\\csname endofdump\\endcsname"  # end of the part of a document dumped into its format
+LATEX_ENGINE = "pdflatex"
+
+
+def get_format_path(name: str, directory: str=FORMAT_DIRECTORY) -> str:
+    """
+    :param name: str representing name of format (e.g. the template it loads)
+    :param directory: str representing path to directory of formats
+    :return: str representing absolute path to format, without its .fmt extension, as given to pdflatex -fmt
+    """
+    return os.path.abspath(os.path.join(directory, name))
+
+
+def build_format(name: str, preamble: str, build_state: BuildState=None, directory: str=FORMAT_DIRECTORY) -> str:
+    """
+    Dump a preamble into a format file, unless the format is up to date: the preamble, the templates, and the pdflatex
+    executable (a format only loads in the engine that built it) are unchanged since it was last built.
+    :param name: str representing name of format
+    :param preamble: str representing LaTeX preamble to precompile (document class and packages)
+    :param build_state: BuildState used to skip building an up-to-date format, or None to always build it
+    :param directory: str representing path to directory of formats (created if needed)
+    :return: str representing path to format to pass to pdflatex -fmt, or None if it could not be built
+    """
+    engine = shutil.which(LATEX_ENGINE)
+    if engine is None:
+        return None
+    os.makedirs(directory, exist_ok=True)
+    preamble_file = os.path.join(directory, name + ".tex")
+    format_path = get_format_path(name, directory)
+    write_if_changed(preamble_file, preamble.rstrip() + "\n" + END_OF_PREAMBLE + "\n")
+
+    stage = "fmt:" + name
+    stage_fingerprint = fingerprint(values=[engine, os.stat(os.path.realpath(engine)).st_mtime_ns],
+                                    files=[preamble_file] + template_files())
+    if build_state is not None and build_state.is_up_to_date(stage, stage_fingerprint):
+        return format_path
+
+    # templates are input relative to the working directory, as they are by documents
+    result = subprocess.run([LATEX_ENGINE, "-ini", "-interaction=nonstopmode", "-output-directory=" + directory,
+                             "-jobname=" + name, "&" + LATEX_ENGINE, FORMAT_BUILDER, preamble_file],
+                            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if result.returncode != 0 or not os.path.exists(format_path + ".fmt"):
+        if build_state is not None:
+            build_state.invalidate(stage)
+        return None
+    if build_state is not None:
+        build_state.update(stage, stage_fingerprint, [format_path + ".fmt"])
+    return format_path
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+
+"""
+file: preview_server.py
+
+Local HTTP preview of songs in any key, for pulling up a chordsheet on a tablet without running a build. Every raw
+chordsheet is parsed once and kept in memory; a file is only parsed again once its modification time or size changes.
+Rendered output is cached in memory too, keyed by the version of the song it was rendered from, and served with an
+ETag, so a client that already has it gets a 304. PDFs are compiled on first request into a directory of cached PDFs.
+
+Routes:
+  GET /songs                                       JSON list of songs, with the key of each raw chordsheet
+  GET /songs/<name>?key=<key>&format=<format>      song in key (defaults to the key of the raw chordsheet), where
+                                                   format is text (the default), tex, slides or pdf
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import threading
+import subprocess
+from collections import OrderedDict
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from build import fingerprint, template_files
+from ccli import CCLICache, CCLI_METADATA_FIELDS
+from chordsheet_parser import DEFAULT_HEADER, parse
+from classes import Song
+from generate_music import emit_document, generate_chordsheet_header, generate_slides_header
+from typing import Dict, List, Tuple
+
+PREVIEW_CACHE_DIRECTORY = ".preview_cache"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_MAX_RENDERS = 256  # rendered outputs kept in memory
+RAW_EXTENSION = ".txt"
+OUTPUT_FORMATS = {  # format to content type
+    "text": "text/plain; charset=utf-8",
+    "tex": "application/x-tex; charset=utf-8",
+    "slides": "application/x-tex; charset=utf-8",
+    "pdf": "application/pdf",
+}
+PDF_LOG_TAIL_LINES = 20  # lines of pdflatex output reported when a PDF cannot be compiled
+
+
+class PdfCache:
+    """
+    Class representing a directory of PDFs compiled from LaTeX documents, keyed by a hash of the document and the
+    templates it inputs. Each document is compiled at most once at a time, however many requests need it.
+    """
+    def __init__(self, directory: str=PREVIEW_CACHE_DIRECTORY, format_path: str=None):
+        """
+        :param directory: str representing path to cache directory (created on first compile)
+        :param format_path: str representing path to precompiled chordsheet format to compile with, or None
+        """
+        self.directory = directory
+        self.format_path = format_path
+        self.__locks = {}  # key to lock held while compiling
+        self.__lock = threading.Lock()
+
+    def get(self, tex: str) -> bytes:
+        """
+        :param tex: str representing LaTeX document
+        :return: bytes representing PDF of document, compiled unless it is cached
+        :raises FileNotFoundError: if the PDF is not cached and pdflatex is not installed
+        :raises RuntimeError: if pdflatex fails
+        """
+        key = hashlib.sha256(fingerprint(values=[self.format_path or ""], files=template_files()).encode("ascii") +
+                             tex.encode("utf-8")).hexdigest()
+        pdf = os.path.join(self.directory, key + ".pdf")
+        with self.__lock:
+            lock = self.__locks.setdefault(key, threading.Lock())
+        with lock:
+            if not os.path.exists(pdf):
+                self.__compile(key, tex)
+        with open(pdf, "rb") as f:
+            return f.read()
+
+    def __compile(self, key: str, tex: str):
+        """
+        :param key: str representing key of document, after which its files are named
+        :param tex: str representing LaTeX document
+        """
+        if shutil.which("pdflatex") is None:
+            raise FileNotFoundError("pdflatex not found.")
+        os.makedirs(self.directory, exist_ok=True)
+        tex_file = os.path.join(self.directory, key + ".tex")
+        with open(tex_file, "w") as f:
+            f.write(tex)
+        # templates are input relative to the working directory, as they are in a build
+        result = subprocess.run(["pdflatex", "--interaction=nonstopmode", "-halt-on-error",
+                                 "-output-directory=" + self.directory, "-jobname=" + key] +
+                                ([f"-fmt={self.format_path}"] if self.format_path is not None else []) + [tex_file],
+                                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                universal_newlines=True)
+        for f in os.listdir(self.directory):  # keep only the PDF
+            if f.startswith(key + ".") and not f.endswith(".pdf"):
+                os.remove(os.path.join(self.directory, f))
+        if result.returncode != 0 or not os.path.exists(os.path.join(self.directory, key + ".pdf")):
+            raise RuntimeError("\n".join(result.stdout.splitlines()[-PDF_LOG_TAIL_LINES:]))
+
+
+class SongLibrary:
+    """
+    Class representing the songs of a directory of raw chordsheets, parsed once and kept in memory along with their
+    rendered output. A song is parsed again only once its file's modification time or size changes. Safe to use from
+    several threads.
+    """
+    def __init__(self, directory: str, ccli_cache: CCLICache=None, pdf_cache: PdfCache=None,
+                 max_renders: int=DEFAULT_MAX_RENDERS):
+        """
+        :param directory: str representing path to directory of raw chordsheets
+        :param ccli_cache: CCLICache from which missing metadata is filled in (no lookups are made), or None
+        :param pdf_cache: PdfCache used to compile PDFs, or None if PDFs cannot be served
+        :param max_renders: int representing maximum number of rendered outputs kept in memory
+        """
+        self.directory = directory
+        self.ccli_cache = ccli_cache
+        self.pdf_cache = pdf_cache
+        self.max_renders = max_renders
+        self.__songs = {}  # name to (file signature, header, song)
+        self.__renders = OrderedDict()  # (name, file signature, format, key, ...) to (body, ETag), least recent first
+        self.__lock = threading.Lock()
+
+    def get_names(self) -> List[str]:
+        """
+        :return: List[str] representing sorted names of songs (filenames without extension)
+        """
+        return sorted(f[:-len(RAW_EXTENSION)] for f in os.listdir(self.directory)
+                      if f.endswith(RAW_EXTENSION) and not f.startswith("."))
+
+    def get(self, name: str) -> Tuple[Tuple[int, int], dict, Song]:
+        """
+        :param name: str representing name of song
+        :return: Tuple representing signature of the file the song was parsed from, header info, and Song
+        :raises KeyError: if there is no such song
+        """
+        if len(name) == 0 or name.startswith(".") or "/" in name or os.sep in name:
+            raise KeyError(name)
+        filename = os.path.join(self.directory, name + RAW_EXTENSION)
+        try:
+            stat = os.stat(filename)
+        except FileNotFoundError:
+            with self.__lock:
+                self.__songs.pop(name, None)
+            raise KeyError(name)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self.__lock:
+            entry = self.__songs.get(name)
+        if entry is None or entry[0] != signature:
+            header, song = parse(filename)
+            entry = (signature, header, song)
+            with self.__lock:
+                self.__songs[name] = entry
+        return entry
+
+    def load(self) -> int:
+        """
+        Parse every song which is not already in memory, so that first requests are served from memory too.
+        :return: int representing number of songs
+        """
+        names = self.get_names()
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:  # reported again if the song is requested
+                print("Cannot parse {}: {}: {}".format(name, type(e).__name__, e))
+        return len(names)
+
+    def list(self) -> List[dict]:
+        """
+        :return: List[dict] representing name, title and key of every song that can be parsed
+        """
+        songs = []
+        for name in self.get_names():
+            try:
+                _, header, song = self.get(name)
+            except Exception:
+                continue
+            songs.append({"name": name, "title": header.get("song", name), "key": song.get_key()})
+        return songs
+
+    def render(self, name: str, key: str=None, output_format: str="text") -> Tuple[bytes, str]:
+        """
+        :param name: str representing name of song
+        :param key: str representing key in which to render song, or None for the key of its raw chordsheet
+        :param output_format: str representing format of output, of OUTPUT_FORMATS
+        :return: Tuple[bytes, str] representing rendered output and its ETag
+        :raises KeyError: if there is no such song
+        :raises ValueError: if the key or format is not supported
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError("Unsupported format " + output_format + ".")
+        signature, header, song = self.get(name)
+        key = key or song.get_key()
+        render_key = (name, signature, output_format, key)
+        if output_format == "pdf":  # depends on the templates too
+            render_key += (fingerprint(files=template_files()),)
+        with self.__lock:
+            cached = self.__renders.get(render_key)
+            if cached is not None:
+                self.__renders.move_to_end(render_key)
+                return cached
+
+        if output_format == "text":
+            body = "{}\nKey: {}\n\n{}".format(header.get("song", name), key, song.generate_text(key)).encode("utf-8")
+        elif output_format == "slides":
+            body = "".join(emit_document(generate_slides_header(self.__get_header(header, key)),
+                                         song.emit_slides())).encode("utf-8")
+        else:
+            tex = "".join(emit_document(generate_chordsheet_header(self.__get_header(header, key)),
+                                        song.emit_chordsheet(key)))
+            if output_format == "tex":
+                body = tex.encode("utf-8")
+            elif self.pdf_cache is None:
+                raise FileNotFoundError("PDFs are not served.")
+            else:
+                body = self.pdf_cache.get(tex)
+
+        rendered = (body, '"{}"'.format(hashlib.sha256(body).hexdigest()[:32]))
+        with self.__lock:
+            self.__renders[render_key] = rendered
+            while len(self.__renders) > self.max_renders:
+                self.__renders.popitem(last=False)
+        return rendered
+
+    def __get_header(self, header: dict, key: str) -> dict:
+        """
+        :param header: dict representing header info of song, as parsed
+        :param key: str representing key in which song is rendered
+        :return: dict representing header info in key, with missing metadata filled in from the CCLI cache
+        """
+        header = dict(header, key=key + " " + header["major_minor"])
+        if self.ccli_cache is None or header.get("ccli", "N/A") == "N/A":
+            return header
+        fields = self.ccli_cache.get(header["ccli"])  # only the cache is read, so requests never wait on CCLI
+        if fields is not None:
+            for field in CCLI_METADATA_FIELDS:
+                if header[field] == DEFAULT_HEADER[field] and fields[field] is not None:
+                    header[field] = fields[field]
+        return header
+
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    """
+    Class representing the handling of a single HTTP request for a song. Connections are kept alive between requests.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.__respond(send_body=True)
+
+    def do_HEAD(self):
+        self.__respond(send_body=False)
+
+    def __respond(self, send_body: bool):
+        """
+        :param send_body: bool representing whether to send the body of the response (False for HEAD)
+        """
+        library = self.server.library
+        url = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        parts = [unquote(p) for p in url.path.strip("/").split("/")]
+        try:
+            if parts in ([""], ["songs"]):
+                body = json.dumps(library.list()).encode("utf-8")
+                self.__send(HTTPStatus.OK, body, "application/json", send_body=send_body)
+            elif len(parts) == 2 and parts[0] == "songs":
+                output_format = query.get("format", "text")
+                body, etag = library.render(parts[1], query.get("key"), output_format)
+                if self.__matches(etag):
+                    self.__send(HTTPStatus.NOT_MODIFIED, b"", None, etag=etag, send_body=False)
+                else:
+                    self.__send(HTTPStatus.OK, body, OUTPUT_FORMATS[output_format], etag=etag, send_body=send_body)
+            else:
+                self.__send_error(HTTPStatus.NOT_FOUND, "No such page.", send_body)
+        except KeyError:
+            self.__send_error(HTTPStatus.NOT_FOUND, "No such song.", send_body)
+        except ValueError as e:  # unsupported key or format
+            self.__send_error(HTTPStatus.BAD_REQUEST, str(e), send_body)
+        except FileNotFoundError as e:  # pdflatex not installed
+            self.__send_error(HTTPStatus.SERVICE_UNAVAILABLE, str(e), send_body)
+        except Exception as e:
+            self.__send_error(HTTPStatus.INTERNAL_SERVER_ERROR, "{}: {}".format(type(e).__name__, e), send_body)
+
+    def __matches(self, etag: str) -> bool:
+        """
+        :param etag: str representing current ETag of resource
+        :return: True if the client's If-None-Match header matches the ETag, so it already has the resource
+        """
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is None:
+            return False
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or "W/" + etag in tags
+
+    def __send(self, status: HTTPStatus, body: bytes, content_type: str=None, etag: str=None, send_body: bool=True):
+        """
+        :param status: HTTPStatus of response
+        :param body: bytes representing body of response
+        :param content_type: str representing content type of body, or None if there is no body
+        :param etag: str representing ETag of body, or None
+        :param send_body: bool representing whether to send the body
+        """
+        self.send_response(status)
+        if content_type is not None:
+            self.send_header("Content-Type", content_type)
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")  # clients revalidate, and get a 304 if unchanged
+        self.send_header("Content-Length", str(len(body)) if status != HTTPStatus.NOT_MODIFIED else "0")
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def __send_error(self, status: HTTPStatus, message: str, send_body: bool):
+        """
+        :param status: HTTPStatus of response
+        :param message: str representing explanation of error
+        :param send_body: bool representing whether to send the body
+        """
+        self.__send(status, (message + "\n").encode("utf-8"), "text/plain; charset=utf-8", send_body=send_body)
+
+
+class PreviewServer(ThreadingHTTPServer):
+    """
+    Class representing an HTTP server handling each request in its own thread, with a library of songs shared by all
+    of them.
+    """
+    daemon_threads = True
+    request_queue_size = 128  # connections waiting to be accepted; the default of 5 makes bursts of clients retry
+
+    def __init__(self, address: Tuple[str, int], library: SongLibrary):
+        """
+        :param address: Tuple[str, int] representing host and port to listen on
+        :param library: SongLibrary of songs to serve
+        """
+        super().__init__(address, PreviewRequestHandler)
+        self.library = library
+
+
+def serve(directory: str, host: str=DEFAULT_HOST, port: int=DEFAULT_PORT, ccli_cache: CCLICache=None,
+          formats: Dict[str, str]=None):
+    """
+    Serve songs until interrupted.
+    :param directory: str representing path to directory of raw chordsheets
+    :param host: str representing address to listen on (0.0.0.0 for every interface)
+    :param port: int representing port to listen on
+    :param ccli_cache: CCLICache from which missing metadata is filled in, or None
+    :param formats: dict mapping "chordsheet" to the path of its precompiled format, as returned by prepare_formats,
+    or None to compile PDFs without it
+    """
+    library = SongLibrary(directory, ccli_cache=ccli_cache,
+                          pdf_cache=PdfCache(PREVIEW_CACHE_DIRECTORY, (formats or {}).get("chordsheet")))
+    count = library.load()
+    with PreviewServer((host, port), library) as server:
+        print("Serving {} songs from {} at http://{}:{}/songs (press Ctrl-C to stop)...".format(
+            count, directory, host, server.server_address[1]))
+        server.serve_forever()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+"""
+file: rasterize.py
+
+Rasterization of a slides PDF into one PNG per slide. If poppler's pdftoppm is installed, pages are rendered straight
+at the target resolution, with the pages split into contiguous ranges rendered by concurrent pdftoppm processes.
+Otherwise, ImageMagick's convert renders the whole PDF at 300 dpi in a single process and downsamples it. Either way,
+slides are named as convert names them: <root>-0.png, <root>-1.png, ..., or <root>.png for a single slide. Given the
+LaTeX source of the slides, only frames which are not in the slide cache are rendered.
+
+Usage:
+  python3 rasterize.py <slides.pdf> <output.png> [--workers <n>] [--renderer pdftoppm|convert] [--tex <slides.tex>]
+"""
+
+import os
+import re
+import time
+import shutil
+import argparse
+import subprocess
+from build import fingerprint, template_files
+from slide_cache import SLIDE_CACHE_DIRECTORY, SlideCache, link_or_copy
+from typing import Dict, List, Tuple
+
+SLIDE_WIDTH = 1920  # pixels; slides are 16:9, so 1080 pixels high
+CONVERT_DENSITY = 300  # dpi at which convert renders before downsampling
+RENDERERS = ["pdftoppm", "convert"]  # in order of preference
+PAGE_COUNT_REGEX = "^Pages:\\s+([0-9]+)$"
+
+
+def get_renderer() -> str:
+    """
+    :return: str representing the preferred renderer installed, or None if there is none
+    """
+    if shutil.which("pdftoppm") and shutil.which("pdfinfo"):
+        return "pdftoppm"
+    if shutil.which("convert"):
+        return "convert"
+    return None
+
+
+def get_page_count(pdf: str) -> int:
+    """
+    :param pdf: str representing path to PDF
+    :return: int representing number of pages in PDF, as reported by pdfinfo
+    """
+    result = subprocess.run(["pdfinfo", pdf], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, universal_newlines=True, check=True)
+    match = re.search(PAGE_COUNT_REGEX, result.stdout, re.MULTILINE)
+    if match is None:
+        raise ValueError("pdfinfo did not report the number of pages of " + pdf)
+    return int(match.group(1))
+
+
+def get_page_ranges(pages: int, workers: int) -> List[Tuple[int, int]]:
+    """
+    Split pages into contiguous ranges of nearly equal size, one per worker.
+    :param pages: int representing number of pages
+    :param workers: int representing maximum number of ranges
+    :return: List[Tuple[int, int]] representing first and last page (counting from 1) of each range
+    """
+    count = max(1, min(pages, workers))
+    ranges = []
+    first = 1
+    for i in range(count):
+        size = pages // count + (1 if i < pages % count else 0)
+        ranges.append((first, first + size - 1))
+        first += size
+    return ranges
+
+
+def get_convert_command(pdf: str, output_png: str) -> List[str]:
+    """
+    :param pdf: str representing path to slides PDF
+    :param output_png: str representing path to PNG, which convert numbers for several slides
+    :return: List[str] representing convert command rasterizing every slide
+    """
+    return ["convert",
+            "-verbose",
+            "-density", str(CONVERT_DENSITY),
+            "-geometry", "{}x{}".format(SLIDE_WIDTH, SLIDE_WIDTH * 9 // 16),
+            pdf,
+            "-quality", "100",
+            "-sharpen", "0x1.0",
+            output_png]
+
+
+def get_pdftoppm_command(pdf: str, first: int, last: int, prefix: str) -> List[str]:
+    """
+    :param pdf: str representing path to slides PDF
+    :param first: int representing first page to render (counting from 1)
+    :param last: int representing last page to render
+    :param prefix: str representing path prefix of PNGs, to which pdftoppm appends -<page>.png
+    :return: List[str] representing pdftoppm command rendering the pages at the width of a slide
+    """
+    return ["pdftoppm", "-png", "-f", str(first), "-l", str(last), "-scale-to", str(SLIDE_WIDTH), pdf, prefix]
+
+
+def render_pages(pdf: str, pages: List[int], prefix: str, workers: int, renderer: str,
+                 page_count: int=None) -> Dict[int, str]:
+    """
+    Render some pages of a PDF to PNGs under a temporary prefix. With pdftoppm, the pages are split into contiguous
+    ranges rendered by concurrent processes; with convert, the whole PDF is rendered in one process if every page is
+    needed, or otherwise each page on its own.
+    :param pdf: str representing path to slides PDF
+    :param pages: List[int] representing pages to render (counting from 1), in increasing order
+    :param prefix: str representing path prefix of PNGs
+    :param workers: int representing maximum number of renderer processes
+    :param renderer: str representing renderer to use, of RENDERERS
+    :param page_count: int representing number of pages in PDF, or None if not known
+    :return: dict mapping each page rendered to the path of its PNG
+    """
+    if renderer == "convert":
+        if page_count is None or len(pages) == page_count:
+            subprocess.run(get_convert_command(pdf, prefix + ".png"), stdin=subprocess.DEVNULL,
+                           stdout=subprocess.DEVNULL, check=True)
+            if os.path.exists(prefix + ".png"):  # single page
+                return {1: prefix + ".png"}
+            pattern = re.compile("^" + re.escape(os.path.basename(prefix)) + "-([0-9]+)\\.png$")
+        else:
+            for page in pages:
+                subprocess.run(get_convert_command("{}[{}]".format(pdf, page - 1),
+                                                   "{}-{}.png".format(prefix, page - 1)),
+                               stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, check=True)
+            pattern = re.compile("^" + re.escape(os.path.basename(prefix)) + "-([0-9]+)\\.png$")
+        offset = 1  # convert numbers pages from 0
+    else:
+        # split runs of consecutive pages into about as many ranges as there are workers
+        runs = []
+        for page in pages:
+            if len(runs) > 0 and runs[-1][1] == page - 1:
+                runs[-1][1] = page
+            else:
+                runs.append([page, page])
+        ranges = []
+        for first, last in runs:
+            share = max(1, round(workers * (last - first + 1) / len(pages)))
+            ranges.extend((first + a - 1, first + b - 1) for a, b in get_page_ranges(last - first + 1, share))
+        processes = [subprocess.Popen(get_pdftoppm_command(pdf, first, last, "{}.part{}".format(prefix, i)),
+                                      stdin=subprocess.DEVNULL)
+                     for i, (first, last) in enumerate(ranges)]
+        failed = [process for process in processes if process.wait() != 0]
+        if len(failed) > 0:
+            raise subprocess.CalledProcessError(failed[0].returncode, failed[0].args)
+        pattern = re.compile("^" + re.escape(os.path.basename(prefix)) + "\\.part[0-9]+-([0-9]+)\\.png$")
+        offset = 0  # pdftoppm numbers pages from 1, zero-padded
+
+    directory = os.path.dirname(prefix) or "."
+    rendered = {}
+    for f in os.listdir(directory):
+        match = pattern.match(f)
+        if match is not None:
+            rendered[int(match.group(1)) + offset] = os.path.join(directory, f)
+    return rendered
+
+
+def rasterize(pdf: str, output_png: str, workers: int=None, renderer: str=None, tex_file: str=None,
+              slide_cache: SlideCache=None) -> Tuple[int, int]:
+    """
+    Render every slide of a PDF to a PNG, named as convert names them after output_png. If the LaTeX source of the
+    slides and a cache are given, slides whose frame is unchanged are taken from the cache rather than rendered, and
+    identical frames are only rendered once. PNGs of slides which no longer exist are removed.
+    :param pdf: str representing path to slides PDF
+    :param output_png: str representing path to PNG; with several slides, -<n> is inserted before the extension
+    :param workers: int representing maximum number of renderer processes at once (defaults to the number of CPUs)
+    :param renderer: str representing renderer to use, of RENDERERS, or None for the preferred renderer installed
+    :param tex_file: str representing path to LaTeX slides which were compiled into pdf, or None
+    :param slide_cache: SlideCache of rendered frames, or None to render every slide
+    :return: Tuple[int, int] representing number of slides, and number of slides rendered
+    """
+    renderer = renderer or get_renderer()
+    if renderer is None:
+        raise FileNotFoundError("Neither pdftoppm nor convert found.")
+    workers = workers or os.cpu_count() or 1
+    root = output_png.rpartition(".")[0]
+    directory = os.path.dirname(output_png) or "."
+
+    # each page of the PDF is one frame, so a frame's key identifies its PNG
+    keys = None
+    if tex_file is not None and slide_cache is not None:
+        with open(tex_file, "r") as f:
+            keys = SlideCache.get_keys(f.read(), fingerprint(values=[renderer, SLIDE_WIDTH], files=template_files()))
+    # the keys are only trusted once the pages are counted, since a frame broken over pages shifts every later page
+    page_count = get_page_count(pdf) if renderer == "pdftoppm" or (keys is not None and shutil.which("pdfinfo")) \
+        else None
+    if keys is not None and page_count is None:
+        print("pdfinfo not found, so pages of {} cannot be matched to frames; rendering every slide.".format(pdf))
+        keys = None
+    elif keys is not None and page_count != len(keys):  # e.g. a frame broken over pages
+        print("{} has {} pages but {} frames; rendering every slide.".format(pdf, page_count, len(keys)))
+        keys = None
+
+    if page_count is None:  # nothing is known about the pages; render them all as convert always has
+        rendered = render_pages(pdf, [], root + ".render", workers, renderer)
+        page_count = len(rendered)
+    else:
+        rendered = None
+
+    destinations = {page: output_png if page_count == 1 else "{}-{}.png".format(root, page - 1)
+                    for page in range(1, page_count + 1)}
+
+    # take unchanged slides from the cache, and render each missing frame once
+    missing = []
+    renders = {}  # page to render for each missing key
+    for page, destination in destinations.items():
+        key = keys[page - 1] if keys is not None else page
+        if keys is not None and slide_cache.link(key, destination):
+            continue
+        missing.append(page)
+        renders.setdefault(key, page)
+    if rendered is None and len(missing) > 0:
+        # convert is started once for the whole PDF rather than once per page, so it renders repeats too
+        wanted = sorted(renders.values()) if renderer != "convert" or len(missing) < page_count else missing
+        rendered = render_pages(pdf, wanted, root + ".render", workers, renderer, page_count=page_count)
+    pages = sorted(renders.values())
+    for page in pages:
+        os.replace(rendered[page], destinations[page])
+        if keys is not None:
+            slide_cache.put(keys[page - 1], destinations[page])
+    for page in missing:  # repeats of a frame rendered on another page
+        key = keys[page - 1] if keys is not None else page
+        if renders[key] != page:
+            link_or_copy(destinations[renders[key]], destinations[page])
+
+    # remove slides which no longer exist, and anything left over from rendering
+    expected = {os.path.basename(destination) for destination in destinations.values()}
+    stale = re.compile("^" + re.escape(os.path.basename(root)) + "(-[0-9]+|\\.render.*)?\\.png$")
+    for f in os.listdir(directory):
+        if stale.match(f) and f not in expected:
+            os.remove(os.path.join(directory, f))
+    if slide_cache is not None:
+        slide_cache.evict()
+    return page_count, len(pages)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render each slide of a slides PDF to a PNG.")
+    parser.add_argument("pdf", help="slides PDF")
+    parser.add_argument("output", help="output PNG; with several slides, -<n> is inserted before the extension")
+    parser.add_argument("-j", "--workers", dest="workers", type=int, default=None,
+                        help="number of renderer processes (defaults to number of CPUs)")
+    parser.add_argument("--renderer", dest="renderer", choices=RENDERERS, default=None,
+                        help="renderer to use (defaults to pdftoppm if installed, otherwise convert)")
+    parser.add_argument("--tex", dest="tex", default=None,
+                        help="LaTeX slides compiled into the PDF; if given, unchanged frames are taken from the cache")
+    parser.add_argument("--cache", dest="cache", default=SLIDE_CACHE_DIRECTORY,
+                        help="directory of cached slides (defaults to {})".format(SLIDE_CACHE_DIRECTORY))
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    renderer = args.renderer or get_renderer()
+    slides, rendered = rasterize(args.pdf, args.output, workers=args.workers, renderer=renderer, tex_file=args.tex,
+                                 slide_cache=SlideCache(args.cache) if args.tex is not None else None)
+    print("Rendered {} of {} slides of {} with {} in {:.2f} s".format(rendered, slides, args.pdf, renderer,
+                                                                      time.perf_counter() - start))
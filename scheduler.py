@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+"""
+file: scheduler.py
+
+Bounded-concurrency scheduler for external commands (pdflatex, convert). Jobs run on a thread pool; a job may depend
+on other jobs, in which case it only starts once they have all succeeded. The exit code and output of every job are
+collected.
+"""
+
+import os
+import time
+import subprocess
+import threading
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, List
+
+COMMAND_NOT_FOUND = 127
+
+
+class Job:
+    """
+    Class representing a single command to be run by a JobScheduler.
+    """
+    def __init__(self, name: str, args: List[str], setup: Callable[[], bool]=None,
+                 on_complete: Callable[["Job"], None]=None):
+        """
+        :param name: str representing human-friendly name of job
+        :param args: List[str] representing command and arguments to run
+        :param setup: function called in the worker thread before the command is run; if it returns False, the command
+        is skipped and the job counts as successful
+        :param on_complete: function called in the worker thread with the job once the command has finished
+        """
+        self.name = name
+        self.args = list(args)
+        self.setup = setup
+        self.on_complete = on_complete
+        self.returncode = None
+        self.log = ""
+        self.skipped = False
+        self.started = None  # seconds since the epoch at which the command started
+        self.duration = None  # wall-clock seconds for which the command ran
+        self.future = Future()
+
+    def succeeded(self) -> bool:
+        """
+        :return: True if the command ran (or was skipped by its setup) and exited with code 0, or False otherwise
+        """
+        return self.returncode == 0
+
+    def __str__(self):
+        """
+        :return: str representing job and its outcome in human-friendly form
+        """
+        if self.skipped:
+            status = "skipped"
+        elif self.returncode is None:
+            status = "not run" if self.future.done() else "pending"
+        else:
+            status = "exit {}".format(self.returncode)
+        return "{} ({})".format(self.name, status)
+
+
+class JobScheduler:
+    """
+    Class representing a pool of worker threads on which independent jobs run concurrently, up to a maximum number of
+    jobs at once (by default, the number of CPUs).
+    """
+    def __init__(self, max_workers: int=None):
+        """
+        :param max_workers: int representing maximum number of jobs to run at once, or None for the number of CPUs
+        """
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.jobs = []
+        self.__executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self.__lock = threading.Lock()
+
+    def submit(self, name: str, args: List[str], after: List[Job]=(), setup: Callable[[], bool]=None,
+               on_complete: Callable[[Job], None]=None) -> Job:
+        """
+        Schedule a command to be run.
+        :param name: str representing human-friendly name of job
+        :param args: List[str] representing command and arguments to run
+        :param after: List[Job] representing jobs which must succeed before this job starts; if any of them fails, this
+        job is not run
+        :param setup: function called before the command is run; if it returns False, the command is skipped
+        :param on_complete: function called with the job once the command has finished
+        :return: Job representing the scheduled command
+        """
+        job = Job(name, args, setup=setup, on_complete=on_complete)
+        with self.__lock:
+            self.jobs.append(job)
+
+        dependencies = [d for d in after if d is not None]
+        if len(dependencies) == 0:
+            self.__executor.submit(self.__run, job)
+            return job
+
+        remaining = [len(dependencies)]
+
+        def dependency_done(_):
+            with self.__lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                if all(d.succeeded() for d in dependencies):
+                    self.__executor.submit(self.__run, job)
+                else:  # do not run on the output of a failed job
+                    job.log = "Not run, since a job it depends on failed."
+                    job.future.set_result(job)
+
+        for d in dependencies:
+            d.future.add_done_callback(dependency_done)
+        return job
+
+    def wait(self, jobs: List[Job]=None) -> List[Job]:
+        """
+        Block until jobs have finished.
+        :param jobs: List[Job] representing jobs to wait for, or None for every job submitted so far
+        :return: List[Job] representing the finished jobs
+        """
+        if jobs is None:
+            with self.__lock:
+                jobs = list(self.jobs)
+        wait([job.future for job in jobs])
+        return jobs
+
+    def shutdown(self):
+        """
+        Wait for all jobs, then release the worker threads.
+        """
+        self.wait()
+        self.__executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+
+    @staticmethod
+    def __run(job: Job):
+        """
+        Run a job in a worker thread, collecting its exit code and combined stdout/stderr.
+        :param job: Job to run
+        """
+        try:
+            if job.setup is not None and not job.setup():
+                job.skipped = True
+                job.returncode = 0
+            else:
+                job.started = time.time()
+                start = time.perf_counter()
+                try:
+                    result = subprocess.run(job.args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                            stderr=subprocess.STDOUT)
+                except FileNotFoundError as e:  # command not installed
+                    job.returncode = COMMAND_NOT_FOUND
+                    job.log += str(e)
+                    return
+                finally:
+                    job.duration = time.perf_counter() - start
+                job.returncode = result.returncode
+                job.log = result.stdout.decode("utf-8", errors="replace")
+            if job.on_complete is not None:  # errors raised here (e.g. a missing output) are not the command's
+                job.on_complete(job)
+        except Exception:
+            job.returncode = -1
+            job.log += traceback.format_exc()
+        finally:
+            job.future.set_result(job)
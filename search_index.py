@@ -0,0 +1,565 @@
+#!/usr/bin/env python3
+
+"""
+file: search_index.py
+
+Full-text search over a library of raw chordsheets. Each song is indexed by the words of its title, its lyrics (without
+chords, so words split by chord markup are found whole), its section names and its CCLI number. The index is an
+inverted index in a SQLite database: a posting for each occurrence of a term, keyed by term, song, field and position,
+so that a term's postings are read in order by a single index seek. Phrases are matched by joining the postings of
+consecutive terms on position, and prefixes by a range of terms. The index is updated incrementally: only files whose
+modification time or size changed are parsed again.
+
+Chord progressions are indexed too, independently of key: each chord is named by the scale degree of its root,
+counted in semitones from the tonic of its song's key (I, ii, bVII, ...; lowercase for minor chords), with repeated
+chords collapsed. Every sequence of up to PROGRESSION_GRAM_LENGTH degrees within a section is a posting, so a
+progression is found by looking up its n-grams and joining them on position.
+
+Query syntax:
+  wretch            songs containing the word (in any field)
+  "wretch like me"  songs containing the phrase
+  wret*             songs containing a word starting with wret (also at the end of a phrase: "amazing gr*")
+  title:grace       restrict a word or phrase to a field, of title, lyrics, section and ccli
+Songs must match every word or phrase of a query.
+
+Progression syntax: scale degrees separated by spaces or dashes, as roman numerals (I V vi IV, with b or # before
+the numeral and ° after it for diminished) or Nashville numbers (1 5 6m 4), or chords in a given key (G D Em C).
+"""
+
+import os
+import re
+import sqlite3
+from bisect import bisect_right
+from collections import defaultdict
+from fnmatch import fnmatchcase
+from functools import lru_cache
+from classes import Notes, Section, Song
+from song_cache import SongCache
+from typing import Dict, Iterable, List, Tuple, Union
+
+SEARCH_INDEX_FILE = ".search_index.sqlite"
+INDEX_SCHEMA_VERSION = 2  # bump when the schema, tokenization or naming of degrees changes
+FIELDS = {"title": 0, "lyrics": 1, "section": 2, "ccli": 3}
+FIELD_WEIGHTS = {0: 5, 1: 1, 2: 1, 3: 5}  # score of a match in each field
+SECTION_GAP = 2  # positions between lines of different sections, so that phrases do not span sections
+DEFAULT_LIMIT = 20
+TOKEN_PATTERN = re.compile("[^\\W_]+(?:'[^\\W_]+)*")
+QUERY_PATTERN = re.compile("(?:(?P<field>[a-z]+):)?(?:\"(?P<phrase>[^\"]*)\"?|(?P<word>\\S+))")
+APOSTROPHES = str.maketrans({"’": "'", "‘": "'"})
+PROGRESSION_GRAM_LENGTH = 3  # longest sequence of degrees with its own postings
+DEGREE_CACHE_SIZE = 4096  # (chord, key) pairs; a library uses few distinct chords
+DEGREE_NUMERALS = ["I", "bII", "II", "bIII", "III", "IV", "#IV", "V", "bVI", "VI", "bVII", "VII"]  # by semitone
+NUMERAL_SEMITONES = {"I": 0, "II": 2, "III": 4, "IV": 5, "V": 7, "VI": 9, "VII": 11}
+NASHVILLE_NUMERALS = ["I", "II", "III", "IV", "V", "VI", "VII"]
+DEGREE_PATTERN = re.compile("^(?P<accidental>[b#]?)(?:(?P<numeral>[IViv]+)|(?P<number>[1-7]))(?P<quality>m|°|o|dim)?$")
+PROGRESSION_SEPARATOR_PATTERN = re.compile("[\\s,–—-]+")
+TABLES = ["metadata", "documents", "terms", "postings", "sections", "progressions", "progression_sections"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, path TEXT UNIQUE, mtime_ns INTEGER, size INTEGER,
+                                      title TEXT, ccli TEXT, key TEXT);
+CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, term TEXT UNIQUE, df INTEGER);
+CREATE TABLE IF NOT EXISTS postings (term INTEGER, doc INTEGER, field INTEGER, position INTEGER,
+                                     PRIMARY KEY (term, doc, field, position)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc);
+CREATE TABLE IF NOT EXISTS sections (doc INTEGER, position INTEGER, name TEXT, PRIMARY KEY (doc, position))
+    WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS progressions (gram TEXT, doc INTEGER, position INTEGER, PRIMARY KEY (gram, doc, position))
+    WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS progressions_doc ON progressions (doc);
+CREATE TABLE IF NOT EXISTS progression_sections (doc INTEGER, position INTEGER, name TEXT,
+                                                 PRIMARY KEY (doc, position)) WITHOUT ROWID;
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    :param text: str representing text to split into terms
+    :return: List[str] representing lowercase words of text, in order (apostrophes within words are kept)
+    """
+    return TOKEN_PATTERN.findall(text.lower().translate(APOSTROPHES))
+
+
+def parse_query(query: str) -> List[Tuple[int, List[Tuple[str, bool]]]]:
+    """
+    :param query: str representing query, as described in the module documentation
+    :return: List of tuples (field, or None for every field; terms of phrase, each with whether it is a prefix)
+    :raises ValueError: if the query names an unknown field
+    """
+    components = []
+    for match in QUERY_PATTERN.finditer(query):
+        field = match.group("field")
+        if field is not None and field not in FIELDS:
+            raise ValueError("Unknown field " + field + "; expected one of " + ", ".join(FIELDS) + ".")
+        text = match.group("phrase") if match.group("phrase") is not None else match.group("word")
+        terms = []
+        for word in text.split():
+            tokens = tokenize(word)
+            terms.extend((token, False) for token in tokens)
+            if word.endswith("*") and len(terms) > 0:
+                terms[-1] = (terms[-1][0], True)
+        if len(terms) > 0:
+            components.append((FIELDS[field] if field is not None else None, terms))
+    return components
+
+
+def get_document_postings(header: dict, song: Song) -> Tuple[List[Tuple[str, int, int]], List[Tuple[int, str]]]:
+    """
+    :param header: dict representing header info of song, as parsed
+    :param song: Song to index
+    :return: Tuple representing (term, field, position) of every word of song, and (position of first lyric, name) of
+    each section
+    """
+    postings = []
+    for position, term in enumerate(tokenize(header.get("song", ""))):
+        postings.append((term, FIELDS["title"], position))
+    for position, term in enumerate(tokenize(header.get("ccli", "").replace("N/A", ""))):
+        postings.append((term, FIELDS["ccli"], position))
+    sections = []
+    lyric_position = 0
+    section_position = 0
+    for name, section in song.get_sections().items():
+        sections.append((lyric_position, name))
+        for term in tokenize(name):
+            postings.append((term, FIELDS["section"], section_position))
+            section_position += 1
+        section_position += SECTION_GAP
+        for line in section.lines:
+            for term in tokenize(line.get_lyrics()):
+                postings.append((term, FIELDS["lyrics"], lyric_position))
+                lyric_position += 1
+        lyric_position += SECTION_GAP
+    return postings, sections
+
+
+def matches_pattern(path: str, pattern: str) -> bool:
+    """
+    :param path: str representing path to file
+    :param pattern: str representing glob pattern
+    :return: True if glob would match path with pattern, i.e. each component of path matches that of pattern
+    """
+    parts = os.path.normpath(path).split(os.sep)
+    pattern_parts = os.path.normpath(pattern).split(os.sep)
+    return len(parts) == len(pattern_parts) and all(fnmatchcase(part, pattern_part)
+                                                    for part, pattern_part in zip(parts, pattern_parts))
+
+
+def get_semitone(note: str) -> int:
+    """
+    :param note: str representing note, as a letter and a sharp (#) or flat (b) if any
+    :return: int representing number of semitones from C up to note, or None if it is not a note
+    """
+    for notes in Notes.notes_by_spelling.values():
+        if note in notes:
+            return notes.index(note)
+    return None
+
+
+@lru_cache(maxsize=DEGREE_CACHE_SIZE)
+def get_degree(chord: str, key_semitone: int) -> str:
+    """
+    :param chord: str representing chord, e.g. "Em7" or "D/F#"
+    :param key_semitone: int representing number of semitones from C up to the tonic of the key
+    :return: str representing scale degree of chord in key, as a roman numeral which is lowercase for a minor or
+    diminished chord (e.g. "vi" for Em in G), or None if chord has no root note
+    """
+    match = Notes.NOTE_REGEX.match(chord)
+    semitone = get_semitone(match.group(0)) if match is not None else None
+    if semitone is None:
+        return None
+    numeral = DEGREE_NUMERALS[(semitone - key_semitone) % len(DEGREE_NUMERALS)]
+    quality = chord[match.end():].split("/")[0]  # a bass note does not change the degree
+    if quality.startswith("dim") or quality.startswith("°"):
+        return numeral.lower() + "°"
+    if quality.startswith("m") and not quality.startswith("maj"):
+        return numeral.lower()
+    return numeral
+
+
+def get_section_degrees(section: Section, key_semitone: int) -> List[str]:
+    """
+    :param section: Section whose chords to name
+    :param key_semitone: int representing number of semitones from C up to the tonic of the song's key
+    :return: List[str] representing scale degrees of the chords of section, in the order they are played, with
+    repeated chords collapsed
+    """
+    degrees = []
+    for line in section.lines:
+        for chord in line.get_chords():
+            degree = get_degree(str(chord), key_semitone)
+            if degree is not None and (len(degrees) == 0 or degrees[-1] != degree):  # a repeat is not a change
+                degrees.append(degree)
+    return degrees
+
+
+def get_progression_postings(song: Song) -> Tuple[List[Tuple[str, int]], List[Tuple[int, str]]]:
+    """
+    :param song: Song to index
+    :return: Tuple representing (n-gram of degrees, position) of every sequence of up to PROGRESSION_GRAM_LENGTH
+    chords within a section, and (first position, name) of each section with chords
+    """
+    key_semitone = get_semitone(song.get_key())
+    if key_semitone is None:
+        return [], []
+    grams = []
+    sections = []
+    position = 0
+    for name, section in song.get_sections().items():
+        degrees = get_section_degrees(section, key_semitone)
+        if len(degrees) == 0:
+            continue
+        sections.append((position, name))
+        for i in range(len(degrees)):
+            for length in range(1, min(PROGRESSION_GRAM_LENGTH, len(degrees) - i) + 1):
+                grams.append((" ".join(degrees[i:i + length]), position + i))
+        position += len(degrees) + SECTION_GAP
+    return grams, sections
+
+
+def parse_progression(progression: str, key: str=None) -> List[str]:
+    """
+    :param progression: str representing progression, as described in the module documentation
+    :param key: str representing key in which progression is given as chords, or None if it is given as degrees
+    :return: List[str] representing scale degrees of progression, as named in the index, with repeats collapsed
+    :raises ValueError: if the progression cannot be parsed
+    """
+    key_semitone = None
+    if key is not None:
+        key_semitone = get_semitone(key)
+        if key_semitone is None:
+            raise ValueError(key + " is not a key.")
+    degrees = []
+    for token in PROGRESSION_SEPARATOR_PATTERN.split(progression.strip()):
+        if len(token) == 0:
+            continue
+        if key_semitone is not None:
+            degree = get_degree(token, key_semitone)
+            if degree is None:
+                raise ValueError(token + " is not a chord.")
+        else:
+            match = DEGREE_PATTERN.match(token)
+            if match is None or (match.group("numeral") is not None and
+                                 match.group("numeral").upper() not in NUMERAL_SEMITONES):
+                raise ValueError(token + " is not a scale degree.")
+            if match.group("numeral") is not None:
+                numeral = match.group("numeral")
+                minor = numeral.islower() or match.group("quality") == "m"
+            else:
+                numeral = NASHVILLE_NUMERALS[int(match.group("number")) - 1]
+                minor = match.group("quality") == "m"
+            semitone = NUMERAL_SEMITONES[numeral.upper()] + {"b": -1, "#": 1, "": 0}[match.group("accidental")]
+            degree = DEGREE_NUMERALS[semitone % len(DEGREE_NUMERALS)]
+            if match.group("quality") in ("°", "o", "dim"):
+                degree = degree.lower() + "°"
+            elif minor:
+                degree = degree.lower()
+        if len(degrees) == 0 or degrees[-1] != degree:
+            degrees.append(degree)
+    return degrees
+
+
+class SearchIndex:
+    """
+    Class representing an on-disk inverted index of songs.
+    """
+    def __init__(self, filename: str=SEARCH_INDEX_FILE, version: str=""):
+        """
+        :param filename: str representing path to index database (created if needed)
+        :param version: str representing version of the parser; if the index was built by any other version, it is
+        emptied, so every song is indexed again on the next update
+        """
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] != INDEX_SCHEMA_VERSION:
+            self.connection.executescript("".join("DROP TABLE IF EXISTS {};".format(table) for table in TABLES))
+            self.connection.execute("PRAGMA user_version = {}".format(INDEX_SCHEMA_VERSION))
+        self.connection.executescript(SCHEMA)
+        row = self.connection.execute("SELECT value FROM metadata WHERE key = 'version'").fetchone()
+        if row is None or row[0] != version:
+            self.clear()
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO metadata VALUES ('version', ?)", (version,))
+
+    def clear(self, pattern: str=None):
+        """
+        Remove every song from the index, or only those matching a pattern.
+        :param pattern: str representing glob pattern of paths of songs to remove, or None to remove every song
+        """
+        with self.connection:
+            if pattern is None:
+                for table in TABLES[1:]:  # the version in metadata is kept
+                    self.connection.execute("DELETE FROM " + table)
+                return
+            affected = set()
+            for doc, path in list(self.connection.execute("SELECT id, path FROM documents")):
+                if matches_pattern(path, pattern):
+                    affected.update(self.__remove(doc))
+            self.connection.executemany("UPDATE terms SET df = (SELECT COUNT(DISTINCT doc) FROM postings "
+                                        "WHERE term = ?) WHERE id = ?", [(term, term) for term in affected])
+            self.connection.execute("DELETE FROM terms WHERE df = 0")
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def update(self, files: List[str], song_cache: SongCache=None, pattern: str=None) -> Tuple[int, int]:
+        """
+        Bring the index up to date with a library, or part of it: index files which are new or whose modification time
+        or size changed, and remove files which are no longer in it.
+        :param files: List[str] representing paths to every raw chordsheet in the library, or in the part matching
+        pattern
+        :param song_cache: SongCache used to reuse earlier parses, or None to always parse
+        :param pattern: str representing glob pattern files were found with; only indexed files matching it are
+        removed if they are not in files. If None, files is the whole library, and every other indexed file is removed.
+        :return: Tuple[int, int] representing number of files indexed, and number of files removed
+        """
+        from generate_music import p_warning, parse_cached
+
+        existing = {path: (doc, mtime_ns, size) for doc, path, mtime_ns, size in
+                    self.connection.execute("SELECT id, path, mtime_ns, size FROM documents")}
+        indexed = 0
+        affected = set()  # terms whose document frequency may have changed
+        term_ids = None
+        with self.connection:
+            for path in files:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entry = existing.pop(path, None)
+                if entry is not None and entry[1:] == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                if entry is not None:
+                    affected.update(self.__remove(entry[0]))
+                try:
+                    header, song = parse_cached(path, song_cache)
+                    postings, sections = get_document_postings(header, song)
+                    grams, progression_sections = get_progression_postings(song)
+                except Exception as e:  # indexed again once the file changes
+                    p_warning("Cannot index {}: {}: {}".format(path, type(e).__name__, e))
+                    continue
+                if term_ids is None:
+                    term_ids = dict(self.connection.execute("SELECT term, id FROM terms"))
+                doc = self.connection.execute("INSERT INTO documents (path, mtime_ns, size, title, ccli, key) "
+                                              "VALUES (?, ?, ?, ?, ?, ?)",
+                                              (path, stat.st_mtime_ns, stat.st_size, header.get("song", ""),
+                                               header.get("ccli", ""), song.get_key())).lastrowid
+                rows = []
+                for term, field, position in postings:
+                    term_id = term_ids.get(term)
+                    if term_id is None:
+                        term_id = self.connection.execute("INSERT INTO terms (term, df) VALUES (?, 0)",
+                                                          (term,)).lastrowid
+                        term_ids[term] = term_id
+                    rows.append((term_id, doc, field, position))
+                    affected.add(term_id)
+                self.connection.executemany("INSERT INTO postings VALUES (?, ?, ?, ?)", rows)
+                self.connection.executemany("INSERT INTO sections VALUES (?, ?, ?)",
+                                            [(doc, position, name) for position, name in sections])
+                self.connection.executemany("INSERT INTO progressions VALUES (?, ?, ?)",
+                                            [(gram, doc, position) for gram, position in grams])
+                self.connection.executemany("INSERT INTO progression_sections VALUES (?, ?, ?)",
+                                            [(doc, position, name) for position, name in progression_sections])
+                indexed += 1
+            removed = [doc for path, (doc, _, _) in existing.items()
+                       if pattern is None or matches_pattern(path, pattern)]
+            for doc in removed:  # no longer in the library
+                affected.update(self.__remove(doc))
+            self.connection.executemany("UPDATE terms SET df = (SELECT COUNT(DISTINCT doc) FROM postings "
+                                        "WHERE term = ?) WHERE id = ?", [(term, term) for term in affected])
+            self.connection.execute("DELETE FROM terms WHERE df = 0")
+        return indexed, len(removed)
+
+    def __remove(self, doc: int) -> set:
+        """
+        :param doc: int representing document to remove from the index
+        :return: set representing terms which occurred in the document
+        """
+        terms = {term for term, in self.connection.execute("SELECT DISTINCT term FROM postings WHERE doc = ?", (doc,))}
+        for statement in ["DELETE FROM postings WHERE doc = ?", "DELETE FROM sections WHERE doc = ?",
+                          "DELETE FROM progressions WHERE doc = ?", "DELETE FROM progression_sections WHERE doc = ?",
+                          "DELETE FROM documents WHERE id = ?"]:
+            self.connection.execute(statement, (doc,))
+        return terms
+
+    def search(self, query: str, limit: int=DEFAULT_LIMIT) -> List[dict]:
+        """
+        :param query: str representing query, as described in the module documentation
+        :param limit: int representing maximum number of songs to return
+        :return: List[dict] representing path, title, CCLI number, score and sections matched of each song matching
+        every word or phrase of query, best first
+        :raises ValueError: if the query is not valid
+        """
+        components = parse_query(query)
+        if len(components) == 0:
+            return []
+
+        # match the rarest component first, so that the others are only matched within the songs it matched
+        components.sort(key=lambda component: self.__estimate(component[1]))
+        scores = None  # document to score of its matches
+        for field, terms in components:
+            matches = self.__match(field, terms, None if scores is None else list(scores))
+            scores = matches if scores is None else \
+                {doc: scores[doc] + matches[doc] for doc in scores if doc in matches}
+            if len(scores) == 0:
+                return []
+
+        ranked, documents = self.__rank(scores, limit)
+
+        # name the sections in which lyrics matched, from the positions of the matches in the songs ranked
+        positions = defaultdict(set)
+        for field, terms in components:
+            if field is None or field == FIELDS["lyrics"]:
+                for doc, matched in self.__match(FIELDS["lyrics"], terms, ranked, positions=True).items():
+                    positions[doc].update(matched)
+        sections = self.__get_sections("sections", ranked, positions)
+        return [dict(documents[doc], score=scores[doc], sections=sections[doc]) for doc in ranked]
+
+    def search_progression(self, degrees: List[str], limit: int=DEFAULT_LIMIT) -> List[dict]:
+        """
+        :param degrees: List[str] representing scale degrees of progression, as returned by parse_progression
+        :param limit: int representing maximum number of songs to return
+        :return: List[dict] representing path, title, CCLI number, key, number of times the progression is played and
+        sections in which it is played of each song containing the progression, most occurrences first
+        """
+        if len(degrees) == 0:
+            return []
+
+        # cover the progression with as few n-grams as possible, the last overlapping the one before if needed
+        length = min(len(degrees), PROGRESSION_GRAM_LENGTH)
+        offsets = list(range(0, len(degrees) - length + 1, length))
+        if offsets[-1] != len(degrees) - length:
+            offsets.append(len(degrees) - length)
+        joins = ["JOIN progressions g{0} ON g{0}.doc = g0.doc AND g{0}.position = g0.position + {1} "
+                 "AND g{0}.gram = ?".format(i, offset) for i, offset in enumerate(offsets) if i > 0]
+        grams = [" ".join(degrees[offset:offset + length]) for offset in offsets]
+        positions = defaultdict(list)
+        for doc, position in self.connection.execute("SELECT g0.doc, g0.position FROM progressions g0 {} "
+                                                     "WHERE g0.gram = ?".format(" ".join(joins)),
+                                                     grams[1:] + grams[:1]):
+            positions[doc].append(position)
+        if len(positions) == 0:
+            return []
+
+        counts = {doc: len(matched) for doc, matched in positions.items()}
+        ranked, documents = self.__rank(counts, limit)
+        sections = self.__get_sections("progression_sections", ranked, positions)
+        return [dict(documents[doc], count=counts[doc], sections=sections[doc]) for doc in ranked]
+
+    def __rank(self, scores: Dict[int, int], limit: int) -> Tuple[List[int], Dict[int, dict]]:
+        """
+        Rank documents by score, then title. Only documents which may be ranked are looked up.
+        :param scores: dict mapping each document matched to its score
+        :param limit: int representing maximum number of documents to rank
+        :return: Tuple representing the documents ranked, best first, and a dict mapping each of them to its path,
+        title, CCLI number and key
+        """
+        by_score = sorted(scores, key=lambda doc: -scores[doc])
+        cutoff = scores[by_score[min(limit, len(by_score)) - 1]] if limit > 0 else float("inf")
+        documents = {doc: {"path": path, "title": title, "ccli": ccli, "key": key}
+                     for doc, path, title, ccli, key in self.__select_in(
+                         "SELECT id, path, title, ccli, key FROM documents WHERE id IN ({})",
+                         [doc for doc in by_score if scores[doc] >= cutoff])}
+        ranked = sorted(documents, key=lambda doc: (-scores[doc], documents[doc]["title"]))[:limit]
+        return ranked, documents
+
+    def __get_sections(self, table: str, documents: List[int], positions: Dict[int, Iterable[int]]) -> \
+            Dict[int, List[str]]:
+        """
+        :param table: str representing table mapping the first position of each section to its name
+        :param documents: List[int] representing documents whose sections to name
+        :param positions: dict mapping each document to the positions of its matches
+        :return: dict mapping each document to the names of the sections in which it matched, in order of position
+        """
+        sections = defaultdict(list)
+        for doc, position, name in self.__select_in("SELECT doc, position, name FROM " + table +
+                                                    " WHERE doc IN ({}) ORDER BY doc, position", documents):
+            sections[doc].append((position, name))
+        names = {}
+        for doc in documents:
+            starts = [position for position, _ in sections[doc]]
+            names[doc] = []
+            for position in sorted(positions.get(doc, ())):
+                if len(starts) > 0:
+                    name = sections[doc][max(0, bisect_right(starts, position) - 1)][1]
+                    if name not in names[doc]:
+                        names[doc].append(name)
+        return names
+
+    def __estimate(self, terms: List[Tuple[str, bool]]) -> int:
+        """
+        :param terms: List[Tuple[str, bool]] representing terms of phrase, each with whether it is a prefix
+        :return: int representing an upper bound on the number of songs matching the phrase
+        """
+        estimate = None
+        for term, prefix in terms:
+            if prefix:
+                row = self.connection.execute("SELECT SUM(df) FROM terms WHERE term >= ? AND term < ?",
+                                              (term, term + "\uffff")).fetchone()
+            else:
+                row = self.connection.execute("SELECT df FROM terms WHERE term = ?", (term,)).fetchone()
+            count = (row[0] if row is not None else 0) or 0
+            estimate = count if estimate is None else min(estimate, count)
+        return estimate
+
+    def __match(self, field: int, terms: List[Tuple[str, bool]], documents: List[int]=None,
+                positions: bool=False) -> Dict[int, Union[int, List[int]]]:
+        """
+        :param field: int representing field in which to match phrase, or None for every field
+        :param terms: List[Tuple[str, bool]] representing terms of phrase, each with whether it is a prefix
+        :param documents: List[int] representing the only documents to match in, or None for every document
+        :param positions: bool representing whether to return the position of each match rather than a score
+        :return: dict mapping each document matched to the score of its matches (weighted by field), or to the
+        position of each match
+        """
+        joins = []
+        conditions = []
+        parameters = []
+        for i, (term, prefix) in enumerate(terms):
+            if i > 0:
+                joins.append("JOIN postings p{0} ON p{0}.doc = p0.doc AND p{0}.field = p0.field "
+                             "AND p{0}.position = p0.position + {0}".format(i))
+            if prefix:
+                conditions.append("p{}.term IN (SELECT id FROM terms WHERE term >= ? AND term < ?)".format(i))
+                parameters.extend([term, term + "\uffff"])
+            else:
+                conditions.append("p{}.term = (SELECT id FROM terms WHERE term = ?)".format(i))
+                parameters.append(term)
+        if field is not None:
+            conditions.append("p0.field = ?")
+            parameters.append(field)
+        if documents is not None:
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS candidates (doc INTEGER PRIMARY KEY)")
+            self.connection.execute("DELETE FROM candidates")
+            self.connection.executemany("INSERT INTO candidates VALUES (?)", [(doc,) for doc in documents])
+            conditions.append("p0.doc IN (SELECT doc FROM candidates)")
+        statement = "FROM postings p0 {} WHERE {}".format(" ".join(joins), " AND ".join(conditions))
+
+        if positions:
+            matches = defaultdict(list)
+            for doc, position in self.connection.execute("SELECT p0.doc, p0.position " + statement, parameters):
+                matches[doc].append(position)
+            return matches
+        # count matches in the database, so that a common term does not return a row per occurrence
+        matches = defaultdict(int)
+        for doc, matched_field, count in self.connection.execute(
+                "SELECT p0.doc, p0.field, COUNT(*) " + statement + " GROUP BY p0.doc, p0.field", parameters):
+            matches[doc] += FIELD_WEIGHTS[matched_field] * count
+        return matches
+
+    def __select_in(self, statement: str, values: List[int]) -> Iterable[tuple]:
+        """
+        :param statement: str representing SELECT statement with a single placeholder for a list of values
+        :param values: List[int] representing values, which are passed in batches small enough for SQLite
+        :return: Iterable[tuple] representing rows selected
+        """
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            yield from self.connection.execute(statement.format(", ".join("?" * len(batch))), batch)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+
+"""
+file: slide_cache.py
+
+On-disk cache of rasterized slides. Each entry is the PNG of a single beamer frame, keyed by a hash of the frame's LaTeX
+source, the header of the slides it appears in, and anything else it was rendered from (templates, renderer), so a
+frame which has not changed is never rendered again. Entries are hard-linked into place where possible. The cache is
+bounded in size; the least recently used entries are evicted first.
+"""
+
+import os
+import re
+import shutil
+import hashlib
+from typing import List, Tuple
+
+SLIDE_CACHE_DIRECTORY = ".slide_cache"
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024  # bytes
+ENTRY_EXTENSION = ".png"
+BEGIN_DOCUMENT = "\\begin{document}"
+FRAME_PATTERN = re.compile("\\\\begin\\{frame\\}.*?\\\\end\\{frame\\}", re.DOTALL)
+
+
+def split_frames(tex: str) -> Tuple[str, List[str]]:
+    """
+    :param tex: str representing LaTeX slides document
+    :return: Tuple[str, List[str]] representing header of document (everything before the document begins), and LaTeX
+    source of each frame, in order
+    """
+    header, _, body = tex.partition(BEGIN_DOCUMENT)
+    return header, FRAME_PATTERN.findall(body)
+
+
+def link_or_copy(source: str, destination: str):
+    """
+    Hard-link a file to a new path, replacing any file already there, or copy it if it cannot be linked (e.g. across
+    file systems). The destination is replaced atomically.
+    :param source: str representing path to existing file
+    :param destination: str representing path to link or copy to
+    """
+    temporary = "{}.{}.tmp".format(destination, os.getpid())
+    try:
+        try:
+            os.link(source, temporary)
+        except OSError as e:
+            if isinstance(e, FileNotFoundError):
+                raise
+            shutil.copyfile(source, temporary)
+        os.replace(temporary, destination)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+
+class SlideCache:
+    """
+    Class representing a directory of cached slide PNGs. Entries are written atomically, so several processes may share
+    a cache.
+    """
+    def __init__(self, directory: str=SLIDE_CACHE_DIRECTORY, max_size: int=DEFAULT_MAX_SIZE):
+        """
+        :param directory: str representing path to cache directory (created on first write)
+        :param max_size: int representing maximum total size of entries in bytes
+        """
+        self.directory = directory
+        self.max_size = max_size
+
+    @staticmethod
+    def get_keys(tex: str, context: str="") -> List[str]:
+        """
+        :param tex: str representing LaTeX slides document
+        :param context: str representing anything else the slides are rendered from (e.g. a fingerprint of the
+        templates and the renderer)
+        :return: List[str] representing key of each frame of document, in order
+        """
+        header, frames = split_frames(tex)
+        base = hashlib.sha256(context.encode("utf-8") + b"\0" + header.encode("utf-8") + b"\0")
+        keys = []
+        for frame in frames:
+            h = base.copy()
+            h.update(frame.encode("utf-8"))
+            keys.append(h.hexdigest())
+        return keys
+
+    def link(self, key: str, destination: str) -> bool:
+        """
+        Put the cached PNG of a frame in place.
+        :param key: str representing key of frame
+        :param destination: str representing path at which the PNG is needed
+        :return: True if the frame was cached and is now at destination, or False otherwise
+        """
+        path = self.__get_path(key)
+        try:
+            if not (os.path.exists(destination) and os.path.samefile(path, destination)):
+                link_or_copy(path, destination)
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:  # not cached, or evicted by another process
+            return False
+        return True
+
+    def put(self, key: str, source: str):
+        """
+        Store the PNG of a frame.
+        :param key: str representing key of frame
+        :param source: str representing path to PNG, which is linked (or copied) into the cache
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        link_or_copy(source, self.__get_path(key))
+
+    def evict(self):
+        """
+        Remove least recently used entries until the total size of the cache is at most its maximum size.
+        """
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(ENTRY_EXTENSION):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # removed by another process
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+            total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def __get_path(self, key: str) -> str:
+        """
+        :param key: str representing key of frame
+        :return: str representing path to file of entry
+        """
+        return os.path.join(self.directory, key + ENTRY_EXTENSION)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+"""
+file: song_cache.py
+
+On-disk cache of parsed raw chordsheets. Each entry is the pickled result of parsing a file, keyed by a hash of the
+file's content and of the parser version, so an entry is never used for a file that has changed or with a parser that
+has changed. The cache is bounded in size; the least recently used entries are evicted first. A long-running process
+can keep entries in memory in front of the on-disk cache.
+"""
+
+import os
+import pickle
+import hashlib
+from collections import OrderedDict
+
+SONG_CACHE_DIRECTORY = ".song_cache"
+DEFAULT_MAX_SIZE = 32 * 1024 * 1024  # bytes
+DEFAULT_MAX_ENTRIES = 1024  # entries kept in memory
+ENTRY_EXTENSION = ".pickle"
+
+
+class SongCache:
+    """
+    Class representing a directory of cached parse results. Entries are written atomically, so several processes may
+    share a cache.
+    """
+    def __init__(self, directory: str=SONG_CACHE_DIRECTORY, version: str="", max_size: int=DEFAULT_MAX_SIZE):
+        """
+        :param directory: str representing path to cache directory (created on first write)
+        :param version: str representing version of the parser; entries written by any other version are ignored
+        :param max_size: int representing maximum total size of entries in bytes
+        """
+        self.directory = directory
+        self.version = version
+        self.max_size = max_size
+
+    def get_key(self, content: bytes) -> str:
+        """
+        :param content: bytes representing content of raw chordsheet
+        :return: str representing key of entry for content under the current parser version
+        """
+        h = hashlib.sha256(self.version.encode("utf-8") + b"\0")
+        h.update(content)
+        return h.hexdigest()
+
+    def get(self, content: bytes):
+        """
+        :param content: bytes representing content of raw chordsheet
+        :return: cached parse result for content, or None if there is none (or it cannot be read)
+        """
+        path = self.__get_path(self.get_key(content))
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:  # corrupt or incompatible entry; drop it
+            self.__remove(path)
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except OSError:
+            pass
+        return value
+
+    def put(self, content: bytes, value):
+        """
+        Store a parse result, then evict old entries if the cache has grown too large.
+        :param content: bytes representing content of raw chordsheet
+        :param value: parse result to cache (must be picklable)
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.__get_path(self.get_key(content))
+        temporary = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(temporary, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, path)
+        except BaseException:
+            self.__remove(temporary)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the total size of the cache is at most its maximum size.
+        """
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if not name.endswith(ENTRY_EXTENSION):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # removed by another process
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+            total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            self.__remove(path)
+            total -= size
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        max_size = self.max_size
+        self.max_size = 0
+        try:
+            self.evict()
+        finally:
+            self.max_size = max_size
+
+    def __get_path(self, key: str) -> str:
+        """
+        :param key: str representing key of entry
+        :return: str representing path to file of entry
+        """
+        return os.path.join(self.directory, key + ENTRY_EXTENSION)
+
+    @staticmethod
+    def __remove(path: str):
+        """
+        :param path: str representing path to file to remove, if it still exists
+        """
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class MemorySongCache:
+    """
+    Class representing parse results kept in memory by a long-running process (e.g. watch mode), in front of an
+    optional on-disk SongCache. Entries are kept pickled, so every lookup returns a fresh copy which the caller may
+    modify, as it would after reading from disk.
+    """
+    def __init__(self, backing: SongCache=None, max_entries: int=DEFAULT_MAX_ENTRIES):
+        """
+        :param backing: SongCache looked up on a miss and written through to, or None to keep entries only in memory
+        :param max_entries: int representing maximum number of entries kept in memory
+        """
+        self.backing = backing
+        self.max_entries = max_entries
+        self.__entries = OrderedDict()  # key to pickled parse result, least recently used first
+
+    def get(self, content: bytes):
+        """
+        :param content: bytes representing content of raw chordsheet
+        :return: cached parse result for content, or None if there is none
+        """
+        key = self.__get_key(content)
+        data = self.__entries.get(key)
+        if data is not None:
+            self.__entries.move_to_end(key)
+            return pickle.loads(data)
+        if self.backing is None:
+            return None
+        value = self.backing.get(content)
+        if value is not None:
+            self.__store(key, value)
+        return value
+
+    def put(self, content: bytes, value):
+        """
+        :param content: bytes representing content of raw chordsheet
+        :param value: parse result to cache (must be picklable)
+        """
+        self.__store(self.__get_key(content), value)
+        if self.backing is not None:
+            self.backing.put(content, value)
+
+    def __get_key(self, content: bytes) -> str:
+        """
+        :param content: bytes representing content of raw chordsheet
+        :return: str representing key of entry for content
+        """
+        return self.backing.get_key(content) if self.backing is not None else hashlib.sha256(content).hexdigest()
+
+    def __store(self, key: str, value):
+        """
+        :param key: str representing key of entry
+        :param value: parse result to keep, evicting the least recently used entry if there are too many
+        """
+        self.__entries[key] = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_entries:
+            self.__entries.popitem(last=False)
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+
+"""
+file: songbook.py
+
+Builds which combine many songs into one document: a songbook, whose chordsheets are compiled together with a single
+pdflatex run (and can be split back into a PDF per chordsheet), and a setlist, which is assembled from the PDFs and
+slide images of songs built as in a batch build, without compiling them again.
+"""
+
+import os
+import re
+import json
+import shutil
+from build import BuildState, file_digest, fingerprint, template_files, write_if_changed
+from ccli import CCLICache
+from classes import Song
+from scheduler import JobScheduler
+from song_cache import SongCache
+from timing import span
+from generate_music import emit_chordsheet, emit_document, generate_songbook_header, generate_songbook_song_header, \
+    get_chordsheet_destination, get_pdf_destination, get_slides_destination, p_warning, parse_cached, parse_keys, \
+    prefetch_ccli, prepare_formats, record_job, report_jobs, run_batch, supplement_header
+from typing import Dict, Iterator, List, Tuple
+
+
+def get_songbook_destination(path: str, name: str) -> str:
+    """
+    :param path: str representing path to output directory for chordsheets
+    :param name: str representing name of songbook
+    :return: str representing path to output LaTeX songbook file
+    """
+    return os.path.join(path, name + ".tex")
+
+
+def emit_songbook(songs: List[Tuple[str, dict, Song, str]]) -> Iterator[str]:
+    """
+    Create the body of a LaTeX songbook, one chunk at a time: the chordsheet of each song, each preceded by its header.
+    :param songs: List[Tuple[str, dict, Song, str]] representing (name, header info, song, key) of each chordsheet, in
+    order
+    :return: Iterator[str] representing chunks of body of songbook
+    """
+    for _, header_info, song, key in songs:
+        yield generate_songbook_song_header(header_info)
+        yield from emit_chordsheet(song, key)
+
+
+def read_songbook_pages(pages_file: str, count: int) -> List[Tuple[int, int]]:
+    """
+    Read the page on which each song of a compiled songbook starts, as recorded by pdflatex.
+    :param pages_file: str representing path to page file written alongside the songbook PDF
+    :param count: int representing number of songs in songbook
+    :return: List[Tuple[int, int]] representing first and last page of each song, in order
+    """
+    with open(pages_file, "r") as f:
+        starts = [int(line) for line in f if line.strip()]
+    if len(starts) != count + 1:
+        raise ValueError("{} lists {} songs, expected {}.".format(pages_file, len(starts) - 1, count))
+    return [(first, next_first - 1) for first, next_first in zip(starts, starts[1:])]
+
+
+def get_merge_command(sources: List[str], destination: str) -> List[str]:
+    """
+    :param sources: List[str] representing paths to PDFs to concatenate, in order
+    :param destination: str representing path to output PDF
+    :return: List[str] representing command concatenating the PDFs with qpdf or, failing that, ghostscript, or None if
+    neither is installed
+    """
+    if shutil.which("qpdf"):
+        return ["qpdf", "--empty", "--pages"] + list(sources) + ["--", destination]
+    if shutil.which("gs"):
+        return ["gs", "-q", "-dNOPAUSE", "-dBATCH", "-dSAFER", "-sDEVICE=pdfwrite", "-sOutputFile=" + destination] + \
+               list(sources)
+    return None
+
+
+def get_split_command(source: str, first: int, last: int, destination: str) -> List[str]:
+    """
+    :param source: str representing path to PDF to extract pages from
+    :param first: int representing first page to extract
+    :param last: int representing last page to extract
+    :param destination: str representing path to output PDF
+    :return: List[str] representing command extracting pages with qpdf or, failing that, ghostscript, or None if
+    neither is installed
+    """
+    if shutil.which("qpdf"):
+        return ["qpdf", "--empty", "--pages", source, "{}-{}".format(first, last), "--", destination]
+    if shutil.which("gs"):
+        return ["gs", "-q", "-dNOPAUSE", "-dBATCH", "-dSAFER", "-sDEVICE=pdfwrite", "-dFirstPage={}".format(first),
+                "-dLastPage={}".format(last), "-sOutputFile=" + destination, source]
+    return None
+
+
+def build_songbook(files: List[str], keys: Dict[str, str], directories: dict, account_info: dict,
+                   name: str="songbook", split: bool=False, workers: int=None, build_state: BuildState=None,
+                   song_cache: SongCache=None, ccli_cache: CCLICache=None) -> bool:
+    """
+    Generate the chordsheets of many songs as a single LaTeX songbook, each song starting on a new page, and compile it
+    with a single pdflatex run. The songbook can then be split into a PDF per chordsheet by the page range of each song.
+    :param files: List[str] representing paths to raw chordsheets, in order
+    :param keys: dict mapping song names to target keys, as for run_batch; a song in several keys appears once per key
+    :param directories: dict representing input and output directories
+    :param account_info: dict representing account info for CCLI
+    :param name: str representing name of songbook (its files are named after it)
+    :param split: bool representing whether to also split the songbook into a PDF per chordsheet
+    :param workers: int representing number of PDFs split at once (defaults to the number of CPUs)
+    :param build_state: BuildState used to skip stages whose inputs are unchanged, or None to run every stage
+    :param song_cache: SongCache used to reuse earlier parses, or None to always parse
+    :param ccli_cache: CCLICache used to reuse earlier CCLI lookups, or None to always look songs up
+    :return: True if the songbook (and every split PDF) was built, or False otherwise
+    """
+    with span("prefetch"):
+        prefetch_ccli(files, account_info, song_cache=song_cache, ccli_cache=ccli_cache)
+
+    # gather chordsheets, skipping songs which cannot be parsed
+    songs = []
+    success = True
+    for f in files:
+        song_name = os.path.basename(f).rpartition(".")[0]
+        try:
+            with span("parse", file=f):
+                header_info, song = parse_cached(f, song_cache)
+            new_key = keys.get(song_name, keys.get("*"))
+            for key in parse_keys(new_key) if new_key is not None else [song.get_key()]:
+                header_info = dict(header_info, key=key + " " + header_info["major_minor"])
+                with span("ccli", file=f):
+                    header_info = supplement_header(header_info, account_info, interactive=False,
+                                                    ccli_cache=ccli_cache)
+                songs.append((song_name, header_info, song, key))
+        except Exception as e:
+            p_warning("Skipping {}: {}: {}".format(f, type(e).__name__, e))
+            success = False
+    if len(songs) == 0:
+        return False
+
+    tex_file = get_songbook_destination(directories["output"]["chordsheets"], name)
+    with span("template", output="songbook"):
+        write_if_changed(tex_file, emit_document(generate_songbook_header(), emit_songbook(songs)))
+
+    # compile songbook; the page file records the first page of each song
+    pdf_file = get_pdf_destination(tex_file)
+    pages_file = tex_file.rpartition(".")[0] + ".pages"
+    stage = "pdf:" + tex_file
+    stage_fingerprint = fingerprint(files=[tex_file] + template_files())
+    formats = prepare_formats(build_state, names=["chordsheet"])
+    with JobScheduler(max_workers=workers) as scheduler:
+        if build_state is not None and build_state.is_up_to_date(stage, stage_fingerprint):
+            print(f"{pdf_file} is up to date.")
+        else:
+            args = ["pdflatex", "--interaction=nonstopmode"] + \
+                   ([f"-fmt={formats['chordsheet']}"] if formats["chordsheet"] is not None else []) + [tex_file]
+            with span("compile", file=tex_file):
+                job = scheduler.wait([scheduler.submit(f"pdflatex {os.path.basename(tex_file)}", args,
+                                                       on_complete=record_job(None, stage, stage_fingerprint, []))])[0]
+            report_jobs([job])
+            with span("clean", file=tex_file):
+                basename = os.path.basename(tex_file).rpartition(".")[0]
+                if job.succeeded():
+                    os.replace(basename + ".pdf", pdf_file)
+                    os.replace(basename + ".pages", pages_file)
+                outputs = {os.path.abspath(f) for f in [tex_file, pdf_file, pages_file]}
+                for leftover in os.listdir(os.getcwd()):  # auxiliary files
+                    if leftover.rpartition(".")[0] == basename and os.path.abspath(leftover) not in outputs:
+                        os.remove(leftover)
+            if not job.succeeded():
+                if build_state is not None:
+                    build_state.invalidate(stage)
+                return False
+            if build_state is not None:
+                build_state.update(stage, stage_fingerprint, [pdf_file, pages_file])
+
+        if not split:
+            return success
+
+        # split songbook into a PDF per chordsheet, as if each had been compiled alone
+        jobs = []
+        pdf_digest = file_digest(pdf_file)
+        for (song_name, _, _, key), (first, last) in zip(songs, read_songbook_pages(pages_file, len(songs))):
+            destination = get_pdf_destination(get_chordsheet_destination(directories["output"]["chordsheets"],
+                                                                         song_name, key))
+            split_stage = "split:" + destination
+            split_fingerprint = fingerprint(values=[pdf_digest, first, last])
+            if build_state is not None and build_state.is_up_to_date(split_stage, split_fingerprint):
+                continue
+            command = get_split_command(pdf_file, first, last, destination)
+            if command is None:
+                p_warning("Neither qpdf nor gs found. The songbook was not split.")
+                return False
+            jobs.append(scheduler.submit(f"split {os.path.basename(destination)}", command,
+                                         on_complete=record_job(build_state, split_stage, split_fingerprint,
+                                                                [destination])))
+        with span("split", file=pdf_file):
+            scheduler.wait(jobs)
+    report_jobs(jobs)
+    print("Split {} into {} PDFs ({} up to date).".format(pdf_file, len(jobs), len(songs) - len(jobs)))
+    return success and all(job.succeeded() for job in jobs)
+
+
+def load_setlist(filename: str) -> Tuple[str, List[Tuple[str, str]]]:
+    """
+    Read a setlist file: a JSON object of the form
+
+    {"name": "2026-10-18", "songs": [{"song": "Lion and the Lamb", "key": "B"}, {"song": "Amazing Grace"}]}
+
+    Songs are played in the order listed; a song without a key is played in the key of its raw chordsheet, and a song
+    may also be given as just its name. The name defaults to the filename of the setlist without extension.
+    :param filename: str representing path to setlist file
+    :return: Tuple[str, List[Tuple[str, str]]] representing name of setlist, and (song name, key or None) of each song
+    in order
+    """
+    with open(filename, "r") as f:
+        setlist = json.load(f)
+    if isinstance(setlist, list):
+        setlist = {"songs": setlist}
+    name = setlist.get("name", os.path.basename(filename).rpartition(".")[0] or filename)
+    entries = []
+    for entry in setlist["songs"]:
+        if isinstance(entry, str):
+            entry = {"song": entry}
+        entries.append((entry["song"], entry.get("key")))
+    return name, entries
+
+
+def get_slide_images(slides_path: str, root_filename: str) -> List[str]:
+    """
+    :param slides_path: str representing path to output directory for slides
+    :param root_filename: str representing root filename of song
+    :return: List[str] representing paths to the PNG of each slide of song, in order (empty if there are none)
+    """
+    directory = os.path.join(slides_path, root_filename)
+    if not os.path.isdir(directory):
+        return []
+    images = [f for f in os.listdir(directory) if f.endswith(".png")]
+    # convert numbers slides <root>-0.png, <root>-1.png, ..., or names a single slide <root>.png
+    return [os.path.join(directory, f) for f in
+            sorted(images, key=lambda f: int(re.sub("[^0-9]", "", f.rpartition("-")[2]) or 0))]
+
+
+def build_setlist(name: str, entries: List[Tuple[str, str]], directories: dict, account_info: dict,
+                  output_directory: str, workers: int=None, build_state: BuildState=None,
+                  song_cache: SongCache=None, ccli_cache: CCLICache=None) -> bool:
+    """
+    Assemble a setlist into one chordsheet PDF and one slides PDF, along with a directory of the slide PNGs of every
+    song in order. Songs are built as in a batch build, so PDFs and PNGs which are up to date are reused and only
+    missing songs or keys are compiled (in parallel); the PDFs are then concatenated page by page, without another
+    LaTeX pass.
+    :param name: str representing name of setlist (its files are named after it)
+    :param entries: List[Tuple[str, str]] representing (song name, key or None) of each song, in order
+    :param directories: dict representing input and output directories
+    :param account_info: dict representing account info for CCLI
+    :param output_directory: str representing path to directory in which to save the setlist
+    :param workers: int representing number of worker processes and concurrent jobs (defaults to the number of CPUs)
+    :param build_state: BuildState used to skip stages whose inputs are unchanged, or None to run every stage
+    :param song_cache: SongCache used to reuse earlier parses, or None to always parse
+    :param ccli_cache: CCLICache used to reuse earlier CCLI lookups, or None to always look songs up
+    :return: True if every song was built and the setlist assembled, or False otherwise
+    """
+    # resolve the key of every song, so each entry names exactly one chordsheet
+    files = []
+    keys = {}
+    resolved = []
+    for song_name, key in entries:
+        raw_file = os.path.join(directories["input"], song_name + ".txt")
+        if key is None:
+            try:
+                key = parse_cached(raw_file, song_cache)[1].get_key()
+            except Exception as e:
+                p_warning("Cannot read {}: {}: {}".format(raw_file, type(e).__name__, e))
+                return False
+        if raw_file not in files:
+            files.append(raw_file)
+        song_keys = keys.setdefault(song_name, [])
+        if key not in song_keys:
+            song_keys.append(key)
+        resolved.append((song_name, key))
+
+    # build songs, skipping every stage which is up to date
+    results = run_batch(files, {song_name: ",".join(song_keys) for song_name, song_keys in keys.items()},
+                        directories, account_info, workers, build_state=build_state, song_cache=song_cache,
+                        ccli_cache=ccli_cache)
+    if not all(success for success, _ in results.values()):
+        p_warning("Not every song was built, so the setlist was not assembled.")
+        return False
+
+    # concatenate PDFs
+    os.makedirs(output_directory, exist_ok=True)
+    merges = [
+        ([get_pdf_destination(get_chordsheet_destination(directories["output"]["chordsheets"], song_name, key))
+          for song_name, key in resolved], os.path.join(output_directory, name + " - chordsheets.pdf")),
+        ([get_pdf_destination(get_slides_destination(directories["output"]["slides"], song_name))
+          for song_name, _ in resolved], os.path.join(output_directory, name + " - slides.pdf")),
+    ]
+    jobs = []
+    assembled = True
+    with span("merge", file=name), JobScheduler(max_workers=workers) as scheduler:
+        for sources, destination in merges:
+            stage = "setlist:" + destination
+            stage_fingerprint = fingerprint(files=sources)
+            if build_state is not None and build_state.is_up_to_date(stage, stage_fingerprint):
+                print(f"{destination} is up to date.")
+                continue
+            command = get_merge_command(sources, destination)
+            if command is None:
+                p_warning("Neither qpdf nor gs found. The setlist PDFs were not assembled.")
+                assembled = False
+                break
+            jobs.append(scheduler.submit(f"merge {os.path.basename(destination)}", command,
+                                         on_complete=record_job(build_state, stage, stage_fingerprint, [destination])))
+
+        # collect slide images in order, linking rather than copying where possible
+        images_directory = os.path.join(output_directory, name + " - slides")
+        if os.path.isdir(images_directory):
+            shutil.rmtree(images_directory)
+        os.makedirs(images_directory)
+        for position, (song_name, _) in enumerate(resolved, start=1):
+            for slide, image in enumerate(get_slide_images(directories["output"]["slides"], song_name), start=1):
+                destination = os.path.join(images_directory, "{:02d} {} - {:02d}.png".format(position, song_name,
+                                                                                            slide))
+                try:
+                    os.link(image, destination)
+                except OSError:
+                    shutil.copyfile(image, destination)
+    report_jobs(jobs)
+    return assembled and all(job.succeeded() for job in jobs)
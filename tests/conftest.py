@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules of this project live in the root directory, which is not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
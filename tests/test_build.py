@@ -0,0 +1,114 @@
+"""
+Tests of incremental builds of a song, with a stand-in for pdflatex.
+"""
+
+import os
+import sys
+import shutil
+
+import pytest
+
+from build import BuildState
+from ccli import CCLICache
+from generate_music import GENERATOR_FILES, generate_song
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SONG = """<song> Stand In
+<ccli> 1234567
+<key> G Major
+<bpm> 72
+<signature> 4/4
+
+<order>
+Verse 1
+
+<Verse 1>
+[G]This is an [Em]example l[C]ine[D]
+"""
+
+# writes an empty PDF (or format, for -ini runs) named after the document, and records each document compiled
+PDFLATEX = """#!{python}
+import os, sys
+args = sys.argv[1:]
+if "-ini" in args:
+    directory = [a for a in args if a.startswith("-output-directory=")][0].partition("=")[2]
+    name = [a for a in args if a.startswith("-jobname=")][0].partition("=")[2]
+    open(os.path.join(directory, name + ".fmt"), "w").close()
+else:
+    open(os.path.basename(args[-1]).rpartition(".")[0] + ".pdf", "w").close()
+    with open({log!r}, "a") as f:
+        f.write(os.path.basename(args[-1]) + "\\n")
+"""
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    """
+    A library of one song in a working directory of its own, with pdflatex standing in on an otherwise empty PATH (so
+    no slides are rasterized).
+    """
+    bin_directory = tmp_path / "bin"
+    bin_directory.mkdir()
+    log = tmp_path / "pdflatex.log"
+    pdflatex = bin_directory / "pdflatex"
+    pdflatex.write_text(PDFLATEX.format(python=sys.executable, log=str(log)))
+    pdflatex.chmod(0o755)
+    monkeypatch.setenv("PATH", str(bin_directory))
+
+    work = tmp_path / "work"
+    for directory in ["raw", "chordsheets", "slides"]:
+        (work / directory).mkdir(parents=True)
+    shutil.copytree(os.path.join(ROOT, "latex_templates"), str(work / "latex_templates"))
+    (work / "raw" / "Stand In.txt").write_text(SONG)
+    monkeypatch.chdir(work)
+
+    directories = {"input": "raw", "output": {"chordsheets": "chordsheets", "slides": "slides"}}
+    ccli_cache = CCLICache(str(tmp_path / "ccli"))
+    build_state = BuildState()
+
+    def build() -> list:
+        """
+        :return: list representing documents compiled by the build
+        """
+        open(str(log), "w").close()
+        generate_song("Stand In.txt", "G", directories, {}, interactive=False, build_state=build_state,
+                      ccli_cache=ccli_cache)
+        with open(str(log), "r") as f:
+            return sorted(f.read().splitlines())
+
+    return build, work, ccli_cache
+
+
+def test_second_build_is_a_no_op(library):
+    build, _, _ = library
+    assert build() == ["Stand In - G.tex", "Stand In - slides.tex"]
+    assert build() == []
+
+
+def test_raw_file_change_rebuilds(library):
+    build, work, _ = library
+    build()
+    with open(str(work / "raw" / "Stand In.txt"), "a") as f:
+        f.write("[C]Another l[D]ine\n")
+    assert build() == ["Stand In - G.tex", "Stand In - slides.tex"]
+
+
+def test_template_change_rebuilds(library):
+    build, work, _ = library
+    build()
+    with open(str(work / "latex_templates" / "chordsheet.tex"), "a") as f:
+        f.write("% changed\n")
+    assert build() == ["Stand In - G.tex", "Stand In - slides.tex"]  # every document inputs every template
+
+
+def test_ccli_entry_change_rebuilds(library):
+    build, work, ccli_cache = library
+    build()
+    ccli_cache.put("1234567", {"composer": "Brooke Ligertwood", "year": 2006, "publisher": "Hillsong"})
+    assert build() == ["Stand In - G.tex", "Stand In - slides.tex"]
+    assert "Brooke Ligertwood" in (work / "chordsheets" / "Stand In - G.tex").read_text()
+    assert build() == []
+
+
+def test_generator_files_found_outside_script_directory(library):
+    assert all(os.path.isfile(f) for f in GENERATOR_FILES)
@@ -0,0 +1,123 @@
+"""
+Tests of CCLI lookups against a stand-in for the CCLI sign-in page and SongSelect.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from ccli import CCLICache, LoginError, prefetch
+from chordsheet_parser import DEFAULT_HEADER
+from generate_music import supplement_header
+
+PASSWORD = "correct horse"
+SESSION_COOKIE = "session=signed-in"
+EMPTY_CCLI = "1000"  # a song whose page has no metadata
+SONG_PAGE = ("<html>\r\n<ul class=\"authors\">\r\n"
+             "<a href=\"/authors/brooke-ligertwood\">Brooke Ligertwood</a>\r\n"
+             "</ul>\r\n<ul class=\"song-meta-list\">\r\n  <li>Copyrights</li>\r\n"
+             "  <li>2006 Hillsong Music Publishing Australia</li>\r\n</ul>\r\n</html>")
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Sign-in redirects to the home page and sets a session cookie only for the right password; otherwise the sign-in
+    page is shown again, with status 200 as CCLI does. Song pages redirect to sign-in without the cookie.
+    """
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8"))
+        if form.get("Password") == [PASSWORD]:
+            self.send_response(302)
+            self.send_header("Location", "/home")
+            self.send_header("Set-Cookie", SESSION_COOKIE + "; Path=/")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self.reply(200, "<form>Sign in</form>")
+
+    def do_GET(self):
+        if self.path.startswith("/signin"):
+            self.reply(200, "<form>Sign in</form>")
+        elif self.path == "/home":
+            self.reply(200, "Welcome")
+        elif SESSION_COOKIE not in (self.headers.get("Cookie") or ""):
+            self.send_response(302)
+            self.send_header("Location", "/signin?returnUrl=" + self.path)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        elif self.path.endswith("/" + EMPTY_CCLI):
+            self.reply(200, "<html>Song details are unavailable</html>")
+        else:
+            self.reply(200, SONG_PAGE)
+
+    def reply(self, status: int, body: str):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def ccli_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = "http://127.0.0.1:{}".format(server.server_address[1])
+    yield {"login_url": base + "/signin?returnUrl=%2fhome", "song_url": base + "/songs/{}"}
+    server.shutdown()
+    server.server_close()
+
+
+def get_header(ccli: str="4785835") -> dict:
+    header = dict(DEFAULT_HEADER)
+    header.update({"song": "Hosanna", "ccli": ccli})
+    return header
+
+
+def test_supplement_header_fills_and_caches_after_login(ccli_server, tmp_path):
+    ccli_cache = CCLICache(str(tmp_path))
+    header = supplement_header(get_header(), {"EmailAddress": "a@b.c", "Password": PASSWORD}, interactive=False,
+                               ccli_cache=ccli_cache, **ccli_server)
+    assert header["composer"] == "Brooke Ligertwood"
+    assert header["year"] == 2006
+    assert ccli_cache.get("4785835")["publisher"] == "Hillsong Music Publishing Australia"
+
+
+def test_supplement_header_does_not_cache_after_failed_login(ccli_server, tmp_path):
+    ccli_cache = CCLICache(str(tmp_path))
+    header = supplement_header(get_header(), {"EmailAddress": "a@b.c", "Password": "wrong"}, interactive=False,
+                               ccli_cache=ccli_cache, **ccli_server)
+    assert header == get_header()
+    assert ccli_cache.get("4785835") is None
+
+
+def test_supplement_header_caches_empty_page_as_negative_entry(ccli_server, tmp_path):
+    ccli_cache = CCLICache(str(tmp_path))
+    header = supplement_header(get_header(EMPTY_CCLI), {"EmailAddress": "a@b.c", "Password": PASSWORD},
+                               interactive=False, ccli_cache=ccli_cache, **ccli_server)
+    assert header == get_header(EMPTY_CCLI)
+    assert ccli_cache.get(EMPTY_CCLI) == {"composer": None, "year": None, "publisher": None}  # negative entry
+
+
+def test_prefetch_caches_after_login(ccli_server, tmp_path):
+    ccli_cache = CCLICache(str(tmp_path))
+    results = prefetch(["4785835", EMPTY_CCLI], {"EmailAddress": "a@b.c", "Password": PASSWORD}, ccli_cache,
+                       requests_per_second=0, **ccli_server)
+    assert results["4785835"]["composer"] == "Brooke Ligertwood"
+    assert ccli_cache.get("4785835")["year"] == 2006
+    assert ccli_cache.get(EMPTY_CCLI) == {"composer": None, "year": None, "publisher": None}  # negative entry
+
+
+def test_prefetch_raises_and_caches_nothing_after_failed_login(ccli_server, tmp_path):
+    ccli_cache = CCLICache(str(tmp_path))
+    with pytest.raises(LoginError):
+        prefetch(["4785835", EMPTY_CCLI], {"EmailAddress": "a@b.c", "Password": "wrong"}, ccli_cache,
+                 requests_per_second=0, **ccli_server)
+    assert ccli_cache.get("4785835") is None
+    assert ccli_cache.get(EMPTY_CCLI) is None
@@ -0,0 +1,17 @@
+"""
+Tests of near-duplicate detection on the library of raw chordsheets.
+"""
+
+import os
+import glob
+
+from dedup import find_duplicates
+
+LIBRARY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chordsheets_raw")
+
+
+def test_song_within_medley_is_reported():
+    duplicates, _ = find_duplicates(sorted(glob.glob(os.path.join(LIBRARY, "*.txt"))))
+    pairs = {frozenset(os.path.basename(path) for path in [duplicate["first"], duplicate["second"]])
+             for duplicate in duplicates}
+    assert frozenset(["Hosanna.txt", "Jesus We Love You - Hosanna.txt"]) in pairs
@@ -0,0 +1,46 @@
+"""
+Tests of incremental updates of the search index.
+"""
+
+import os
+import glob
+import shutil
+
+from search_index import SearchIndex
+
+LIBRARY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "chordsheets_raw")
+SONGS = ["Amazing Grace.txt", "Hosanna.txt"]
+
+
+def get_paths(index: SearchIndex, query: str) -> set:
+    return {result["path"] for result in index.search(query)}
+
+
+def test_update_of_subset_keeps_rest_of_library(tmp_path):
+    for song in SONGS:
+        shutil.copy(os.path.join(LIBRARY, song), str(tmp_path))
+    library = os.path.join(str(tmp_path), "*.txt")
+    grace, hosanna = [os.path.join(str(tmp_path), song) for song in SONGS]
+    with SearchIndex(os.path.join(str(tmp_path), "index.sqlite")) as index:
+        assert index.update(sorted(glob.glob(library)), pattern=library) == (2, 0)
+        assert index.update([hosanna], pattern=hosanna) == (0, 0)
+        assert get_paths(index, "title:grace") == {grace}
+
+        os.remove(hosanna)
+        assert index.update([], pattern=hosanna) == (0, 1)
+        assert get_paths(index, "title:hosanna") == set()
+        assert get_paths(index, "title:grace") == {grace}
+
+
+def test_clear_of_subset_keeps_rest_of_library(tmp_path):
+    for song in SONGS:
+        shutil.copy(os.path.join(LIBRARY, song), str(tmp_path))
+    library = os.path.join(str(tmp_path), "*.txt")
+    grace, hosanna = [os.path.join(str(tmp_path), song) for song in SONGS]
+    with SearchIndex(os.path.join(str(tmp_path), "index.sqlite")) as index:
+        index.update(sorted(glob.glob(library)), pattern=library)
+        index.clear(hosanna)
+        assert get_paths(index, "title:hosanna") == set()
+        assert index.update([hosanna], pattern=hosanna) == (1, 0)
+        assert get_paths(index, "title:grace") == {grace}
+        assert get_paths(index, "title:hosanna") == {hosanna}
@@ -0,0 +1,16 @@
+"""
+Tests of the startup of generate_music, measured with -X importtime. The time budget itself is checked by benchmark.py
+--startup-budget, since a single import is too noisy to time in a test.
+"""
+
+import os
+
+from benchmark import LAZY_MODULES, measure_startup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_no_lazy_module_imported_at_startup(monkeypatch):
+    monkeypatch.chdir(ROOT)  # generate_music is imported by a fresh interpreter from the working directory
+    _, modules = measure_startup()
+    assert [module for module in LAZY_MODULES if module in modules] == []
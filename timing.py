@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""
+file: timing.py
+
+Lightweight timing of the stages of the pipeline. Each stage is recorded as a span with a name, start time, duration,
+and any attributes (e.g. the file being processed), which can be written out as JSON. Optionally, the Python stages can
+also be profiled with cProfile.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import List, TextIO
+
+PROFILE_FILE = "generate_music.prof"
+PROFILE_REPORT_LINES = 25  # functions listed in the profile summary
+
+
+class Tracer:
+    """
+    Class representing a collection of timed spans, recorded from any thread. Spans recorded in other processes can be
+    added with extend.
+    """
+    def __init__(self):
+        self.spans = []
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """
+        Time the body of a with statement as a span.
+        :param name: str representing name of stage
+        :param attributes: values describing the span (must be JSON serializable)
+        """
+        start = time.time()
+        start_counter = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter() - start_counter, **attributes)
+
+    def add(self, name: str, start: float, duration: float, **attributes):
+        """
+        Record a span timed elsewhere (e.g. a subprocess).
+        :param name: str representing name of stage
+        :param start: float representing start of span, in seconds since the epoch
+        :param duration: float representing duration of span in seconds
+        :param attributes: values describing the span (must be JSON serializable)
+        """
+        span = {"name": name, "start": start, "duration_ms": duration * 1000, "pid": os.getpid()}
+        span.update(attributes)
+        with self.__lock:
+            self.spans.append(span)
+
+    def extend(self, spans: List[dict]):
+        """
+        :param spans: List[dict] representing spans recorded by another Tracer (e.g. in a worker process)
+        """
+        with self.__lock:
+            self.spans.extend(spans)
+
+    def take(self) -> List[dict]:
+        """
+        :return: List[dict] representing spans recorded so far, which are then forgotten
+        """
+        with self.__lock:
+            spans, self.spans = self.spans, []
+        return spans
+
+    def write(self, stream: TextIO=sys.stderr):
+        """
+        Write spans as JSON, one object per line, in order of start time.
+        :param stream: writable text stream
+        """
+        with self.__lock:
+            spans = sorted(self.spans, key=lambda s: s["start"])
+        for span in spans:
+            stream.write(json.dumps(span, sort_keys=True) + "\n")
+
+
+TRACER = Tracer()
+
+
+def span(name: str, **attributes):
+    """
+    Time the body of a with statement as a span of the global tracer.
+    :param name: str representing name of stage
+    :param attributes: values describing the span (must be JSON serializable)
+    """
+    return TRACER.span(name, **attributes)
+
+
+def write_profile(profiler: "cProfile.Profile", filename: str=PROFILE_FILE, extra_files: List[str]=(),
+                  stream: TextIO=sys.stdout):
+    """
+    Save profile statistics, merged with any saved by other processes, and print a summary of them along with the
+    wall-clock time of the subprocess stages recorded by the global tracer.
+    :param profiler: cProfile.Profile representing profile of this process
+    :param filename: str representing path to which statistics are saved (readable with python -m pstats)
+    :param extra_files: List[str] representing paths to statistics saved by other processes, merged in and removed
+    :param stream: writable text stream for the summary
+    """
+    import pstats
+
+    profiler.create_stats()
+    stats = pstats.Stats(profiler, stream=stream)
+    for f in extra_files:
+        stats.add(f)
+        os.remove(f)
+    stats.dump_stats(filename)
+    stats.files = []  # do not list every merged file in the summary
+
+    print("-------", file=stream)
+    print("Python profile (saved to {}):".format(filename), file=stream)
+    stats.sort_stats("cumulative").print_stats(PROFILE_REPORT_LINES)
+
+    subprocesses = [s for s in TRACER.spans if s.get("kind") == "subprocess"]
+    if len(subprocesses) > 0:
+        print("Subprocess wall-clock times:", file=stream)
+        for s in sorted(subprocesses, key=lambda s: s["start"]):
+            print("{:>10.1f} ms  {}".format(s["duration_ms"], s["job"]), file=stream)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+"""
+file: watcher.py
+
+Watching directories for changed files. On Linux, changes are reported by inotify (through libc, so no extra packages
+are needed); elsewhere, or if inotify is unavailable, the directories are polled for changes in modification time and
+size. Bursts of changes (e.g. an editor saving through a temporary file) are debounced into a single set of paths.
+"""
+
+import os
+import time
+import errno
+import select
+import struct
+from abc import ABC, abstractmethod
+from typing import Dict, List, Set, Tuple
+
+DEFAULT_POLL_INTERVAL = 0.5  # seconds between scans when polling
+DEFAULT_DEBOUNCE = 0.3  # seconds without further changes after which a burst of changes is over
+
+# inotify constants, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct("iIII")  # watch descriptor, mask, cookie, length of name
+INOTIFY_BUFFER_SIZE = 64 * 1024
+
+
+class Watcher(ABC):
+    """
+    Abstract class representing a watch over the files directly inside some directories.
+    """
+    def __init__(self, directories: List[str]):
+        """
+        :param directories: List[str] representing paths to directories to watch
+        """
+        self.directories = [os.path.abspath(d) for d in directories]
+
+    @abstractmethod
+    def poll(self, timeout: float=None) -> Set[str]:
+        """
+        Wait for files to change.
+        :param timeout: float representing maximum number of seconds to wait, or None to wait until a file changes
+        :return: Set[str] representing absolute paths to files changed (created, modified or removed), or an empty set
+        if none changed before the timeout
+        """
+        pass
+
+    def wait(self, debounce: float=DEFAULT_DEBOUNCE) -> Set[str]:
+        """
+        Wait for a burst of changes to end.
+        :param debounce: float representing number of seconds without further changes after which the burst is over
+        :return: Set[str] representing absolute paths to files changed during the burst
+        """
+        changed = set()
+        while len(changed) == 0:
+            changed = self.poll()
+        while True:
+            more = self.poll(debounce)
+            if len(more) == 0:
+                return changed
+            changed |= more
+
+    def close(self):
+        """
+        Stop watching.
+        """
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class PollingWatcher(Watcher):
+    """
+    Class representing a watch which scans directories for changes in the modification time and size of their files.
+    """
+    def __init__(self, directories: List[str], interval: float=DEFAULT_POLL_INTERVAL):
+        """
+        :param directories: List[str] representing paths to directories to watch
+        :param interval: float representing number of seconds between scans
+        """
+        super().__init__(directories)
+        self.interval = interval
+        self.__snapshot = self.__scan()
+
+    def poll(self, timeout: float=None) -> Set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self.__scan()
+            changed = {path for path in snapshot.keys() | self.__snapshot.keys()
+                       if snapshot.get(path) != self.__snapshot.get(path)}
+            self.__snapshot = snapshot
+            if len(changed) > 0:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(self.interval if deadline is None else max(0.0, min(self.interval,
+                                                                           deadline - time.monotonic())))
+
+    def __scan(self) -> Dict[str, Tuple[int, int]]:
+        """
+        :return: dict mapping absolute path of each file in the watched directories to its modification time and size
+        """
+        snapshot = {}
+        for directory in self.directories:
+            try:
+                entries = os.scandir(directory)
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                    except FileNotFoundError:  # removed while scanning
+                        pass
+        return snapshot
+
+
+class InotifyWatcher(Watcher):
+    """
+    Class representing a watch through Linux inotify, which reports changes as they happen without scanning.
+    """
+    def __init__(self, directories: List[str]):
+        """
+        :param directories: List[str] representing paths to directories to watch
+        :raises OSError: if inotify is not available
+        """
+        super().__init__(directories)
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.__fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.__watches = {}  # watch descriptor to directory
+        try:
+            for directory in self.directories:
+                wd = libc.inotify_add_watch(self.__fd, os.fsencode(directory), INOTIFY_MASK)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), "cannot watch " + directory)
+                self.__watches[wd] = directory
+        except OSError:
+            os.close(self.__fd)
+            raise
+
+    def poll(self, timeout: float=None) -> Set[str]:
+        readable, _, _ = select.select([self.__fd], [], [], timeout)
+        if len(readable) == 0:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.__fd, INOTIFY_BUFFER_SIZE)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+                name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+                offset += INOTIFY_EVENT.size + length
+                if mask & IN_Q_OVERFLOW:  # events were lost; report every directory as changed
+                    changed.update(self.directories)
+                elif wd in self.__watches and len(name) > 0:
+                    changed.add(os.path.join(self.__watches[wd], os.fsdecode(name)))
+
+    def close(self):
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+
+
+def open_watcher(directories: List[str], polling: bool=False, interval: float=DEFAULT_POLL_INTERVAL) -> Watcher:
+    """
+    :param directories: List[str] representing paths to directories to watch
+    :param polling: bool representing whether to poll even if inotify is available
+    :param interval: float representing number of seconds between scans when polling
+    :return: Watcher using inotify if available (and polling is not requested), or polling otherwise
+    """
+    if not polling:
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directories, interval)